@@ -0,0 +1,92 @@
+import json
+from bisect import bisect_right
+from functools import lru_cache
+
+
+class AgeBandError(ValueError):
+    """年齢別用量のJSONが解釈できないときの例外"""
+
+
+class AgeBandTable:
+    """年齢帯 (月齢の閉区間) ごとの用量を、開始月齢でソートした区間表として保持する。
+
+    重なっている年齢帯は、元のJSONで先に書かれた帯を優先して重ならない区間に分割する
+    (以前の辞書の先頭から順に探す実装と同じ結果になる)。
+    """
+
+    __slots__ = ('starts', 'ends', 'doses', 'overlaps', 'gaps')
+
+    def __init__(self, segments, overlaps, gaps):
+        self.starts = [start for start, _, _ in segments]
+        self.ends = [end for _, end, _ in segments]
+        self.doses = [dose for _, _, dose in segments]
+        self.overlaps = overlaps
+        self.gaps = gaps
+
+    def lookup(self, age_months):
+        """月齢に該当する用量を返す。該当する年齢帯がなければ None"""
+        i = bisect_right(self.starts, age_months) - 1
+        if i >= 0 and age_months <= self.ends[i]:
+            return self.doses[i]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def _parse_band_key(age_range_str):
+    try:
+        min_age, max_age = map(int, age_range_str.split('-'))
+    except ValueError:
+        raise AgeBandError(f"年齢帯 '{age_range_str}' は '最小月齢-最大月齢' の形式ではありません。")
+    if min_age > max_age:
+        raise AgeBandError(f"年齢帯 '{age_range_str}' の最小月齢が最大月齢より大きくなっています。")
+    return min_age, max_age
+
+
+@lru_cache(maxsize=4096)
+def compile_age_bands(age_doses_json):
+    """{"min_age-max_age": dose} 形式のJSON文字列を AgeBandTable に変換する。
+
+    同じ文字列に対しては一度だけ解析し、結果を使い回す。
+    """
+    try:
+        age_doses = json.loads(age_doses_json)
+    except json.JSONDecodeError:
+        raise AgeBandError("年齢別用量データが不正なJSON形式です。")
+    if not isinstance(age_doses, dict):
+        raise AgeBandError("年齢別用量データは {\"最小月齢-最大月齢\": 用量} の形式で指定してください。")
+
+    segments = []
+    overlaps = []
+    for age_range_str, dose in age_doses.items():
+        min_age, max_age = _parse_band_key(age_range_str)
+        # 既に登録した年齢帯と重ならない部分だけを追加する
+        pieces = [(min_age, max_age)]
+        for seg_start, seg_end, _ in segments:
+            remaining = []
+            for start, end in pieces:
+                if end < seg_start or start > seg_end:
+                    remaining.append((start, end))
+                    continue
+                overlaps.append((age_range_str, max(start, seg_start), min(end, seg_end)))
+                if start < seg_start:
+                    remaining.append((start, seg_start - 1))
+                if end > seg_end:
+                    remaining.append((seg_end + 1, end))
+            pieces = remaining
+        segments.extend((start, end, dose) for start, end in pieces)
+    segments.sort()
+
+    gaps = [
+        (prev_end + 1, next_start - 1)
+        for (_, prev_end, _), (next_start, _, _) in zip(segments, segments[1:])
+        if next_start > prev_end + 1
+    ]
+
+    for age_range_str, start, end in overlaps:
+        print(f"警告: 年齢帯 '{age_range_str}' が他の年齢帯と {start}-{end}ヶ月 で重なっています。先に定義された用量を使用します。")
+    for start, end in gaps:
+        print(f"警告: 年齢別用量に {start}-{end}ヶ月 の空白があります。")
+
+    return AgeBandTable(segments, overlaps, gaps)
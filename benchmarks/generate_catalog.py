@@ -0,0 +1,208 @@
+"""規模の検証用に、実際のカタログと同じ列の意味を持つ架空の薬カタログを生成する。
+
+    python benchmarks/generate_catalog.py --rows 100000 --seed 1 --output catalog_100k.csv
+    python benchmarks/generate_catalog.py --rows 100000 --seed 1 --load [--replace]
+
+drugs_data.csv と同じ列で、体重 (kg)・年齢 (age)・固定 (fixed) の用量、daily_dose_age_specific の
+年齢帯 JSON、含量付きのカタカナの薬名、カンマ区切りの daily_frequency / timing_options を持つ行を作る。
+同じ seed からは常に同じカタログができる。--output の CSV は benchmarks/run.py --csv や
+import_drugs_from_csv.py にそのまま渡せる。--load は現在の DATABASE_URL (未設定なら ./drug_data.db) の
+DB に直接取り込む。
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# drugs_data.csv と同じ列の並び
+CSV_COLUMNS = [
+    'drug_name', 'aliases', 'type', 'dosage_unit', 'dose_per_kg', 'min_age_months', 'max_age_months',
+    'dose_age_specific', 'fixed_dose', 'daily_frequency', 'notes', 'usage_type', 'timing_options',
+    'formulation_type', 'calculated_dose_unit', 'daily_dose_per_kg', 'daily_fixed_dose',
+    'daily_dose_age_specific', 'max_daily_fixed_dose',
+]
+
+# 薬名・一般名を組み立てるカタカナの音
+SYLLABLES = [
+    'ア', 'イ', 'ウ', 'エ', 'オ', 'カ', 'キ', 'ク', 'ケ', 'コ', 'サ', 'シ', 'ス', 'セ', 'ソ', 'タ', 'チ', 'ツ', 'テ', 'ト',
+    'ナ', 'ニ', 'ヌ', 'ネ', 'ノ', 'ハ', 'ヒ', 'フ', 'ヘ', 'ホ', 'マ', 'ミ', 'ム', 'メ', 'モ', 'ラ', 'リ', 'ル', 'レ', 'ロ',
+    'ザ', 'ジ', 'ズ', 'ゼ', 'ゾ', 'ダ', 'デ', 'ド', 'バ', 'ビ', 'ブ', 'ベ', 'ボ', 'パ', 'ピ', 'プ', 'ペ', 'ポ',
+    'ロン', 'リン', 'ミン', 'シン', 'ゾール', 'マイ', 'セフ', 'フェン', 'チル', 'ナール', 'クス', 'ック',
+]
+GENERIC_SUFFIXES = ['', '塩酸塩', '水和物', 'ナトリウム', 'カリウム', 'リン酸塩', 'ピボキシル', 'トシル酸塩']
+MAKERS = ['サワイ', 'トーワ', 'タカタ', '日医工', 'ニプロ', 'JG', 'EE', 'NP', 'DSEP', 'TCK']
+TYPES = [
+    '解熱鎮痛薬', '抗菌薬（ペニシリン系）', '抗菌薬（マクロライド系）', '抗菌薬（第3世代セフェム系経口）',
+    '鎮咳薬', '去痰薬', '気管支拡張薬', '抗アレルギー薬（第2世代抗ヒスタミン薬）',
+    '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', '整腸剤', '便秘症改善薬', '抗ウイルス薬', '消化器官用薬', 'その他',
+]
+NOTES = [
+    '', '', '', '症状により適宜増減', '添付文書に小児の記載なし', '食後に服用', '苦味があるため服薬補助ゼリーの使用を検討',
+    '腎機能障害時は減量を検討', '発疹・下痢などの副作用に注意',
+]
+
+# 剤形ごとの (計算結果の単位, 含量の表記の候補, kg あたりの1日量の範囲)
+ORAL_FORMULATIONS = {
+    '細粒': ('g', ['10%', '20%', '50%', '100mg/g', '200mg/g'], (0.03, 0.3)),
+    'ドライシロップ': ('g', ['1%', '2%', '5%', '10%', '50%'], (0.02, 0.3)),
+    'シロップ': ('ml', ['0.05%', '0.5%', '2%', '5%', '5μg/ml'], (0.1, 3.0)),
+    '顆粒': ('g', ['0.5%', '10%', '40%'], (0.02, 0.2)),
+    '散': ('g', ['10%', '20%', '1%'], (0.05, 0.3)),
+}
+FIXED_FORMULATIONS = {
+    # 剤形: (単位, 含量, usage_type, 1日量の候補)
+    # CSV には頓服の1回量のカラムがないため、実データと同じく坐剤も内服として1日量で持つ
+    'テープ': ('枚', ['0.5mg', '1mg', '2mg'], '貼', [1]),
+    '錠': ('錠', ['5mg', '10mg', '60mg'], '内服', [1, 2]),
+    '坐剤': ('個', ['50mg', '100mg', '200mg'], '内服', [1, 2]),
+    '吸入': ('回', ['10μg吸入100回'], '吸入', [2, 4]),
+}
+FREQUENCY_TIMINGS = {
+    '1': ['眠前', '朝食後', '食後'],
+    '2': ['朝夕食後', '朝眠前'],
+    '3': ['毎食後', '朝昼夕食後'],
+    '4': ['毎食後眠前'],
+    '2,3': ['朝夕食後,毎食後'],
+    '2,3,4': ['朝夕食後,毎食後,毎食後眠前'],
+    '1,2': ['眠前,朝食後眠前'],
+}
+FREQUENCIES = list(FREQUENCY_TIMINGS)
+FREQUENCY_WEIGHTS = [9, 9, 17, 3, 5, 2, 2]
+
+
+def _stem(rng, min_syllables=2, max_syllables=5):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables)))
+
+
+def _round(value, digits=3):
+    return float(f"{value:.{digits}g}")
+
+
+def _age_bands(rng, min_age, max_age):
+    """min_age〜max_age (月齢) を連続した 2〜4 個の年齢帯に分け、年齢とともに増える用量を付ける"""
+    band_count = rng.randint(2, 4)
+    cuts = sorted(rng.sample(range(min_age + 6, max_age - 6, 6), band_count - 1))
+    starts = [min_age] + [cut + 1 for cut in cuts]
+    ends = cuts + [max_age]
+    dose = rng.choice([0.25, 0.5, 1.0, 2.0])
+    bands = {}
+    for start, end in zip(starts, ends):
+        bands[f"{start}-{end}"] = dose
+        dose = _round(dose * rng.choice([1.5, 2.0, 2.5]))
+    return bands
+
+
+def _oral_row(rng, dosage_unit):
+    formulation = rng.choice(list(ORAL_FORMULATIONS))
+    unit, strengths, (low, high) = ORAL_FORMULATIONS[formulation]
+    strength = rng.choice(strengths)
+    row = {
+        'formulation_type': formulation,
+        'calculated_dose_unit': unit,
+        'usage_type': rng.choices(['内服', '内服,頓服'], weights=[13, 1])[0],
+        'strength': strength,
+    }
+    frequency = rng.choices(FREQUENCIES, weights=FREQUENCY_WEIGHTS)[0]
+    row['daily_frequency'] = frequency
+    row['timing_options'] = rng.choice(FREQUENCY_TIMINGS[frequency])
+    if dosage_unit == 'kg':
+        per_kg = _round(rng.uniform(low, high))
+        row['daily_dose_per_kg'] = per_kg
+        row['max_daily_fixed_dose'] = _round(per_kg * rng.choice([20, 30, 40, 50]))
+        if rng.random() < 0.2:
+            row['min_age_months'] = rng.choice([0, 6, 12, 24, 36])
+    else:
+        min_age = rng.choice([0, 6, 12, 24])
+        max_age = rng.choice([83, 143, 191, 999])
+        bands = _age_bands(rng, min_age, min(max_age, 191))
+        if max_age == 999:
+            # 最後の年齢帯を上限なし (999ヶ月) まで伸ばす
+            last_key = list(bands)[-1]
+            bands[f"{last_key.split('-')[0]}-999"] = bands.pop(last_key)
+        row['daily_dose_age_specific'] = json.dumps(bands, separators=(',', ':'))
+        row['min_age_months'] = min_age
+        row['max_age_months'] = max_age
+    return row
+
+
+def _fixed_row(rng):
+    formulation = rng.choice(list(FIXED_FORMULATIONS))
+    unit, strengths, usage_type, doses = FIXED_FORMULATIONS[formulation]
+    daily_dose = rng.choice(doses)
+    return {
+        'formulation_type': formulation,
+        'calculated_dose_unit': unit,
+        'usage_type': usage_type,
+        'strength': rng.choice(strengths),
+        'daily_fixed_dose': daily_dose,
+        'max_daily_fixed_dose': daily_dose * rng.choice([1, 2]),
+        'daily_frequency': '1' if daily_dose == 1 else '2',
+        'timing_options': '眠前' if daily_dose == 1 else '朝夕食後',
+        'min_age_months': rng.choice([None, 6, 12, 72]),
+    }
+
+
+def generate_catalog(row_count, seed=0):
+    """row_count 件の薬の辞書を順に返すジェネレーター (同じ seed なら同じ内容)"""
+    rng = random.Random(seed)
+    used_names = set()
+    for _ in range(row_count):
+        dosage_unit = rng.choices(['kg', 'age', 'fixed'], weights=[60, 25, 15])[0]
+        row = _fixed_row(rng) if dosage_unit == 'fixed' else _oral_row(rng, dosage_unit)
+        strength = row.pop('strength')
+        formulation = row['formulation_type']
+        # 吸入薬は「〜吸入100回」のように含量の表記に剤形が含まれる
+        label = '' if formulation == '吸入' else formulation
+        brand = _stem(rng)
+        drug_name = f"{brand}{label}{strength}"
+        # 同名の薬がある場合は、実際の後発品と同じくメーカー名を付けて区別する
+        while drug_name in used_names:
+            drug_name = f"{brand}{label}{strength}「{rng.choice(MAKERS)}{rng.randint(1, 999)}」"
+        used_names.add(drug_name)
+
+        generic = _stem(rng, 3, 7) + rng.choice(GENERIC_SUFFIXES)
+        # 一般名の含量は全角の ％ や空白入りの mg で書かれていることも多い
+        generic_strength = strength.replace('%', rng.choice(['%', '％'])).replace('mg', rng.choice(['mg', ' mg']))
+        row.update({
+            'drug_name': drug_name,
+            'aliases': f"{generic}{label}{generic_strength}",
+            'type': rng.choice(TYPES),
+            'dosage_unit': dosage_unit,
+            'notes': rng.choice(NOTES),
+        })
+        yield {column: ('' if row.get(column) is None else row.get(column)) for column in CSV_COLUMNS}
+
+
+def write_csv(rows, output):
+    if output == '-':
+        writer = csv.DictWriter(sys.stdout, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="規模の検証用の架空の薬カタログを生成する")
+    parser.add_argument('--rows', type=int, default=10000, help="生成する薬の件数")
+    parser.add_argument('--seed', type=int, default=0, help="乱数の種 (同じ値なら同じカタログになる)")
+    parser.add_argument('--output', help="書き出すCSVファイル ('-' で標準出力)")
+    parser.add_argument('--load', action='store_true', help="CSV を作らずに DB に直接取り込む")
+    parser.add_argument('--replace', action='store_true', help="--load で既存の薬を全て削除してから取り込む")
+    args = parser.parse_args()
+
+    rows = generate_catalog(args.rows, args.seed)
+    if args.load:
+        import import_drugs_from_csv
+        import_drugs_from_csv.bulk_import_drugs(rows, replace=args.replace)
+    elif args.output:
+        write_csv(rows, args.output)
+    else:
+        parser.error("--output または --load を指定してください。")
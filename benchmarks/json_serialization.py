@@ -0,0 +1,96 @@
+"""大きなレスポンスの JSON 変換時間と転送サイズを、変更前 (Flask 標準) と変更後で比べる。
+
+    python benchmarks/json_serialization.py [--rows 5000] [--json]
+
+drugs_data.csv の行を rows 件まで複製し、/search_all_drug_data (薬名と id の一覧) と
+/drugs/<id> (全カラム) と同じ形のデータを作って計測する。
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import compression  # noqa: E402
+import json_provider  # noqa: E402
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'drugs_data.csv')
+
+
+def build_payloads(row_count):
+    with open(CSV_FILE, newline='', encoding='utf-8-sig') as f:
+        source_rows = list(csv.DictReader(f))
+    drugs = []
+    for i in range(row_count):
+        row = dict(source_rows[i % len(source_rows)])
+        row['id'] = i + 1
+        row['drug_name'] = f"{row['drug_name']} ({i})"
+        drugs.append(row)
+    return {
+        'search_all_drug_data': [{"id": row['id'], "drug_name": row['drug_name']} for row in drugs],
+        'drugs_by_id': drugs,
+    }
+
+
+def flask_default_dumps(obj):
+    # Flask の DefaultJSONProvider の既定 (ensure_ascii=True, sort_keys=True, 区切りの空白なし)
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def best_seconds(func, repeat=5):
+    number = 1
+    while timeit.timeit(func, number=number) < 0.2:
+        number *= 2
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def run(row_count):
+    results = []
+    for name, payload in build_payloads(row_count).items():
+        before = flask_default_dumps(payload)
+        after = json_provider.dumps_bytes(payload)
+        result = {
+            'endpoint': name,
+            'rows': row_count,
+            'serializer': 'orjson' if json_provider.orjson is not None else 'json',
+            'before_ms': best_seconds(lambda: flask_default_dumps(payload)) * 1000,
+            'after_ms': best_seconds(lambda: json_provider.dumps_bytes(payload)) * 1000,
+            'before_bytes': len(before),
+            'after_bytes': len(after),
+            'gzip_bytes': len(gzip.compress(after, compresslevel=compression.COMPRESS_GZIP_LEVEL)),
+            'gzip_ms': best_seconds(lambda: gzip.compress(after, compresslevel=compression.COMPRESS_GZIP_LEVEL)) * 1000,
+        }
+        if compression.brotli is not None:
+            result['br_bytes'] = len(compression.brotli.compress(after, quality=compression.COMPRESS_BROTLI_QUALITY))
+            result['br_ms'] = best_seconds(
+                lambda: compression.brotli.compress(after, quality=compression.COMPRESS_BROTLI_QUALITY)) * 1000
+        results.append(result)
+    return results
+
+
+def print_table(results):
+    for result in results:
+        print(f"{result['endpoint']} ({result['rows']} 件, {result['serializer']})")
+        print(f"  変換時間: {result['before_ms']:.2f} ms → {result['after_ms']:.2f} ms "
+              f"({result['before_ms'] / result['after_ms']:.1f} 倍速)")
+        print(f"  サイズ:   {result['before_bytes']:,} B → {result['after_bytes']:,} B (UTF-8)"
+              f" → gzip {result['gzip_bytes']:,} B ({result['gzip_ms']:.2f} ms)", end='')
+        if 'br_bytes' in result:
+            print(f" / br {result['br_bytes']:,} B ({result['br_ms']:.2f} ms)", end='')
+        print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="JSON 変換と圧縮のベンチマーク")
+    parser.add_argument('--rows', type=int, default=5000, help="データの件数")
+    parser.add_argument('--json', action='store_true', help="結果を JSON で出力する")
+    args = parser.parse_args()
+    results = run(args.rows)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print_table(results)
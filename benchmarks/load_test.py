@@ -0,0 +1,365 @@
+"""外来の朝の混雑を想定した負荷試験。gunicorn で起動したアプリに、実際の利用に近い要求を一定のレートで送る。
+
+    python benchmarks/load_test.py [--rate 50] [--duration 60] [--concurrency 16] [--workers 2]
+                                   [--csv drugs_data.csv] [--mix autocomplete=60,calculate_dosage=25,...]
+                                   [--slo calculate_dosage:p99=300] [--output result.json]
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 [--allow-writes] ...
+
+--url を指定しない場合は、一時ディレクトリに SQLite のDBを作ってカタログを取り込み、
+gunicorn (web_app:app, gunicorn.conf.py の設定) をローカルで起動して計測し、終了後に停止する。
+--url で既存のサーバーを対象にする場合、薬の更新 (PUT) は --allow-writes を指定したときだけ送る。
+
+要求はレート (--rate 件/秒) に従って指数分布の間隔で予定を立て (同じ --seed なら同じ順序)、
+--concurrency 個のスレッドで送る。レイテンシは予定時刻から応答までを測るため、サーバーが
+詰まって送信が遅れた時間も含まれる。エンドポイントごとの p50/p95/p99・エラー率と全体の
+スループットを出力し、SLO を満たさない項目があれば終了コード 1 を返す。
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_CSV_FILE = os.path.join(REPO_DIR, 'drugs_data.csv')
+
+# 要求の種類ごとの割合 (検索欄の入力が大半で、用量計算が続き、管理画面の更新はまれ)
+DEFAULT_MIX = {
+    'autocomplete': 60,
+    'search': 8,
+    'calculate_dosage': 25,
+    'drug_detail': 5,
+    'update_drug': 2,
+}
+
+# 要求の種類ごとの SLO (ミリ秒)。エラー率は --max-error-rate で共通に指定する
+DEFAULT_SLOS = {
+    'autocomplete': {'p95': 100, 'p99': 250},
+    'search': {'p95': 200, 'p99': 500},
+    'calculate_dosage': {'p95': 200, 'p99': 500},
+    'drug_detail': {'p95': 200, 'p99': 500},
+    'update_drug': {'p95': 500, 'p99': 1000},
+}
+
+
+# --- ローカルのサーバーの起動 ---
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_ready(base_url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("gunicorn が起動できませんでした。")
+        try:
+            status, _ = request(base_url, 'GET', '/')
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("gunicorn の起動がタイムアウトしました。")
+
+
+def start_server(work_dir, csv_file, workers, threads):
+    """work_dir に SQLite のDBを作ってカタログを取り込み、gunicorn を起動する"""
+    env = dict(os.environ)
+    env.pop('DATABASE_URL', None)
+    for script in (['migrations.py'], ['import_drugs_from_csv.py', os.path.abspath(csv_file), '--replace']):
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, script[0])] + script[1:],
+                       cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    port = _free_port()
+    log_file = open(os.path.join(work_dir, 'gunicorn.log'), 'w', encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'web_app:app',
+         '--config', os.path.join(REPO_DIR, 'gunicorn.conf.py'), '--pythonpath', REPO_DIR,
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads)],
+        cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_ready(base_url, process)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+# --- HTTP ---
+def request(base_url, method, path, body=None, compressed=False, timeout=30):
+    """1回の要求を送り、(ステータス, 応答の本文) を返す (gunicorn の sync ワーカーに合わせて毎回接続する)。
+
+    compressed=True の場合はブラウザと同じく圧縮した応答を受け取る (本文は圧縮されたまま返す)。
+    """
+    parsed = urllib.parse.urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    conn = connection_class(parsed.netloc, timeout=timeout)
+    headers = {'Accept-Encoding': 'gzip, br'} if compressed else {}
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    try:
+        conn.request(method, path, body=data, headers=headers)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+# --- 要求の内容 ---
+class Workload:
+    """カタログの薬名から、検索欄の入力・用量計算・管理画面の更新の要求を作る"""
+
+    def __init__(self, drugs):
+        self.drugs = drugs
+
+    def build(self, kind, rng):
+        """(メソッド, パス, 本文) を返す。update_drug は GET と PUT の2回の要求になるため None を返す"""
+        drug = rng.choice(self.drugs)
+        name = drug['drug_name']
+        if kind == 'autocomplete':
+            # 1文字ずつ入力する途中の文字列
+            prefix = name[:rng.randint(1, min(len(name), 8))]
+            return 'GET', '/autocomplete?' + urllib.parse.urlencode({'q': prefix, 'limit': 10}), None
+        if kind == 'search':
+            return 'GET', '/search?' + urllib.parse.urlencode({'q': name[:rng.randint(2, max(2, len(name)))]}), None
+        if kind == 'calculate_dosage':
+            age_years = rng.randint(0, 14)
+            weight = round(3.5 + age_years * 2.8 + rng.uniform(-1.5, 1.5), 1)
+            return 'POST', '/calculate_dosage', {'drug_name': name, 'weight': str(weight), 'age_years': str(age_years)}
+        if kind == 'drug_detail':
+            return 'GET', f"/drugs/{drug['id']}", None
+        return None
+
+    def update_drug(self, base_url, rng):
+        """管理画面と同じく薬を読み込み、内容を変えずに保存する"""
+        drug_id = rng.choice(self.drugs)['id']
+        status, body = request(base_url, 'GET', f'/drugs/{drug_id}')
+        if status != 200:
+            return status
+        data = json.loads(body)
+        # 管理画面はテキストエリアの JSON を解析して送るので、文字列のままの JSON は戻しておく
+        for key in ('single_dose_age_specific', 'daily_dose_age_specific'):
+            if isinstance(data.get(key), str):
+                data[key] = json.loads(data[key])
+        status, _ = request(base_url, 'PUT', f'/drugs/{drug_id}', data)
+        return status
+
+
+# --- 負荷をかける ---
+def _schedule(mix, rate, duration, seed):
+    """(予定時刻の秒, 要求の種類) の一覧を作る (指数分布の間隔で、平均 rate 件/秒)"""
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    schedule = []
+    at = 0.0
+    while True:
+        at += rng.expovariate(rate)
+        if at >= duration:
+            return schedule
+        schedule.append((at, rng.choices(kinds, weights)[0]))
+
+
+def run_load(base_url, workload, mix, rate, duration, concurrency, seed):
+    schedule = _schedule(mix, rate, duration, seed)
+    jobs = queue.Queue()
+    samples = {kind: [] for kind in mix}
+    errors = {kind: 0 for kind in mix}
+    lock = threading.Lock()
+    started_at = time.perf_counter() + 0.5
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            at, kind = job
+            scheduled = started_at + at
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                if kind == 'update_drug':
+                    status = workload.update_drug(base_url, rng)
+                else:
+                    method, path, body = workload.build(kind, rng)
+                    status, _ = request(base_url, method, path, body, compressed=True)
+                # 用量計算の 400 (年齢制限など) は正常な応答として扱う
+                failed = status >= 500 or (status >= 400 and kind != 'calculate_dosage')
+            except Exception:  # 接続の失敗・タイムアウト・不正な応答はエラーとして数える
+                failed = True
+            elapsed_ms = (time.perf_counter() - scheduled) * 1000
+            with lock:
+                samples[kind].append(elapsed_ms)
+                if failed:
+                    errors[kind] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for job in schedule:
+        jobs.put(job)
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started_at
+
+    endpoints = {}
+    for kind, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        endpoints[kind] = {
+            'requests': len(values),
+            'errors': errors[kind],
+            'error_rate': errors[kind] / len(values),
+            'throughput_rps': len(values) / elapsed,
+            'p50_ms': _percentile(values, 50),
+            'p95_ms': _percentile(values, 95),
+            'p99_ms': _percentile(values, 99),
+            'max_ms': values[-1],
+        }
+    total = sum(len(values) for values in samples.values())
+    return {
+        'target_rps': rate,
+        # 予定した要求の実際のレート (指数分布の間隔のため、目標のレートから少しずれる)
+        'offered_rps': len(schedule) / duration,
+        'achieved_rps': total / elapsed,
+        'duration_s': elapsed,
+        'requests': total,
+        'errors': sum(errors.values()),
+        'endpoints': endpoints,
+    }
+
+
+def _percentile(sorted_values, percent):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+# --- SLO ---
+def check_slos(result, slos, max_error_rate, min_throughput_ratio):
+    """SLO を満たさない項目の説明の一覧を返す"""
+    violations = []
+    for kind, stats in result['endpoints'].items():
+        for metric, limit in slos.get(kind, {}).items():
+            value = stats[f'{metric}_ms']
+            if value > limit:
+                violations.append(f"{kind}: {metric} {value:.1f} ms > {limit} ms")
+        if stats['error_rate'] > max_error_rate:
+            violations.append(f"{kind}: エラー率 {stats['error_rate']:.2%} > {max_error_rate:.2%}")
+    if result['achieved_rps'] < result['offered_rps'] * min_throughput_ratio:
+        violations.append(f"スループット {result['achieved_rps']:.1f} 件/秒 < 送信予定 {result['offered_rps']:.1f} 件/秒 "
+                          f"の {min_throughput_ratio:.0%}")
+    return violations
+
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"不明な要求の種類です: {kind} (使用可能: {', '.join(DEFAULT_MIX)})")
+        mix[kind] = float(weight)
+    return {kind: weight for kind, weight in mix.items() if weight > 0}
+
+
+def _parse_slo(text):
+    """'calculate_dosage:p99=300' を (種類, 指標, ミリ秒) に変換する"""
+    try:
+        kind, rest = text.split(':', 1)
+        metric, limit = rest.split('=', 1)
+        if kind not in DEFAULT_MIX or metric not in ('p50', 'p95', 'p99'):
+            raise ValueError
+        return kind, metric, float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"SLO の形式が不正です: {text} (例: calculate_dosage:p99=300)")
+
+
+def print_result(result, violations):
+    print(f"== {result['requests']} 件 / {result['duration_s']:.1f} 秒 "
+          f"({result['achieved_rps']:.1f} 件/秒, 目標 {result['target_rps']} 件/秒), エラー {result['errors']} 件")
+    for kind, stats in result['endpoints'].items():
+        print(f"  {kind:<18} {stats['requests']:6d} 件  p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+              f"p99 {stats['p99_ms']:8.1f} ms  エラー率 {stats['error_rate']:6.2%}")
+    if violations:
+        print("SLO を満たしていません:")
+        for violation in violations:
+            print(f"  - {violation}")
+    else:
+        print("すべての SLO を満たしています。")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicorn で動かしたアプリの負荷試験")
+    parser.add_argument('--url', help="既存のサーバーの URL (指定しない場合はローカルで gunicorn を起動する)")
+    parser.add_argument('--allow-writes', action='store_true', help="--url のサーバーにも薬の更新 (PUT) を送る")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="ローカルで起動するときに取り込むカタログのCSV")
+    parser.add_argument('--workers', type=int, default=2, help="ローカルの gunicorn のワーカー数")
+    parser.add_argument('--threads', type=int, default=1, help="ローカルの gunicorn のワーカーごとのスレッド数")
+    parser.add_argument('--rate', type=float, default=50, help="1秒あたりの要求数")
+    parser.add_argument('--duration', type=float, default=30, help="負荷をかける秒数")
+    parser.add_argument('--concurrency', type=int, default=16, help="同時に要求を送るスレッド数")
+    parser.add_argument('--mix', type=_parse_mix, default=dict(DEFAULT_MIX),
+                        help="要求の種類ごとの割合 (例: autocomplete=60,search=8,calculate_dosage=25,drug_detail=5,update_drug=2)")
+    parser.add_argument('--slo', type=_parse_slo, action='append', default=[],
+                        help="SLO の上書き (例: calculate_dosage:p99=300)。複数指定可")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="許容するエラー率")
+    parser.add_argument('--min-throughput-ratio', type=float, default=0.95, help="送信予定のレートに対して必要なスループットの割合")
+    parser.add_argument('--seed', type=int, default=0, help="要求の順序と内容の乱数の種")
+    parser.add_argument('--output', help="結果の JSON を保存するファイル")
+    args = parser.parse_args()
+
+    mix = dict(args.mix)
+    slos = {kind: dict(limits) for kind, limits in DEFAULT_SLOS.items()}
+    for kind, metric, limit in args.slo:
+        slos[kind][metric] = limit
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        process = None
+        base_url = args.url
+        if base_url is None:
+            print("gunicorn を起動しています...", file=sys.stderr)
+            process, base_url = start_server(work_dir, args.csv, args.workers, args.threads)
+        elif not args.allow_writes and mix.pop('update_drug', None):
+            print("--allow-writes が指定されていないため、薬の更新 (update_drug) は送りません。", file=sys.stderr)
+        try:
+            status, body = request(base_url, 'GET', '/search_all_drug_data')
+            if status != 200:
+                raise SystemExit(f"薬の一覧を取得できませんでした (HTTP {status})。")
+            workload = Workload(json.loads(body))
+            result = run_load(base_url, workload, mix, args.rate, args.duration, args.concurrency, args.seed)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    violations = check_slos(result, slos, args.max_error_rate, args.min_throughput_ratio)
+    result['slos'] = slos
+    result['violations'] = violations
+    print_result(result, violations)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に保存しました。")
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+"""用量計算・検索・薬の取得APIのベンチマーク。
+
+    python benchmarks/run.py [--postgres-url URL] [--csv drugs_data.csv] [--iterations 300] [--output results.json]
+    python benchmarks/run.py --compare old.json new.json
+
+バックエンドごとに子プロセスを起動し (DATABASE_URL はモジュールの読み込み時に決まるため)、
+ベンチマーク用のDBにカタログを取り込んでから Flask のテストクライアントで各APIを呼び出す。
+SQLite は一時ディレクトリに作成する。PostgreSQL は --postgres-url (または BENCH_POSTGRES_URL) で
+ベンチマーク専用のDBを指定した場合だけ計測する (drugs テーブルの内容は入れ替えられる)。
+
+各ケースはカタログをワーカー内にキャッシュした状態 (通常の運用) と、キャッシュを無効にして
+毎回DBに問い合わせる状態 ([db]) の両方で計測する。結果は JSON で出力し、--compare で
+2回分の結果を比べられる。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_CSV_FILE = os.path.join(REPO_DIR, 'drugs_data.csv')
+
+# 用量計算の分岐 (dosage_unit × usage_type) をすべて通るベンチマーク用の薬
+FIXTURE_DRUGS = [
+    {'drug_name': 'ベンチ体重内服', 'dosage_unit': 'kg', 'usage_type': '内服',
+     'daily_dose_per_kg': 0.05, 'max_daily_fixed_dose': 3.0, 'daily_frequency': '2,3', 'timing_options': '毎食後'},
+    {'drug_name': 'ベンチ年齢内服', 'dosage_unit': 'age', 'usage_type': '内服', 'min_age_months': 0, 'max_age_months': 143,
+     'daily_dose_age_specific': '{"0-11": 0.5, "12-47": 1.0, "48-143": 2.0}', 'daily_frequency': '1', 'timing_options': '眠前'},
+    {'drug_name': 'ベンチ固定内服', 'dosage_unit': 'fixed', 'usage_type': '内服',
+     'daily_fixed_dose': 4.0, 'max_daily_fixed_dose': 4.0, 'daily_frequency': '1', 'timing_options': '眠前'},
+    {'drug_name': 'ベンチ体重頓服', 'dosage_unit': 'kg', 'usage_type': '頓服',
+     'single_dose_per_kg': 10.0, 'max_daily_fixed_dose': 1500.0, 'max_daily_times': 3, 'timing_options': '発熱時'},
+    {'drug_name': 'ベンチ年齢頓服', 'dosage_unit': 'age', 'usage_type': '頓服',
+     'single_dose_age_specific': '{"0-35": 0.5, "36-143": 1.0}', 'max_daily_times': 2, 'timing_options': '疼痛時'},
+    {'drug_name': 'ベンチ固定頓服', 'dosage_unit': 'fixed', 'usage_type': '頓服',
+     'single_fixed_dose': 1.0, 'max_daily_times': 3, 'timing_options': '喘息時'},
+]
+
+SEARCH_QUERIES = {
+    'short': 'か',
+    'long': 'アセトアミノフェン細粒20%',
+    'miss': '存在しない薬の名前',
+}
+
+
+# --- 子プロセス: DB の準備と計測 ---
+def _setup_database(csv_file):
+    import database
+    import drug_cache
+    import drug_search
+    import import_drugs_from_csv
+    import migrations
+
+    migrations.migrate()
+    import_drugs_from_csv.import_drugs_from_csv(csv_file, replace=True)
+    with database.connection() as conn:
+        cursor = database.cursor(conn)
+        p = database.PARAM
+        for fixture in FIXTURE_DRUGS:
+            row = dict(fixture)
+            row['drug_name_key'], row['aliases_key'] = drug_search.search_key_values(row['drug_name'], row.get('aliases'))
+            columns = list(row)
+            cursor.execute(f"DELETE FROM drugs WHERE drug_name = {p}", (row['drug_name'],))
+            cursor.execute(
+                f"INSERT INTO drugs ({', '.join(columns)}) VALUES ({', '.join([p] * len(columns))})",
+                tuple(row[column] for column in columns),
+            )
+        drug_cache.bump_version(cursor)
+        conn.commit()
+        cursor.execute("SELECT COUNT(*) FROM drugs")
+        drug_count = cursor.fetchone()[0]
+        cursor.execute(f"SELECT id FROM drugs WHERE drug_name = {p}", (FIXTURE_DRUGS[0]['drug_name'],))
+        fixture_id = cursor.fetchone()[0]
+    return drug_count, fixture_id
+
+
+def _measure(call, iterations):
+    """call を iterations 回呼び出し、1回あたりの時間の統計 (マイクロ秒) を返す"""
+    status = call()
+    for _ in range(max(1, iterations // 10)):
+        call()
+    samples = []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - started_at) * 1e6)
+    samples.sort()
+    return {
+        'status': status,
+        'iterations': iterations,
+        'mean_us': statistics.fmean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p95_us': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        'min_us': samples[0],
+    }
+
+
+def _cases(client, fixture_id):
+    cases = {}
+    for fixture in FIXTURE_DRUGS:
+        payload = {'drug_name': fixture['drug_name'], 'weight': '15', 'age_years': '4'}
+        cases[f"calculate_dosage/{fixture['dosage_unit']}/{fixture['usage_type']}"] = (
+            lambda payload=payload: client.post('/calculate_dosage', json=payload).status_code)
+    for label, query in SEARCH_QUERIES.items():
+        cases[f"search/{label}"] = lambda query=query: client.get('/search', query_string={'q': query}).status_code
+    cases['drugs/<id>'] = lambda: client.get(f'/drugs/{fixture_id}').status_code
+    return cases
+
+
+def run_worker(backend, csv_file, iterations, result_file):
+    sys.path.insert(0, REPO_DIR)
+    drug_count, fixture_id = _setup_database(csv_file)
+
+    import web_app
+    from drug_cache import catalog_cache
+
+    client = web_app.app.test_client()
+    results = {}
+    for name, call in _cases(client, fixture_id).items():
+        results[name] = _measure(call, iterations)
+
+    # キャッシュを無効にして、毎回 DB に問い合わせる経路 (SQL の検索など) を計測する
+    catalog_cache.max_entries = 0
+    catalog_cache.invalidate()
+    for name, call in _cases(client, fixture_id).items():
+        results[f"{name} [db]"] = _measure(call, iterations)
+
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump({'backend': backend, 'drug_count': drug_count, 'results': results}, f, ensure_ascii=False)
+
+
+# --- 親プロセス: バックエンドごとに子プロセスを起動して結果をまとめる ---
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_backend(backend, postgres_url, csv_file, iterations):
+    env = dict(os.environ)
+    env.pop('DATABASE_URL', None)
+    if backend == 'postgresql':
+        env['DATABASE_URL'] = postgres_url
+    with tempfile.TemporaryDirectory() as work_dir:
+        result_file = os.path.join(work_dir, 'result.json')
+        # SQLite のDB (./drug_data.db) は一時ディレクトリに作られる
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', backend,
+             '--csv', os.path.abspath(csv_file), '--iterations', str(iterations), '--result-file', result_file],
+            cwd=work_dir, env=env, capture_output=True, text=True,
+        )
+        if completed.returncode != 0 or not os.path.exists(result_file):
+            print(completed.stdout[-2000:], completed.stderr[-2000:], file=sys.stderr)
+            raise SystemExit(f"{backend} のベンチマークに失敗しました。")
+        with open(result_file, encoding='utf-8') as f:
+            return json.load(f)
+
+
+def print_results(report):
+    for backend, data in report['backends'].items():
+        print(f"== {backend} ({data['drug_count']} 件)")
+        for name, stats in data['results'].items():
+            print(f"  {name:<40} p50 {stats['p50_us']:9.1f} us  p95 {stats['p95_us']:9.1f} us  "
+                  f"mean {stats['mean_us']:9.1f} us  [{stats['status']}]")
+
+
+def compare(old_file, new_file, threshold):
+    """2回分の結果の p50 を比べ、threshold を超えて遅くなったケースがあれば 1 を返す"""
+    with open(old_file, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_file, encoding='utf-8') as f:
+        new = json.load(f)
+    regressions = 0
+    for backend, data in new['backends'].items():
+        old_results = old['backends'].get(backend, {}).get('results', {})
+        print(f"== {backend}")
+        for name, stats in data['results'].items():
+            if name not in old_results:
+                print(f"  {name:<40} (新規) p50 {stats['p50_us']:9.1f} us")
+                continue
+            ratio = stats['p50_us'] / old_results[name]['p50_us']
+            mark = ''
+            if ratio > 1 + threshold:
+                mark = '  ← 遅くなっています'
+                regressions += 1
+            print(f"  {name:<40} p50 {old_results[name]['p50_us']:9.1f} → {stats['p50_us']:9.1f} us ({ratio:5.2f} 倍){mark}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用量計算・検索APIのベンチマーク")
+    parser.add_argument('--postgres-url', default=os.environ.get('BENCH_POSTGRES_URL'),
+                        help="ベンチマーク専用の PostgreSQL の URL (指定した場合だけ計測する)")
+    parser.add_argument('--csv', default=DEFAULT_CSV_FILE, help="取り込むカタログのCSV")
+    parser.add_argument('--iterations', type=int, default=300, help="ケースごとの計測回数")
+    parser.add_argument('--output', help="結果の JSON を保存するファイル")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="2つの結果ファイルを比べる")
+    parser.add_argument('--threshold', type=float, default=0.1, help="--compare で遅くなったとみなす割合")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.csv, args.iterations, args.result_file)
+        return 0
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    backends = ['sqlite']
+    if args.postgres_url:
+        backends.append('postgresql')
+    else:
+        print("PostgreSQL は --postgres-url (または BENCH_POSTGRES_URL) が指定されていないため計測しません。", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'csv': os.path.basename(args.csv),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'backends': {},
+    }
+    for backend in backends:
+        data = run_backend(backend, args.postgres_url, args.csv, args.iterations)
+        report['backends'][backend] = {'drug_count': data['drug_count'], 'results': data['results']}
+
+    print_results(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に保存しました。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
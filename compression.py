@@ -0,0 +1,90 @@
+import gzip
+import os
+import time
+import zlib
+
+from flask import request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli がない環境では gzip だけを使う
+    brotli = None
+
+# これより小さいレスポンスは圧縮しない (圧縮しても小さくならず、CPU を使うだけのため)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+# 動的なレスポンスを圧縮するので、圧縮率より速度を優先した品質にする
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'text/html', 'text/csv', 'text/plain', 'text/css', 'application/javascript',
+}
+
+
+def _choose_encoding():
+    accept_encodings = request.accept_encodings
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def _compress_stream(chunks, encoding):
+    """ストリーミングのレスポンスをチャンクごとに圧縮しながら送る"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip 形式
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def compress_response(response):
+    """クライアントが対応していれば、レスポンスを brotli または gzip で圧縮する"""
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # 大きさが分からないので、しきい値に関係なく圧縮しながら送る
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        started_at = time.perf_counter()
+        response.set_data(_compress(data, encoding))
+        metrics.record_phase('compress', time.perf_counter() - started_at)
+    response.headers['Content-Encoding'] = encoding
+
+    # 圧縮前と同じ内容を表すので、強い ETag は弱い ETag にする
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -0,0 +1,438 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# データベース接続のURL設定 (未設定の場合はローカルのSQLiteを使用)
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# 起動時間を短くするため、DATABASE_URL で選ばれたバックエンドのドライバだけを読み込む
+if DATABASE_URL:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+else:
+    import sqlite3
+
+# ローカル開発用SQLiteのパス
+DATABASE_DIR_SQLITE = '.'
+DATABASE_FILE_SQLITE = os.path.join(DATABASE_DIR_SQLITE, 'drug_data.db')
+
+# プールの設定 (gunicorn のワーカープロセスごとに1つのプールを持つ)
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+POOL_TIMEOUT_SECONDS = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+# 接続の最大寿命。これを超えた接続は返却時・取得時に閉じて作り直す
+CONN_MAX_LIFETIME_SECONDS = float(os.environ.get('DB_CONN_MAX_LIFETIME', '1800'))
+# この秒数以上使われていなかった接続は、貸し出す前に SELECT 1 で生存確認する
+HEALTHCHECK_IDLE_SECONDS = float(os.environ.get('DB_HEALTHCHECK_IDLE', '30'))
+
+# SQL のプレースホルダ
+PARAM = '%s' if DATABASE_URL else '?'
+
+IntegrityError = psycopg2.IntegrityError if DATABASE_URL else sqlite3.IntegrityError
+
+
+class PoolTimeoutError(Exception):
+    """プールから接続を取得できずにタイムアウトしたときの例外"""
+
+
+class _PooledConnection:
+    """接続本体と、寿命・生存確認のための時刻情報"""
+
+    __slots__ = ('conn', 'created_at', 'last_used_at')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+    def expired(self, now):
+        return now - self.created_at > CONN_MAX_LIFETIME_SECONDS
+
+    def needs_healthcheck(self, now):
+        return now - self.last_used_at > HEALTHCHECK_IDLE_SECONDS
+
+
+class _PoolStats:
+    """プールのサイズ調整に使う統計値"""
+
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.recycled = 0
+        self.healthcheck_failures = 0
+        self.acquired = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record_acquire(self, waited_seconds):
+        self.acquired += 1
+        self.total_wait_seconds += waited_seconds
+        if waited_seconds > self.max_wait_seconds:
+            self.max_wait_seconds = waited_seconds
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'closed': self.closed,
+            'recycled': self.recycled,
+            'healthcheck_failures': self.healthcheck_failures,
+            'acquired': self.acquired,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'total_wait_ms': round(self.total_wait_seconds * 1000, 3),
+            'avg_wait_ms': round(self.total_wait_seconds * 1000 / self.acquired, 3) if self.acquired else 0.0,
+            'max_wait_ms': round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+class PostgresConnectionPool:
+    """上限付きの psycopg2 接続プール。
+
+    上限まで接続が貸し出されている場合は、返却されるまで最大 timeout 秒待つ。
+    """
+
+    def __init__(self, dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT_SECONDS):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = _PoolStats()
+        for _ in range(min_size):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        pooled = _PooledConnection(psycopg2.connect(self.dsn))
+        self.stats.created += 1
+        return pooled
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        self.stats.closed += 1
+
+    def _is_healthy(self, pooled):
+        if pooled.conn.closed:
+            return False
+        try:
+            with pooled.conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            pooled.conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._in_use < self.max_size:
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats.timeouts += 1
+                    raise PoolTimeoutError(
+                        f"{self.timeout}秒以内にデータベース接続を取得できませんでした (最大 {self.max_size} 接続)。")
+                if not waited:
+                    self.stats.waits += 1
+                    waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+
+        # 接続の作成や生存確認はロックの外で行う
+        try:
+            now = time.monotonic()
+            if pooled is not None and pooled.expired(now):
+                self._discard(pooled)
+                self.stats.recycled += 1
+                pooled = None
+            if pooled is not None and pooled.needs_healthcheck(now) and not self._is_healthy(pooled):
+                self._discard(pooled)
+                self.stats.healthcheck_failures += 1
+                pooled = None
+            if pooled is None:
+                pooled = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.stats.record_acquire(time.monotonic() - start)
+        return pooled
+
+    def release(self, pooled):
+        keep = not pooled.conn.closed
+        if keep:
+            try:
+                # 開いたままのトランザクションを残さないようにする
+                if pooled.conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    pooled.conn.rollback()
+            except Exception:
+                keep = False
+        now = time.monotonic()
+        if keep and pooled.expired(now):
+            keep = False
+            self.stats.recycled += 1
+        if not keep:
+            self._discard(pooled)
+        else:
+            pooled.last_used_at = now
+
+        with self._cond:
+            self._in_use -= 1
+            if keep:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+    def snapshot(self):
+        with self._cond:
+            data = {
+                'backend': 'postgresql',
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            }
+            data.update(self.stats.as_dict())
+        return data
+
+
+class SQLiteConnectionPool:
+    """スレッドごとに1本の SQLite 接続を使い回すプール。
+
+    sqlite3 の接続は作成したスレッドでしか使えないため、threading.local に保持する。
+    """
+
+    def __init__(self, database_file=DATABASE_FILE_SQLITE):
+        self.database_file = database_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self.stats = _PoolStats()
+
+    def _connect(self):
+        database_dir = os.path.dirname(self.database_file)
+        if database_dir and not os.path.exists(database_dir):
+            os.makedirs(database_dir)
+        conn = sqlite3.connect(self.database_file)
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            self.stats.created += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self.stats.closed += 1
+
+    def acquire(self):
+        start = time.monotonic()
+        pooled = getattr(self._local, 'pooled', None)
+        if pooled is not None:
+            now = time.monotonic()
+            if pooled.expired(now):
+                self._discard(pooled)
+                with self._lock:
+                    self.stats.recycled += 1
+                pooled = None
+            elif pooled.needs_healthcheck(now):
+                try:
+                    pooled.conn.execute('SELECT 1')
+                except sqlite3.Error:
+                    self._discard(pooled)
+                    with self._lock:
+                        self.stats.healthcheck_failures += 1
+                    pooled = None
+        if pooled is None:
+            pooled = self._connect()
+            if getattr(self._local, 'seen', False) is False:
+                self._local.seen = True
+                with self._lock:
+                    self._threads += 1
+            self._local.pooled = pooled
+        with self._lock:
+            self.stats.record_acquire(time.monotonic() - start)
+        return pooled
+
+    def release(self, pooled):
+        try:
+            if pooled.conn.in_transaction:
+                pooled.conn.rollback()
+            pooled.last_used_at = time.monotonic()
+        except sqlite3.Error:
+            self._discard(pooled)
+            self._local.pooled = None
+
+    def close_all(self):
+        pooled = getattr(self._local, 'pooled', None)
+        if pooled is not None:
+            self._discard(pooled)
+            self._local.pooled = None
+
+    def snapshot(self):
+        with self._lock:
+            data = {
+                'backend': 'sqlite',
+                'threads': self._threads,
+            }
+            data.update(self.stats.as_dict())
+        return data
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """現在のプロセス用のプールを返す (fork 後は新しいプールを作り直す)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                if DATABASE_URL:
+                    _pool = PostgresConnectionPool(DATABASE_URL)
+                else:
+                    _pool = SQLiteConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+
+def dispose_pool():
+    """現在のプロセスのプールの接続を閉じて破棄する。
+
+    gunicorn の preload 時に、マスタープロセスで開いた接続をワーカーに引き継がないよう
+    fork の前に呼び出す (同じソケットを複数のプロセスで使うと接続が壊れるため)。
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close_all()
+        _pool = None
+        _pool_pid = None
+
+
+_query_listeners = []
+_connect_listeners = []
+
+
+def add_query_listener(listener):
+    """cursor() で作成したカーソルで SQL を実行するたびに listener(cursor, sql, params, 秒数) を呼び出す。
+
+    cursor は EXPLAIN などに使える元のカーソルで、SQL が失敗した場合と executemany の場合は None になる。
+    """
+    _query_listeners.append(listener)
+
+
+def add_connect_listener(listener):
+    """connection() でプールから接続を取得するたびに listener(取得にかかった秒数) を呼び出す"""
+    _connect_listeners.append(listener)
+
+
+@contextmanager
+def connection():
+    """プールから接続を借り、ブロックを抜けるときに返却するコンテキストマネージャ。
+
+    例外が発生した場合はロールバックしてから返却する。コミットは呼び出し側で行う。
+    """
+    pool = get_pool()
+    if _connect_listeners:
+        started_at = time.perf_counter()
+        pooled = pool.acquire()
+        seconds = time.perf_counter() - started_at
+        for listener in _connect_listeners:
+            listener(seconds)
+    else:
+        pooled = pool.acquire()
+    try:
+        yield pooled.conn
+    except Exception:
+        try:
+            pooled.conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        pool.release(pooled)
+
+
+class _ObservedCursor:
+    """execute / executemany の実行時間を計り、登録された関数に知らせるカーソルのラッパー"""
+
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def _observe(self, method, sql, args, many=False):
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            result = method(sql, *args)
+            succeeded = True
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            cursor = self._cursor if succeeded and not many else None
+            params = args[0] if args else None
+            for listener in _query_listeners:
+                listener(cursor, sql, params, seconds)
+
+    def execute(self, sql, *args):
+        return self._observe(self._cursor.execute, sql, args)
+
+    def executemany(self, sql, *args):
+        return self._observe(self._cursor.executemany, sql, args, many=True)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def cursor(conn):
+    """バックエンドに応じて、カラム名でアクセスできるカーソルを作成する"""
+    if DATABASE_URL:
+        raw_cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+    else:
+        raw_cursor = conn.cursor()
+    # 計測する関数が登録されていない場合は、ラッパーのオーバーヘッドをなくすため元のカーソルを返す
+    return _ObservedCursor(raw_cursor) if _query_listeners else raw_cursor
+
+
+def pool_stats():
+    return get_pool().snapshot()
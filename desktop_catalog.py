@@ -0,0 +1,163 @@
+"""デスクトップアプリ (pediatric_drug_app.py) 用の、メモリ上の薬カタログ。
+
+起動時と一定間隔ごとにバックグラウンドのスレッドで SQLite から全件を読み込み、検索用の索引
+(drug_search.NgramIndex に1文字用の索引を加えたもの) と薬の種類ごとの一覧を作っておく。
+入力のたびの絞り込みと、選択した薬の用量計算はメモリ上だけで行うので、Tk のメインスレッドが
+DB の読み込みで止まることはない。
+
+    loader = CatalogLoader()
+    loader.start()
+    ...
+    snapshot, error = loader.poll()  # Tk の after() から定期的に呼び出す (新しいカタログがなければ None)
+
+DRUG_SYNC_URL が設定されていれば、確認のたびに先に本番との差分同期 (drug_sync.py) も行う。
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import drug_cache
+import drug_sync
+from drug_search import NgramIndex, normalize_search_key
+
+# カタログの更新 (catalog_version の変化) を確認する間隔 (秒)
+CATALOG_REFRESH_SECONDS = float(os.environ.get('DESKTOP_CATALOG_REFRESH_SECONDS', '60'))
+DEFAULT_DB_PATH = 'drug_data.db'
+
+
+class CharacterIndex(NgramIndex):
+    """1文字の入力でも全件を調べずに済むよう、文字単位の転置索引も持つ NgramIndex"""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.char_postings = {}
+        for drug_id, (name_key, aliases_key) in self.keys.items():
+            for char in set(name_key + aliases_key):
+                self.char_postings.setdefault(char, set()).add(drug_id)
+
+    def candidates(self, query_key):
+        if len(query_key) < self.N:
+            return self.char_postings.get(query_key, ())
+        return super().candidates(query_key)
+
+
+class CatalogSnapshot:
+    """ある時点のカタログ全体と、その索引 (作成後は変更しない)"""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.loaded_at = time.time()
+        self.rows_by_name = {row['drug_name']: row for row in rows}
+        self.index = CharacterIndex(rows)
+        self.all_names = sorted(self.rows_by_name)
+        ids_by_type = {}
+        names_by_type = {}
+        for row in rows:
+            if row.get('type'):
+                ids_by_type.setdefault(row['type'], set()).add(row['id'])
+                names_by_type.setdefault(row['type'], []).append(row['drug_name'])
+        self.ids_by_type = ids_by_type
+        self.names_by_type = {drug_type: sorted(names) for drug_type, names in names_by_type.items()}
+
+    def __len__(self):
+        return len(self.rows_by_name)
+
+    def get(self, drug_name):
+        return self.rows_by_name.get(drug_name)
+
+    def filter(self, term, drug_type=None):
+        """薬名・別名と薬の種類で絞り込んだ薬名のリストを返す。
+
+        入力がなければ薬名の順に、入力があれば drug_search と同じ順位 (完全一致 > 前方一致 > 部分一致) で並べる。
+        """
+        query_key = normalize_search_key(term)
+        if not query_key:
+            if drug_type:
+                return self.names_by_type.get(drug_type, [])
+            return self.all_names
+        results = self.index.search(query_key)
+        if drug_type:
+            allowed = self.ids_by_type.get(drug_type, ())
+            return [result['drug_name'] for result in results if result['id'] in allowed]
+        return [result['drug_name'] for result in results]
+
+
+def load_snapshot(db_path=DEFAULT_DB_PATH, known_version=None):
+    """SQLite から全件を読み込んで CatalogSnapshot を作る。
+
+    catalog_version が known_version から変わっていなければ読み込まずに None を返す。
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.cursor()
+        try:
+            version = drug_cache.read_version(cursor)
+        except sqlite3.OperationalError:
+            version = None  # catalog_version のない古い DB は毎回読み込む
+        if version is not None and version == known_version:
+            return None
+        cursor.execute("SELECT * FROM drugs")
+        rows = [dict(row) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return CatalogSnapshot(rows, version)
+
+
+class CatalogLoader:
+    """バックグラウンドのスレッドでカタログを読み込み、結果をキューで Tk のメインスレッドに渡す"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, interval=CATALOG_REFRESH_SECONDS, sync_url=drug_sync.DRUG_SYNC_URL):
+        self.db_path = db_path
+        self.interval = interval
+        self.sync_url = sync_url
+        self._results = queue.Queue()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='catalog-loader', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def refresh(self):
+        """次の確認を待たずに、すぐにカタログの更新を確認する"""
+        self._wake.set()
+
+    def _run(self):
+        version = None
+        while not self._stop.is_set():
+            if self.sync_url:
+                try:
+                    drug_sync.sync(self.sync_url, self.db_path)
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    # オフラインなどで同期できなくても、ローカルの複製で使い続ける
+                    self._results.put((None, f"本番と同期できませんでした (ローカルのデータを使用中): {e}"))
+            try:
+                snapshot = load_snapshot(self.db_path, known_version=version)
+            except sqlite3.Error as e:
+                self._results.put((None, f"カタログを読み込めませんでした: {e}"))
+            else:
+                if snapshot is not None:
+                    version = snapshot.version
+                    self._results.put((snapshot, None))
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """読み込みが終わった最新のカタログと、前回以降の最後のエラーを返す (どちらもなければ None)"""
+        snapshot, error = None, None
+        while True:
+            try:
+                result_snapshot, result_error = self._results.get_nowait()
+            except queue.Empty:
+                return snapshot, error
+            if result_snapshot is not None:
+                snapshot = result_snapshot
+            else:
+                error = result_error
@@ -0,0 +1,285 @@
+"""薬の行を用量計算の規則 (DoseRule) に一度だけコンパイルし、Web アプリとデスクトップアプリで共有する。
+
+用法タイプ (頓服/内服) と用量の基準 (kg/age/fixed) による分岐、年齢制限や1日最大量のエラー文、
+表示する単位・投与回数・タイミングの候補はコンパイル時に決めておく。計算のたびに行の値を
+比べたり引いたりせず、DoseRule.calculate() を1回呼ぶだけで結果が得られる。
+
+    rule = rule_for(drug_info)
+    response_data, status = rule.calculate(patient_weight, patient_age_months)
+
+Flask などには依存しないので、Tkinter のアプリからもそのまま使える。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from age_bands import AgeBandError, compile_age_bands
+
+# コンパイル済みの規則を保持する最大件数 (カタログキャッシュの件数に合わせる)
+RULE_CACHE_MAX_ENTRIES = int(os.environ.get('DOSE_RULE_CACHE_MAX_ENTRIES', '5000'))
+
+# 内服で一般的なタイミング (例: '毎食後', '朝食後', '夕食後' など)
+GENERAL_TIMINGS = ('朝食後', '昼食後', '夕食後', '毎食後', '朝', '昼', '夕', '眠前', '就寝前', '食前', '食間',
+                   '1日1回', '1日2回', '1日3回', '1日4回')
+# 頓服で一般的なタイミング (例: '必要時', '発熱時', '疼痛時' など)
+SITUATIONAL_TIMINGS = ('時', '必要時', '頓服', '発熱時', '疼痛時', '嘔吐時', '咳嗽時', '喘息時')
+
+
+def format_age_months(age_months):
+    """月齢を「N歳」または「N歳Mヶ月」の表示にする"""
+    display = f"{age_months // 12}歳"
+    if age_months % 12 > 0:
+        display += f"{age_months % 12}ヶ月"
+    return display
+
+
+def default_dose_unit(formulation_type):
+    """calculated_dose_unit が設定されていない場合の、剤形から決める単位"""
+    if formulation_type == 'シロップ':
+        return "ml"
+    if formulation_type in ('テープ', '貼付剤', '坐剤'):
+        return "枚"  # または 個
+    return "mg"  # 細粒などもここでは mg とする
+
+
+def frequency_options(usage_type, daily_frequency, max_daily_times):
+    """フロントエンドに渡す1日の投与回数の候補"""
+    if usage_type == '内服':
+        return daily_frequency.split(',') if daily_frequency else []
+    # 頓服は1日最大服用回数があればそれを候補にし、なければ空にする (フロントエンドで「必要時」を推奨)
+    if usage_type == '頓服' and max_daily_times is not None:
+        return [str(i) for i in range(1, max_daily_times + 1)]
+    return []
+
+
+def timing_choices(usage_type, timing_options):
+    """フロントエンドに渡すタイミングの候補 (用法タイプに合うものを優先する)"""
+    if not timing_options:
+        # 内服の場合は空のまま (フロントエンドで「タイミング候補なし」が表示される)
+        return ['必要時'] if usage_type == '頓服' else []
+    all_timing_options = timing_options.split(',')
+    if usage_type == '内服':
+        preferred = [t for t in all_timing_options if any(gt in t for gt in GENERAL_TIMINGS)]
+        return preferred or all_timing_options  # 見つからなければ全て返す
+    preferred = [t for t in all_timing_options if any(st in t for st in SITUATIONAL_TIMINGS)]
+    return preferred or ['必要時']  # 見つからなければ「必要時」をデフォルト
+
+
+# create_db.py の旧スキーマ (デスクトップ版の初期設定) の用量のカラム。用量は1回量として入っている
+LEGACY_DOSE_COLUMNS = {
+    'single_dose_per_kg': 'dose_per_kg',
+    'single_fixed_dose': 'fixed_dose',
+    'single_dose_age_specific': 'dose_age_specific',
+}
+# 旧スキーマの行の単位 (旧デスクトップ版の表示と同じ)
+LEGACY_DOSE_UNITS = {'kg': 'g', 'age': 'ml', 'fixed': 'ml'}
+
+
+def current_row(drug_info):
+    """薬の行を、現行のスキーマのカラム名で引ける辞書にする (行にないカラムは None)。
+
+    usage_type のない旧スキーマの行は、旧デスクトップ版と同じく dose_per_kg などを1回量 (頓服) として扱う
+    (DoseRule では daily_frequency をそのまま投与回数の候補にし、タイミングの候補は出さない)。
+    """
+    row = dict(drug_info)
+    if 'usage_type' not in row:
+        row['usage_type'] = '頓服'
+        for column, legacy_column in LEGACY_DOSE_COLUMNS.items():
+            row.setdefault(column, row.get(legacy_column))
+        row.setdefault('calculated_dose_unit', LEGACY_DOSE_UNITS.get(row.get('dosage_unit')))
+    return row
+
+
+class DoseRule:
+    """1件の薬をコンパイルした、変更不可の用量計算の規則。
+
+    dose_per_kg は体重基準の薬の kg あたりの用量 (用法タイプに応じた1回量または1日量、体重基準でなければ None)。
+    """
+
+    __slots__ = ('drug_name', 'usage_type', 'dose_per_kg', 'age_bands', 'fixed_dose', 'max_daily_fixed_dose',
+                 'min_age_months', 'max_age_months', '_dose', '_data_error', '_below_min_age_error',
+                 '_above_max_age_error', '_no_age_band_error', '_over_max_prefix', '_over_max_suffix', '_response')
+
+    def __init__(self, drug_info):
+        set_slot = super().__setattr__
+        legacy = 'usage_type' not in drug_info.keys()
+        drug_info = current_row(drug_info)
+        drug_name = drug_info['drug_name']
+        usage_type = drug_info.get('usage_type') or "内服"
+        is_prn = usage_type == '頓服'
+        label = '頓服' if is_prn else '内服'
+        amount = '1回' if is_prn else '1日'
+        dosage_unit = drug_info.get('dosage_unit')
+        max_daily_fixed_dose = drug_info.get('max_daily_fixed_dose')
+        min_age_months = drug_info.get('min_age_months')
+        max_age_months = drug_info.get('max_age_months')
+
+        set_slot('drug_name', drug_name)
+        set_slot('usage_type', usage_type)
+        set_slot('max_daily_fixed_dose', max_daily_fixed_dose)
+        set_slot('min_age_months', min_age_months)
+        set_slot('max_age_months', max_age_months)
+        set_slot('dose_per_kg', None)
+        set_slot('age_bands', None)
+        set_slot('fixed_dose', None)
+        set_slot('_data_error', None)
+        set_slot('_no_age_band_error', None)
+        set_slot('_below_min_age_error', None if min_age_months is None else
+                 f"{drug_name} は {format_age_months(min_age_months)}未満の患者には推奨されません。")
+        set_slot('_above_max_age_error', None if max_age_months is None else
+                 f"{drug_name} は {format_age_months(max_age_months)}を超える患者には推奨されません。")
+
+        # 用量の基準と用法タイプによる分岐は、ここで計算用のメソッドを選んで済ませておく
+        dose = self._missing_data
+        if dosage_unit == 'kg':
+            dose_per_kg = drug_info.get('single_dose_per_kg' if is_prn else 'daily_dose_per_kg')
+            if dose_per_kg is not None:
+                set_slot('dose_per_kg', dose_per_kg)
+                dose = self._weight_based_dose
+            else:
+                set_slot('_data_error', f"{drug_name} ({label}) は体重基準ですが、{amount}あたりの用量データが設定されていません。")
+        elif dosage_unit == 'age':
+            age_doses_json = drug_info.get('single_dose_age_specific' if is_prn else 'daily_dose_age_specific')
+            if not age_doses_json:
+                set_slot('_data_error', f"{drug_name} ({label}) は年齢基準ですが、{amount}用量データが設定されていません。")
+            else:
+                try:
+                    set_slot('age_bands', compile_age_bands(age_doses_json))
+                    set_slot('_no_age_band_error', (
+                        f"{drug_name} ({label}) は年齢基準ですが、入力された年齢 (",
+                        f") に該当する{amount}用量が見つかりません。"))
+                    dose = self._age_based_dose
+                except AgeBandError as e:
+                    set_slot('_data_error', f"{drug_name} ({label}) の年齢別{amount}用量データが不正です: {e}")
+        elif dosage_unit == 'fixed':
+            fixed_dose = drug_info.get('single_fixed_dose' if is_prn else 'daily_fixed_dose')
+            if fixed_dose is not None:
+                set_slot('fixed_dose', fixed_dose)
+                dose = self._fixed_dose
+            else:
+                set_slot('_data_error', f"{drug_name} ({label}) は固定用量ですが、{'1回用量' if is_prn else '1日総量'}データが設定されていません。")
+        else:
+            set_slot('_data_error', f"{drug_name} ({label}) の用量計算の基準が不明です。")
+        set_slot('_dose', dose)
+
+        # 1日最大量を超えたときのエラー文 (用量の部分だけを計算時に埋める)
+        if is_prn:
+            set_slot('_over_max_prefix', f"{drug_name} の1回用量 (")
+            set_slot('_over_max_suffix', f") が絶対的な1日最大量 ({max_daily_fixed_dose or 0:.3f}) を超えています。")
+        else:
+            set_slot('_over_max_prefix', f"{drug_name} の1日総量 (")
+            set_slot('_over_max_suffix', f") は、絶対的な1日最大量 ({max_daily_fixed_dose or 0:.3f}) を超えています。")
+
+        response = {
+            "drug_name": drug_name,
+            "aliases": drug_info.get('aliases'),  # フロントエンドで一般名を使用するため
+            "calculated_daily_dose_value": None,  # 名前は daily_dose_value だが、頓服では1回量
+            "dose_unit": drug_info.get('calculated_dose_unit') or default_dose_unit(drug_info.get('formulation_type')),
+            "formulation_type": drug_info.get('formulation_type') or "",
+            "notes": drug_info.get('notes') or "",
+            "daily_frequency_options": (
+                drug_info['daily_frequency'].split(',') if legacy and drug_info['daily_frequency']
+                else frequency_options(usage_type, drug_info.get('daily_frequency'), drug_info.get('max_daily_times'))),
+            "timing_options": [] if legacy else timing_choices(usage_type, drug_info.get('timing_options')),
+            "initial_usage_type": usage_type,
+            "min_age_months": min_age_months,
+            "max_age_months": max_age_months,
+            "max_daily_fixed_dose": max_daily_fixed_dose,  # 必要に応じてフロントエンドへ
+            "max_daily_times": drug_info.get('max_daily_times'),  # 頓服の最大回数
+        }
+        set_slot('_response', response)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} は変更できません。")
+
+    @property
+    def data_error(self):
+        """用量のデータが足りない・不正な場合のエラー文 (計算できる場合は None)"""
+        return self._data_error
+
+    @property
+    def dose_unit(self):
+        return self._response["dose_unit"]
+
+    def age_limit(self, patient_age_months):
+        """年齢制限外であれば 'below_min_age' または 'above_max_age' を、制限内であれば None を返す"""
+        if self._below_min_age_error is not None and patient_age_months < self.min_age_months:
+            return 'below_min_age'
+        if self._above_max_age_error is not None and patient_age_months > self.max_age_months:
+            return 'above_max_age'
+        return None
+
+    def base_dose(self, patient_weight, patient_age_months):
+        """年齢制限と1日最大量を確認する前の用量を (用量, エラー文) で返す (用量早見表用)"""
+        return self._dose(patient_weight, patient_age_months, None)
+
+    # --- 用量の計算 (コンパイル時に選んだ1つだけを使う)。(用量, エラー文) を返す ---
+    def _weight_based_dose(self, patient_weight, patient_age_months, kg_dose):
+        return (kg_dose if kg_dose is not None else patient_weight * self.dose_per_kg), None
+
+    def _age_based_dose(self, patient_weight, patient_age_months, kg_dose):
+        dose = self.age_bands.lookup(patient_age_months)
+        if dose is None:
+            prefix, suffix = self._no_age_band_error
+            return None, f"{prefix}{format_age_months(patient_age_months)}{suffix}"
+        return dose, None
+
+    def _fixed_dose(self, patient_weight, patient_age_months, kg_dose):
+        return self.fixed_dose, None
+
+    def _missing_data(self, patient_weight, patient_age_months, kg_dose):
+        return None, self._data_error
+
+    def calculate(self, patient_weight, patient_age_months, kg_dose=None):
+        """用量を計算し、(レスポンス本体, ステータスコード) を返す。
+
+        kg_dose には、体重基準の薬について一括計算済みの用量を渡せる (省略時はここで計算する)。
+        返すレスポンス本体の中のリストはコンパイル結果と共有しているので、変更しないこと。
+        """
+        if self._below_min_age_error is not None and patient_age_months < self.min_age_months:
+            return {"error": self._below_min_age_error, "drug_data": None}, 400
+        if self._above_max_age_error is not None and patient_age_months > self.max_age_months:
+            return {"error": self._above_max_age_error, "drug_data": None}, 400
+
+        dose, error = self._dose(patient_weight, patient_age_months, kg_dose)
+        if error is not None:
+            return {"error": error, "drug_data": None}, 400
+        if self.max_daily_fixed_dose is not None and dose > self.max_daily_fixed_dose:
+            return {"error": f"{self._over_max_prefix}{dose:.3f}{self._over_max_suffix}", "drug_data": None}, 400
+
+        response = self._response.copy()
+        response["calculated_daily_dose_value"] = dose
+        return response, 200
+
+
+# キー: id(薬の行) / 値: (薬の行, 規則)。行を保持しておくので id が別の行に使い回されることはない
+_rules = OrderedDict()
+_rules_lock = threading.Lock()
+
+
+def cached_rule(drug_info):
+    """drug_info をコンパイル済みであればその規則を、なければ None を返す"""
+    key = id(drug_info)
+    with _rules_lock:
+        cached = _rules.get(key)
+        if cached is not None and cached[0] is drug_info:
+            _rules.move_to_end(key)
+            return cached[1]
+    return None
+
+
+def rule_for(drug_info):
+    """薬の行に対応する規則を返す (同じ行オブジェクトは一度だけコンパイルする)。
+
+    カタログキャッシュは薬が更新されると行を新しいオブジェクトに入れ替えるので、
+    古い規則が使われることはない。
+    """
+    rule = cached_rule(drug_info)
+    if rule is not None:
+        return rule
+    rule = DoseRule(drug_info)
+    with _rules_lock:
+        _rules[id(drug_info)] = (drug_info, rule)
+        while len(_rules) > RULE_CACHE_MAX_ENTRIES:
+            _rules.popitem(last=False)
+    return rule
@@ -0,0 +1,312 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+# キャッシュに保持する薬の最大件数。カタログがこれを超える場合は LRU で追い出す
+CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '5000'))
+# 他のワーカーによる更新を検知するため、カタログのバージョンを確認する間隔 (秒)
+VERSION_CHECK_INTERVAL_SECONDS = float(os.environ.get('CATALOG_CACHE_CHECK_INTERVAL', '5'))
+# 変更履歴から薬を読むときに、1回の IN 句で指定する id の数
+CHANGES_QUERY_BATCH_SIZE = 500
+
+
+# --- カタログバージョン (drugs テーブルが変更されるたびに +1 される) ---
+def ensure_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO catalog_version (id, version)
+        SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM catalog_version WHERE id = 1)
+    ''')
+
+
+def bump_version(cursor):
+    """drugs テーブルを変更したトランザクション内で呼び出し、新しいバージョンを返す"""
+    cursor.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+    return read_version(cursor)
+
+
+def read_version(cursor):
+    cursor.execute("SELECT version FROM catalog_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+# --- 変更履歴 (デスクトップ版などの複製を差分で同期するため) ---
+# drug_changes には薬ごとに最後に変更されたカタログのバージョンを1行だけ残す。
+# drugs のトリガー (migrations.py のマイグレーション 8・9 で作成) が変更された薬を version = NULL (未確定) で
+# 記録し、同じトランザクションで bump_version() したときに catalog_version のトリガーが新しいバージョンを書き込む。
+# どの書き込み経路 (API・CSV インポート・差分同期) でも、bump_version() を呼べば記録が確定する。
+def read_changes(cursor, since):
+    """カタログのバージョン since 以降に変更・削除された薬を返す。
+
+    {"version": 現在のバージョン, "reset": bool, "drugs": [変更後の行, ...], "deleted": [削除された id, ...]}
+    since が 0 (初回) や現在のバージョンより新しい (別の DB の複製など) 場合は、全件を reset=True で返す。
+    バージョンを先に読むので、読み込み中に変更された薬は新しい内容で返り、次回の同期でも再び返る
+    (複製側では同じ内容を上書きするだけになる)。
+    """
+    version = read_version(cursor)
+    if since <= 0 or since > version:
+        cursor.execute("SELECT * FROM drugs ORDER BY id")
+        return {"version": version, "reset": True, "drugs": [dict(row) for row in cursor.fetchall()], "deleted": []}
+
+    p = database.PARAM
+    cursor.execute(
+        f"SELECT drug_id FROM drug_changes WHERE version > {p} AND version <= {p} ORDER BY drug_id",
+        (since, version),
+    )
+    changed_ids = [row[0] for row in cursor.fetchall()]
+    drugs = []
+    for start in range(0, len(changed_ids), CHANGES_QUERY_BATCH_SIZE):
+        batch = changed_ids[start:start + CHANGES_QUERY_BATCH_SIZE]
+        cursor.execute(f"SELECT * FROM drugs WHERE id IN ({', '.join([p] * len(batch))}) ORDER BY id", tuple(batch))
+        drugs.extend(dict(row) for row in cursor.fetchall())
+    found_ids = {row['id'] for row in drugs}
+    deleted = [drug_id for drug_id in changed_ids if drug_id not in found_ids]
+    return {"version": version, "reset": False, "drugs": drugs, "deleted": deleted}
+
+
+class DrugCatalogCache:
+    """薬カタログのワーカー内キャッシュ。
+
+    drug_name と id の両方で引けるように保持する。カタログ全体が max_entries 以内に収まる場合は
+    初回アクセス時に全件を読み込み (complete)、見つからない薬名も DB に問い合わせずに判定できる。
+    収まらない場合は LRU で件数を制限し、キャッシュにない薬だけを DB から取得する。
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, check_interval=VERSION_CHECK_INTERVAL_SECONDS):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._by_id = OrderedDict()
+        self._id_by_name = {}
+        self._complete = False
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        # キャッシュの内容が変わるたびに増える番号 (キャッシュから作る索引の再構築判定に使う)
+        self.generation = 0
+        # 自ワーカーでの書き込みで薬が変わったときに呼び出す関数 (drug_id, 新しい行または None, バージョン)
+        self._listeners = []
+
+    # --- 内部処理 (呼び出し側で self._lock を保持していること) ---
+    def _clear(self):
+        self.generation += 1
+        self._by_id.clear()
+        self._id_by_name.clear()
+        self._complete = False
+        self._loaded = False
+
+    def _store(self, row):
+        drug_id = row['id']
+        self._evict_id(drug_id)
+        self.generation += 1
+        self._by_id[drug_id] = row
+        self._id_by_name[row['drug_name']] = drug_id
+        while len(self._by_id) > self.max_entries:
+            _, evicted = self._by_id.popitem(last=False)
+            self._id_by_name.pop(evicted['drug_name'], None)
+            # 追い出した時点で全件を保持していることにはならない
+            self._complete = False
+
+    def _evict_id(self, drug_id):
+        row = self._by_id.pop(drug_id, None)
+        if row is not None:
+            self.generation += 1
+        if row is not None and self._id_by_name.get(row['drug_name']) == drug_id:
+            del self._id_by_name[row['drug_name']]
+
+    def _install(self, version, rows):
+        """DB から読んだカタログでキャッシュを置き換える (rows が None なら件数を制限して都度読む)"""
+        self._clear()
+        self._version = version
+        if rows is not None:
+            for row in rows:
+                self._store(row)
+            self._complete = len(self._by_id) == len(rows)
+        self._loaded = True
+
+    # --- DB からの読み込み ---
+    def _read_catalog(self, cursor):
+        """(バージョン, 全行のリスト) を返す。max_entries に収まらない場合の全行は None"""
+        version = read_version(cursor)
+        cursor.execute("SELECT COUNT(*) FROM drugs")
+        if cursor.fetchone()[0] > self.max_entries:
+            return version, None
+        cursor.execute("SELECT * FROM drugs")
+        return version, [dict(row) for row in cursor.fetchall()]
+
+    def _ensure_fresh(self):
+        """初回の全件読み込みと、一定間隔ごとのバージョン確認を行う (self._lock を保持せずに呼び出すこと)。
+
+        DB への問い合わせはロックの外で行い、他のスレッドはその間も今のキャッシュを読める。
+        ロックは確認したバージョンとキャッシュのバージョンを比べ、入れ替えるときだけ取る。
+        読み込み中に他のスレッドが書き込みや読み込みでキャッシュを更新していれば、そちらを残す。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded:
+                if now - self._checked_at < self.check_interval:
+                    return
+                # 同じ間隔の確認を他のスレッドが重ねて行わないようにする
+                self._checked_at = now
+            seen_loaded, seen_version = self._loaded, self._version
+
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            if seen_loaded and read_version(cursor) == seen_version:
+                return
+            version, rows = self._read_catalog(cursor)
+
+        with self._lock:
+            if self._loaded == seen_loaded and self._version == seen_version:
+                self._install(version, rows)
+                self._checked_at = now
+
+    def _fetch_row(self, column, value):
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            cursor.execute(f"SELECT * FROM drugs WHERE {column} = {database.PARAM}", (value,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    # --- 読み取りAPI ---
+    def get_by_name(self, drug_name):
+        self._ensure_fresh()
+        with self._lock:
+            drug_id = self._id_by_name.get(drug_name)
+            if drug_id is not None:
+                self._by_id.move_to_end(drug_id)
+                self.hits += 1
+                return self._by_id[drug_id]
+            if self._complete:
+                self.hits += 1
+                return None
+            self.misses += 1
+            row = self._fetch_row('drug_name', drug_name)
+            if row:
+                self._store(row)
+            return row
+
+    def get_by_id(self, drug_id):
+        self._ensure_fresh()
+        with self._lock:
+            row = self._by_id.get(drug_id)
+            if row is not None:
+                self._by_id.move_to_end(drug_id)
+                self.hits += 1
+                return row
+            if self._complete:
+                self.hits += 1
+                return None
+            self.misses += 1
+            row = self._fetch_row('id', drug_id)
+            if row:
+                self._store(row)
+            return row
+
+    def get_many_by_name(self, drug_names):
+        """複数の薬名をまとめて引き、{薬名: 行} を返す。
+
+        キャッシュにない薬は IN 句を使った1回のクエリでまとめて取得する。
+        """
+        self._ensure_fresh()
+        with self._lock:
+            found = {}
+            missing = []
+            for drug_name in set(drug_names):
+                drug_id = self._id_by_name.get(drug_name)
+                if drug_id is not None:
+                    self._by_id.move_to_end(drug_id)
+                    found[drug_name] = self._by_id[drug_id]
+                    self.hits += 1
+                elif self._complete:
+                    self.hits += 1
+                else:
+                    missing.append(drug_name)
+            if missing:
+                self.misses += len(missing)
+                placeholders = ', '.join([database.PARAM] * len(missing))
+                with database.connection() as conn:
+                    cursor = database.cursor(conn)
+                    cursor.execute(f"SELECT * FROM drugs WHERE drug_name IN ({placeholders})", tuple(missing))
+                    rows = cursor.fetchall()
+                for row in rows:
+                    row = dict(row)
+                    self._store(row)
+                    found[row['drug_name']] = row
+            return found
+
+    def current_version(self):
+        """把握しているカタログのバージョンを返す (一定間隔ごとに DB の値を確認する)"""
+        self._ensure_fresh()
+        with self._lock:
+            return self._version
+
+    def all_rows(self):
+        """全件を保持している場合は全行のリストを、そうでなければ None を返す"""
+        self._ensure_fresh()
+        with self._lock:
+            if not self._complete:
+                return None
+            return list(self._by_id.values())
+
+    # --- 書き込み後の更新 ---
+    def refresh(self, conn, new_version, drug_id=None, drug_name=None):
+        """書き込みをコミットした直後に呼び出し、変更された薬だけをキャッシュに反映する。
+
+        自ワーカーが把握しているバージョンの直後の変更であれば該当行だけを入れ替え、
+        他のワーカーの変更を取りこぼしている場合はキャッシュ全体を破棄する。
+        """
+        with self._lock:
+            if not self._loaded or self._version != new_version - 1:
+                self._clear()
+                return
+            cursor = database.cursor(conn)
+            if drug_id is not None:
+                self._evict_id(drug_id)
+                cursor.execute(f"SELECT * FROM drugs WHERE id = {database.PARAM}", (drug_id,))
+            else:
+                cursor.execute(f"SELECT * FROM drugs WHERE drug_name = {database.PARAM}", (drug_name,))
+            row = cursor.fetchone()
+            if row:
+                row = dict(row)
+                self._store(row)
+                drug_id = row['id']
+            self._version = new_version
+            listeners = list(self._listeners)
+        # 通知はロックの外で行う (通知先が自身のロックを取ってからキャッシュを読むことがあるため)
+        if drug_id is not None:
+            for listener in listeners:
+                listener(drug_id, row, new_version)
+
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._by_id),
+                'max_entries': self.max_entries,
+                'complete': self._complete,
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+catalog_cache = DrugCatalogCache()
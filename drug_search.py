@@ -0,0 +1,360 @@
+import os
+import re
+import threading
+import unicodedata
+
+import database
+import prefix_index
+from database import DATABASE_URL
+from drug_cache import catalog_cache
+from fuzzy_index import SymSpellIndex
+
+# 検索結果の順位: 薬名が完全一致 > 薬名が前方一致 > 別名が前方一致 > 部分一致
+RANK_EXACT = 0
+RANK_NAME_PREFIX = 1
+RANK_ALIAS_PREFIX = 2
+RANK_SUBSTRING = 3
+
+# SQLite の FTS5 trigram は3文字以上のクエリでないと索引を使えない
+FTS_MIN_QUERY_LENGTH = 3
+
+# 曖昧検索で許容する最大の編集距離と、削除辞書に登録する語の先頭文字数
+FUZZY_MAX_EDIT_DISTANCE = int(os.environ.get('FUZZY_MAX_EDIT_DISTANCE', '2'))
+FUZZY_PREFIX_LENGTH = int(os.environ.get('FUZZY_PREFIX_LENGTH', '7'))
+
+# 入力補完で1回の検索につき読む語の最大数 (1文字目の入力などで一致する語が多すぎる場合の打ち切り)
+AUTOCOMPLETE_SCAN_LIMIT = int(os.environ.get('AUTOCOMPLETE_SCAN_LIMIT', '500'))
+
+
+# --- 検索キーの正規化 ---
+_WHITESPACE_RE = re.compile(r'\s+')
+# カタカナ (ァ〜ヶ) をひらがなに寄せる
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def normalize_search_key(text):
+    """検索用のキーに正規化する。
+
+    NFKC で全角英数・記号を半角に、半角カナを全角にそろえ (例: '１０％' → '10%', 'ｼﾛｯﾌﾟ' → 'シロップ')、
+    大文字・小文字を同一視し、カタカナをひらがなにそろえ、空白を取り除く。
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = text.translate(_KATAKANA_TO_HIRAGANA)
+    return _WHITESPACE_RE.sub('', text)
+
+
+def search_key_values(drug_name, aliases):
+    """drugs.drug_name_key / aliases_key に保存する値を返す"""
+    return normalize_search_key(drug_name), normalize_search_key(aliases)
+
+
+# --- 索引の有無 (索引は migrations.py のマイグレーション 6 で作成する) ---
+_sqlite_fts_ready = False
+
+
+def _sqlite_fts_available(cursor):
+    # 起動後にマイグレーションで索引が作られることがあるため、見つかるまでは毎回確認する
+    global _sqlite_fts_ready
+    if not _sqlite_fts_ready:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'drugs_fts'")
+        _sqlite_fts_ready = cursor.fetchone() is not None
+    return _sqlite_fts_ready
+
+
+# --- 順位付け ---
+def row_search_keys(row):
+    """行の検索キーを返す (キーが未設定の古い行はその場で正規化する)"""
+    name_key = row.get('drug_name_key')
+    aliases_key = row.get('aliases_key')
+    if name_key is None or aliases_key is None:
+        return search_key_values(row['drug_name'], row['aliases'])
+    return name_key, aliases_key
+
+
+def rank_match(name_key, aliases_key, query_key):
+    """正規化済みのキー同士を比べ、一致の種類に応じた順位を返す (一致しなければ None)"""
+    if name_key == query_key:
+        return RANK_EXACT
+    if name_key.startswith(query_key):
+        return RANK_NAME_PREFIX
+    if any(alias.startswith(query_key) for alias in aliases_key.split(',')):
+        return RANK_ALIAS_PREFIX
+    if query_key in name_key or query_key in aliases_key:
+        return RANK_SUBSTRING
+    return None
+
+
+# --- メモリ上の n-gram 転置索引 ---
+class NgramIndex:
+    """drug_name と aliases の検索キーの文字 bigram から薬の id を引く転置索引。
+
+    日本語の薬名は単語区切りがないため、2文字単位で索引を作る。候補を絞り込んだ後、
+    実際に部分一致するかどうかを確認する。
+    """
+
+    N = 2
+
+    def __init__(self, rows):
+        self.rows = {row['id']: row for row in rows}
+        self.keys = {drug_id: row_search_keys(row) for drug_id, row in self.rows.items()}
+        self.postings = {}
+        for drug_id, (name_key, aliases_key) in self.keys.items():
+            for gram in self._grams(name_key + '\n' + aliases_key):
+                self.postings.setdefault(gram, set()).add(drug_id)
+
+    @classmethod
+    def _grams(cls, text):
+        return {text[i:i + cls.N] for i in range(len(text) - cls.N + 1)}
+
+    def candidates(self, query_key):
+        if len(query_key) < self.N:
+            return self.rows.keys()
+        result = None
+        # 出現数の少ない bigram から積集合を取る
+        for gram in sorted(self._grams(query_key), key=lambda g: len(self.postings.get(g, ()))):
+            posting = self.postings.get(gram)
+            if not posting:
+                return set()
+            result = set(posting) if result is None else result & posting
+            if not result:
+                return result
+        return result
+
+    def search(self, query_key, limit=None):
+        ranked = []
+        for drug_id in self.candidates(query_key):
+            name_key, aliases_key = self.keys[drug_id]
+            rank = rank_match(name_key, aliases_key, query_key)
+            if rank is not None:
+                ranked.append((rank, self.rows[drug_id]['drug_name'], drug_id))
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [{"id": drug_id, "drug_name": drug_name} for _, drug_name, drug_id in ranked]
+
+
+_memory_index = None
+_memory_index_generation = None
+_memory_index_lock = threading.Lock()
+
+
+def _get_memory_index():
+    """カタログ全体がキャッシュされていれば、その内容から作った索引を返す"""
+    global _memory_index, _memory_index_generation
+    rows = catalog_cache.all_rows()
+    if rows is None:
+        return None
+    generation = catalog_cache.generation
+    with _memory_index_lock:
+        if _memory_index is None or _memory_index_generation != generation:
+            _memory_index = NgramIndex(rows)
+            _memory_index_generation = generation
+        return _memory_index
+
+
+# --- カタログのバージョンに追従する索引 (曖昧検索・入力補完) ---
+def _index_rows():
+    """索引の作成に使う行を返す。カタログ全体がキャッシュにない場合は、必要なカラムだけを読み込む"""
+    rows = catalog_cache.all_rows()
+    if rows is None:
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            cursor.execute("SELECT id, drug_name, aliases, drug_name_key, aliases_key FROM drugs")
+            rows = [dict(row) for row in cursor.fetchall()]
+    return rows
+
+
+class VersionedIndex:
+    """カタログから作るワーカー内の索引を、カタログのバージョンに合わせて保持する。
+
+    build() は全行から索引を作り、add_row(index, row) は1件分を登録する。
+    /drugs API による自ワーカーでの変更はキャッシュの通知を受けて薬単位で反映し、
+    他のワーカーの変更を取りこぼした場合は次回の利用時に全体を作り直す。
+    """
+
+    def __init__(self, build, add_row):
+        self._build = build
+        self._add_row = add_row
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+        catalog_cache.add_listener(self._on_drug_changed)
+
+    def lookup(self, *args):
+        """最新の索引で index.lookup(*args) を呼び出す。
+
+        索引の変更と検索が同時に走らないよう、検索もロックを保持したまま行う。
+        """
+        version = catalog_cache.current_version()
+        with self._lock:
+            if self._index is None or self._version != version:
+                self._index = self._build(_index_rows())
+                self._version = version
+            return self._index.lookup(*args)
+
+    def _on_drug_changed(self, drug_id, row, new_version):
+        with self._lock:
+            if self._index is None:
+                return
+            if self._version != new_version - 1:
+                self._index = None
+                return
+            if row is None:
+                self._index.remove(drug_id)
+            else:
+                self._add_row(self._index, row)
+            self._version = new_version
+
+
+# --- 曖昧検索 (SymSpell 方式の削除辞書) ---
+def _fuzzy_terms(name_key, aliases_key):
+    return [name_key] + aliases_key.split(',')
+
+
+def _add_fuzzy_row(index, row):
+    index.add(row['id'], row['drug_name'], _fuzzy_terms(*row_search_keys(row)))
+
+
+def _build_fuzzy_index(rows):
+    index = SymSpellIndex(FUZZY_MAX_EDIT_DISTANCE, FUZZY_PREFIX_LENGTH)
+    for row in rows:
+        _add_fuzzy_row(index, row)
+    return index
+
+
+_fuzzy_index = VersionedIndex(_build_fuzzy_index, _add_fuzzy_row)
+
+
+# --- 入力補完 (ソート済み配列の前方一致) ---
+# 成分名などのトークンとして切り出す文字の並び: ひらがな (正規化でカタカナもひらがなになる)・漢字・英字。
+# 数字や記号 (含量の '10%' や 'mg/g' の '/') と文字種の境目で区切られる
+_TOKEN_RE = re.compile(r'[\u3041-\u309f\u30fc]+|[\u3005\u4e00-\u9fff]+|[a-z]+')
+AUTOCOMPLETE_MIN_TOKEN_LENGTH = 2
+
+
+def autocomplete_terms(name_key, aliases_key):
+    """入力補完の索引に登録する [(語, 語の種類)] を返す。
+
+    薬名と各別名に加え、それらを文字種の境目で分けたトークン
+    (例: 'あもきししりん水和物100mg/g' → 'あもきししりん', '水和物', 'mg') を登録し、
+    成分名や剤形の途中から入力しても候補に出るようにする。
+    """
+    terms = [(name_key, prefix_index.SOURCE_NAME)]
+    terms.extend((alias, prefix_index.SOURCE_ALIAS) for alias in aliases_key.split(',') if alias)
+    for text in [name_key] + aliases_key.split(','):
+        for token in _TOKEN_RE.findall(text):
+            if len(token) >= AUTOCOMPLETE_MIN_TOKEN_LENGTH and token != text:
+                terms.append((token, prefix_index.SOURCE_TOKEN))
+    return terms
+
+
+def _add_autocomplete_row(index, row):
+    index.add(row['id'], row['drug_name'], autocomplete_terms(*row_search_keys(row)))
+
+
+def _build_autocomplete_index(rows):
+    index = prefix_index.PrefixIndex(AUTOCOMPLETE_SCAN_LIMIT)
+    index.bulk_load((row['id'], row['drug_name'], autocomplete_terms(*row_search_keys(row))) for row in rows)
+    return index
+
+
+_autocomplete_index = VersionedIndex(_build_autocomplete_index, _add_autocomplete_row)
+
+
+def warm_up():
+    """部分一致検索と入力補完の索引を作っておく (アプリ起動時のウォームアップ用)"""
+    _get_memory_index()
+    _autocomplete_index.lookup('', 1)
+
+
+def autocomplete(term, limit):
+    """入力途中の文字列に前方一致する薬を [{"id", "drug_name", "match"}] で返す。
+
+    match は語がクエリと完全に一致すれば 'exact'、前方一致なら 'prefix'。
+    """
+    query_key = normalize_search_key(term)
+    return [
+        {"id": drug_id, "drug_name": drug_name, "match": match}
+        for match, drug_name, drug_id in _autocomplete_index.lookup(query_key, limit)
+    ]
+
+
+# --- SQL による検索 ---
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _rank_order_sql(prefix=''):
+    p = database.PARAM
+    return f'''
+        CASE WHEN {prefix}drug_name_key = {p} THEN {RANK_EXACT}
+             WHEN {prefix}drug_name_key LIKE {p} ESCAPE '\\' THEN {RANK_NAME_PREFIX}
+             WHEN {prefix}aliases_key LIKE {p} ESCAPE '\\' OR {prefix}aliases_key LIKE {p} ESCAPE '\\' THEN {RANK_ALIAS_PREFIX}
+             ELSE {RANK_SUBSTRING} END, {prefix}drug_name
+    '''
+
+
+def _rank_params(query_key):
+    escaped = _escape_like(query_key)
+    return (query_key, f'{escaped}%', f'{escaped}%', f'%,{escaped}%')
+
+
+def _search_sql(query_key, limit):
+    p = database.PARAM
+    escaped = _escape_like(query_key)
+    limit_sql = f"LIMIT {int(limit)}" if limit is not None else ""
+    with database.connection() as conn:
+        cursor = database.cursor(conn)
+        if not DATABASE_URL and len(query_key) >= FTS_MIN_QUERY_LENGTH and _sqlite_fts_available(cursor):
+            query = f'''
+                SELECT d.id, d.drug_name FROM drugs_fts f JOIN drugs d ON d.id = f.rowid
+                WHERE drugs_fts MATCH {p}
+                ORDER BY {_rank_order_sql('d.')}
+                {limit_sql}
+            '''
+            params = ('"' + query_key.replace('"', '""') + '"',) + _rank_params(query_key)
+        else:
+            # 検索キーは正規化済みなので LIKE で比較する
+            # (PostgreSQL では pg_trgm の GIN 索引が先頭ワイルドカードの LIKE にも使われる)
+            query = f'''
+                SELECT id, drug_name FROM drugs
+                WHERE drug_name_key LIKE {p} ESCAPE '\\' OR aliases_key LIKE {p} ESCAPE '\\'
+                ORDER BY {_rank_order_sql()}
+                {limit_sql}
+            '''
+            params = (f'%{escaped}%', f'%{escaped}%') + _rank_params(query_key)
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+    return [{"id": row['id'], "drug_name": row['drug_name']} for row in results]
+
+
+def search_drugs(term, limit=None, fuzzy=False):
+    """drug_name と aliases を正規化した検索キーの部分一致で検索し、順位順に [{"id", "drug_name"}] を返す。
+
+    カタログ全体がワーカー内にキャッシュされていればメモリ上の索引を、
+    そうでなければバックエンドの索引を使った SQL で検索する。
+    fuzzy=True の場合は、部分一致の結果 (距離0) の後に編集距離の近い薬を続け、
+    各結果に "distance" を付ける。
+    """
+    query_key = normalize_search_key(term)
+    index = _get_memory_index()
+    if index is not None:
+        results = index.search(query_key, limit)
+    else:
+        results = _search_sql(query_key, limit)
+    if not fuzzy:
+        return results
+
+    for result in results:
+        result['distance'] = 0
+    if limit is None or len(results) < limit:
+        seen = {result['id'] for result in results}
+        for distance, drug_name, drug_id in _fuzzy_index.lookup(query_key):
+            if drug_id in seen:
+                continue
+            results.append({"id": drug_id, "drug_name": drug_name, "distance": distance})
+            if limit is not None and len(results) >= limit:
+                break
+    return results
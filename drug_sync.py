@@ -0,0 +1,178 @@
+"""デスクトップ版の SQLite (drug_data.db) を、本番のカタログに差分で同期する。
+
+    python drug_sync.py https://<本番のホスト> [--db drug_data.db]
+
+本番の /drugs/changes?since=<前回のバージョン> から、前回以降に変更・削除された薬だけを受け取って
+ローカルの drugs テーブルに反映する。初回と、同期先の URL を変えた場合は全件を受け取って置き換える。
+同期済みの本番のバージョンは replica_state テーブルに保存し、ローカルの catalog_version も上げるので、
+起動中のデスクトップアプリは次のカタログの確認で読み直す。
+
+DRUG_SYNC_URL を設定すると、pediatric_drug_app.py がカタログの確認のたびにバックグラウンドで同期する
+(オフラインの間はローカルの複製をそのまま使う)。
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import drug_cache
+import migrations
+
+# 同期先の本番の URL (未設定の場合、デスクトップアプリは同期しない)
+DRUG_SYNC_URL = os.environ.get('DRUG_SYNC_URL', '')
+DRUG_SYNC_TIMEOUT = float(os.environ.get('DRUG_SYNC_TIMEOUT', '10'))
+DEFAULT_DB_PATH = 'drug_data.db'
+# ローカルの drugs に追加してよいカラム名 (本番から受け取ったカラム名は SQL にそのまま埋め込むため)
+_COLUMN_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def ensure_replica_schema(cursor):
+    """複製に必要なテーブル (drugs・catalog_version・replica_state) を作る"""
+    migrations.create_drugs_table(cursor)
+    drug_cache.ensure_version_table(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS replica_state (
+            id INTEGER PRIMARY KEY,
+            server_url TEXT,
+            version INTEGER,
+            synced_at TEXT
+        )
+    ''')
+
+
+def read_state(cursor):
+    """(同期先の URL, 同期済みのバージョン) を返す (未同期なら (None, 0))"""
+    cursor.execute("SELECT server_url, version FROM replica_state WHERE id = 1")
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def fetch_changes(server_url, since, timeout=DRUG_SYNC_TIMEOUT):
+    """本番から since 以降の変更を取得し、(変更, 受信したバイト数) を返す"""
+    url = f"{server_url.rstrip('/')}/drugs/changes?{urllib.parse.urlencode({'since': since})}"
+    request = urllib.request.Request(url, headers={'Accept': 'application/json', 'Accept-Encoding': 'gzip'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        received = len(body)
+        if response.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+    return validate_changes(json.loads(body)), received
+
+
+def validate_changes(changes):
+    """/drugs/changes のレスポンスの形を確かめて返す (不正な場合は ValueError)。
+
+    反映の途中で KeyError などにならないよう、apply_changes が使う項目を先にすべて確かめる。
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("変更の形式が不正です (JSON オブジェクトではありません)。")
+    version = changes.get('version')
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ValueError("変更の形式が不正です (version が整数ではありません)。")
+    if not isinstance(changes.get('reset'), bool):
+        raise ValueError("変更の形式が不正です (reset が真偽値ではありません)。")
+    deleted = changes.get('deleted')
+    if not isinstance(deleted, list) or not all(isinstance(drug_id, int) for drug_id in deleted):
+        raise ValueError("変更の形式が不正です (deleted が id のリストではありません)。")
+    rows = changes.get('drugs')
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("変更の形式が不正です (drugs が行のリストではありません)。")
+    if rows:
+        columns = set(rows[0])
+        if not {'id', 'drug_name'} <= columns:
+            raise ValueError("変更の形式が不正です (drugs の行に id・drug_name がありません)。")
+        invalid = sorted(column for column in columns if not _COLUMN_NAME_RE.fullmatch(column))
+        if invalid:
+            raise ValueError(f"変更の形式が不正です (カラム名が不正です: {', '.join(invalid)})。")
+        if any(set(row) != columns for row in rows):
+            raise ValueError("変更の形式が不正です (drugs の行ごとにカラムが異なります)。")
+        if not all(isinstance(row['id'], int) and isinstance(row['drug_name'], str) for row in rows):
+            raise ValueError("変更の形式が不正です (drugs の行の id・drug_name の型が不正です)。")
+    return changes
+
+
+def apply_changes(conn, changes, server_url):
+    """変更をローカルの drugs に1つのトランザクションで反映し、(更新した件数, 削除した件数) を返す"""
+    cursor = conn.cursor()
+    rows = changes['drugs']
+    deleted_ids = changes['deleted']
+    if changes['reset']:
+        cursor.execute("SELECT COUNT(*) FROM drugs")
+        deleted_count = cursor.fetchone()[0]
+        cursor.execute("DELETE FROM drugs")
+    else:
+        deleted_count = len(deleted_ids)
+        cursor.executemany("DELETE FROM drugs WHERE id = ?", [(drug_id,) for drug_id in deleted_ids])
+
+    if rows:
+        columns = list(rows[0])
+        # 本番で追加されたカラムは、値をそのまま保持できるよう型を指定せずに追加する
+        migrations.add_columns(cursor, 'drugs', {column: '' for column in columns})
+        # 本番で薬名が入れ替わっていても UNIQUE 制約に掛からないよう、同じ id・薬名の古い行を先に消す
+        cursor.executemany("DELETE FROM drugs WHERE id = ? OR drug_name = ?",
+                           [(row['id'], row['drug_name']) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO drugs ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})",
+            [tuple(row[column] for column in columns) for row in rows],
+        )
+    if rows or deleted_count:
+        # 起動中のデスクトップアプリに読み直させる
+        drug_cache.bump_version(cursor)
+    cursor.execute(
+        "INSERT OR REPLACE INTO replica_state (id, server_url, version, synced_at) VALUES (1, ?, ?, ?)",
+        (server_url, changes['version'], time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+    )
+    conn.commit()
+    return len(rows), deleted_count
+
+
+def sync(server_url, db_path=DEFAULT_DB_PATH, timeout=DRUG_SYNC_TIMEOUT):
+    """ローカルの複製を本番に同期し、結果の概要を返す"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        ensure_replica_schema(cursor)
+        conn.commit()
+        synced_url, since = read_state(cursor)
+        if synced_url != server_url:
+            since = 0  # 別の本番の複製だった場合は全件を取り直す
+        changes, received = fetch_changes(server_url, since, timeout=timeout)
+        updated, deleted = apply_changes(conn, changes, server_url)
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return {
+        'since': since,
+        'version': changes['version'],
+        'reset': changes['reset'],
+        'updated': updated,
+        'deleted': deleted,
+        'received_bytes': received,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="デスクトップ版の drug_data.db を本番のカタログに差分で同期します。")
+    parser.add_argument('server_url', nargs='?', default=DRUG_SYNC_URL,
+                        help="本番の URL (省略時は環境変数 DRUG_SYNC_URL)")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="同期するローカルの SQLite ファイル")
+    args = parser.parse_args()
+    if not args.server_url:
+        parser.error("同期先の URL を指定するか、DRUG_SYNC_URL を設定してください。")
+
+    try:
+        result = sync(args.server_url, args.db)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"同期できませんでした: {e}")
+        sys.exit(1)
+    kind = "全件" if result['reset'] else f"バージョン {result['since']} からの差分"
+    print(f"{kind}を同期しました (バージョン {result['version']}): "
+          f"更新 {result['updated']} 件 / 削除 {result['deleted']} 件 / 受信 {result['received_bytes']} バイト")
@@ -0,0 +1,139 @@
+from itertools import combinations
+
+
+def prefix_edit_distance(query, term, max_distance):
+    """query と、term の先頭部分 (term 全体を含む) との編集距離の最小値を返す。
+
+    挿入・削除・置換・隣接文字の入れ替えを1操作として数える。
+    DP 表の最終行の各列が「term の先頭 j 文字との距離」になるので、1回の計算で
+    すべての長さの先頭部分と比べられる。max_distance を超える場合は None を返す。
+    """
+    query_length = len(query)
+    target = term[:query_length + max_distance]
+    target_length = len(target)
+    if query_length - max_distance > target_length:
+        return None
+    previous_previous = None
+    previous = list(range(target_length + 1))
+    for i in range(1, query_length + 1):
+        query_char = query[i - 1]
+        current = [i] + [0] * target_length
+        row_min = i
+        for j in range(1, target_length + 1):
+            target_char = target[j - 1]
+            value = previous[j - 1] + (query_char != target_char)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if (previous_previous is not None and j > 1
+                    and query_char == target[j - 2] and query[i - 2] == target_char
+                    and previous_previous[j - 2] + 1 < value):
+                value = previous_previous[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_distance:
+            return None
+        previous_previous, previous = previous, current
+    distance = min(previous[max(0, query_length - max_distance):])
+    return distance if distance <= max_distance else None
+
+
+def allowed_distance(query, max_edit_distance):
+    """クエリの長さに応じて許容する編集距離 (短い入力ほど厳しくする)"""
+    if len(query) <= 2:
+        return 0
+    if len(query) <= 5:
+        return min(1, max_edit_distance)
+    return max_edit_distance
+
+
+class SymSpellIndex:
+    """SymSpell 方式の削除辞書による曖昧検索索引。
+
+    登録する語ごとに、長さ prefix_length までの各先頭部分から最大 max_edit_distance 文字を
+    削除した文字列をすべて辞書に登録しておき、検索時はクエリ側の削除文字列と突き合わせて
+    候補を得る。先頭部分ごとに登録するので、入力途中の短いクエリでも候補が見つかる。
+    候補だけを編集距離で確かめるので、全件と距離を計算する必要がない。
+    薬単位で追加・削除でき、カタログの一部が変わっても全体を作り直さずに済む。
+    """
+
+    def __init__(self, max_edit_distance=2, prefix_length=7):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self._deletes = {}        # 削除文字列 -> 語の集合
+        self._term_drugs = {}     # 語 -> 薬の id の集合
+        self._drug_terms = {}     # 薬の id -> 語の集合
+        self._drug_names = {}     # 薬の id -> 表示用の薬名
+
+    def _delete_variants(self, text, max_distance):
+        variants = {text}
+        for distance in range(1, min(max_distance, len(text)) + 1):
+            for positions in combinations(range(len(text)), distance):
+                variants.add(''.join(ch for i, ch in enumerate(text) if i not in positions))
+        return variants
+
+    def _term_variants(self, term):
+        variants = set()
+        for length in range(1, min(self.prefix_length, len(term)) + 1):
+            variants |= self._delete_variants(term[:length], self.max_edit_distance)
+        return variants
+
+    def add(self, drug_id, drug_name, terms):
+        """薬を登録する (既に登録済みなら置き換える)"""
+        self.remove(drug_id)
+        terms = {term for term in terms if term}
+        self._drug_terms[drug_id] = terms
+        self._drug_names[drug_id] = drug_name
+        for term in terms:
+            drug_ids = self._term_drugs.get(term)
+            if drug_ids is None:
+                drug_ids = self._term_drugs[term] = set()
+                for variant in self._term_variants(term):
+                    self._deletes.setdefault(variant, set()).add(term)
+            drug_ids.add(drug_id)
+
+    def remove(self, drug_id):
+        terms = self._drug_terms.pop(drug_id, None)
+        self._drug_names.pop(drug_id, None)
+        if not terms:
+            return
+        for term in terms:
+            drug_ids = self._term_drugs[term]
+            drug_ids.discard(drug_id)
+            if drug_ids:
+                continue
+            # どの薬からも使われなくなった語は削除辞書からも取り除く
+            del self._term_drugs[term]
+            for variant in self._term_variants(term):
+                entries = self._deletes.get(variant)
+                if entries is not None:
+                    entries.discard(term)
+                    if not entries:
+                        del self._deletes[variant]
+
+    def lookup(self, query, limit=None):
+        """編集距離の近い順に [(距離, 薬名, 薬の id)] を返す。
+
+        語全体だけでなく語の先頭部分との距離も使うので、入力途中の薬名でも候補が出る。
+        """
+        max_distance = allowed_distance(query, self.max_edit_distance)
+        candidate_terms = set()
+        for variant in self._delete_variants(query[:self.prefix_length], max_distance):
+            candidate_terms.update(self._deletes.get(variant, ()))
+
+        best = {}
+        for term in candidate_terms:
+            distance = prefix_edit_distance(query, term, max_distance)
+            if distance is None:
+                continue
+            for drug_id in self._term_drugs[term]:
+                if drug_id not in best or distance < best[drug_id]:
+                    best[drug_id] = distance
+
+        ranked = sorted((distance, self._drug_names[drug_id], drug_id) for drug_id, distance in best.items())
+        return ranked[:limit] if limit is not None else ranked
+
+    def __len__(self):
+        return len(self._drug_terms)
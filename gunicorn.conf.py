@@ -0,0 +1,48 @@
+# gunicorn の設定 (gunicorn は起動ディレクトリの gunicorn.conf.py を自動で読み込む)
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+
+# GUNICORN_PRELOAD=1 の場合、マスタープロセスでアプリを1回だけ読み込み (モジュールの読み込み・
+# テンプレートとカタログのウォームアップ)、ワーカーは fork で複製する。ワーカーの起動が速くなり、
+# 読み込んだカタログのメモリもワーカー間で共有される
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+
+def pre_fork(server, worker):
+    # preload 時にマスターで開いた DB 接続をワーカーに引き継がないよう、fork の前に閉じる
+    # (ワーカーは最初に DB を使うときに自分のプールを作る)
+    database = sys.modules.get('database')
+    if database is not None:
+        database.dispose_pool()
+
+
+# 各ワーカーの計測値 (/metrics) を合算するため、ワーカー間で共有するディレクトリを用意する
+# (HUP で設定を読み直したときも同じディレクトリを使い続けるよう、環境変数に設定する)
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='drug-app-metrics-')
+    os.environ['METRICS_DIR_IS_TEMPORARY'] = '1'
+
+
+def worker_exit(server, worker):
+    # 終了するワーカーの最後の計測値を書き出しておく
+    metrics = sys.modules.get('metrics')
+    if metrics is not None:
+        metrics.flush()
+
+
+def when_ready(server):
+    # child_exit (シグナルハンドラー) の中で読み込まずに済むよう、マスターで先に読み込んでおく
+    importlib.import_module('metrics')
+
+
+def child_exit(server, worker):
+    # 終了したワーカーの計測値を dead-<pid>.json に移す (カウンターは引き続き合算される)
+    sys.modules['metrics'].mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if os.environ.get('METRICS_DIR_IS_TEMPORARY') == '1':
+        shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
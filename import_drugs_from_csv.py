@@ -1,91 +1,52 @@
-import sqlite3
 import csv
+import hashlib
 import json
 import os 
-import psycopg2 
-import psycopg2.extras 
+import argparse
+import sys
+import time
+
+import drug_cache
+import drug_search
+import migrations
 
 # データベース接続のパス/URL設定
 DATABASE_URL = os.environ.get('DATABASE_URL') 
 
+# database と同じく、DATABASE_URL で選ばれたバックエンドのドライバだけを読み込む
+if DATABASE_URL:
+    import psycopg2
+    import psycopg2.extras
+else:
+    import sqlite3
+
 # ローカル開発用SQLiteのパス
 DATABASE_DIR_SQLITE = '.' 
 DATABASE_FILE_SQLITE = os.path.join(DATABASE_DIR_SQLITE, 'drug_data.db')
 
-# ★★★ データをPythonコード内に直接記述 (ご提供のCSV内容に基づく) ★★★
-EMBEDDED_DRUG_DATA = [
-    {'drug_name': 'オゼックス細粒15%', 'aliases': 'トスフロキサシントシル酸塩', 'type': '抗菌薬（ニューキノロン系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '軟骨障害のリスクがあるため、基本的に他に代替薬がない場合に限る', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.08, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 24.0},
-    {'drug_name': 'ワイドシリン細粒10%', 'aliases': 'アモキシシリン水和物100mg/g', 'type': '抗菌薬（ペニシリン系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3', 'notes': '空腹時でも可。しばしば下痢が副作用として出やすい。細菌性中耳炎などで高用量が使用されることあり。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.3, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 9.0},
-    {'drug_name': 'ワイドシリン細粒20%', 'aliases': 'アモキシシリン水和物200mg/g', 'type': '抗菌薬（ペニシリン系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3', 'notes': '細粒10%の半量で済むため、服薬量が少なくてすむ。小児に飲ませやすい。下痢に注意。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.15, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'メイアクトMS小児用細粒10%', 'aliases': 'セフジトレンピボキシル小児用細粒10％', 'type': '抗菌薬（第3世代セフェム系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3', 'notes': '食後投与推奨。湿疹などのアレルギーに注意。味が甘く、服用しやすい。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 6.0},
-    {'drug_name': 'タミフルドライシロップ3%', 'aliases': 'オセルタミビルリン酸塩ドライシロップ３％', 'type': '抗ウイルス薬（抗インフルエンザ）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '発症48時間以内の投与が有効。粉薬の計量ミスに注意。腸重積の報告あり、服用中は体調変化に注意。', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.133, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 2.66},
-    {'drug_name': 'クラリスドライシロップ10%', 'aliases': 'クラリスロマイシンドライシロップ10％', 'type': '抗菌薬（マクロライド系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3', 'notes': '味に苦味あり。CYP3A4阻害により薬物相互作用に注意。食後投与が望ましい。', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.15, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'ジスロマック細粒10%', 'aliases': 'アジスロマイシン細粒10％', 'type': '抗菌薬（マクロライド系）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '長時間作用型。服用期間は3日だが効果は7～10日持続。空腹時でも可、ただし胃腸症状に注意。\n2日目以降半量', 'usage_type': '内服', 'timing_options': '朝食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.1, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 5.0},
-    {'drug_name': 'カロナール細粒20%', 'aliases': 'アセトアミノフェン細粒20％', 'type': '解熱鎮痛薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3,4', 'notes': '解熱目的では38.5℃以上の発熱時に使用することが多い。使用間隔を空けずに連用すると肝機能障害のリスクがある。乳児でも使用可能で安全性が高いが、過量投与には十分注意する。坐薬との併用時には成分量の重複に注意する。苦味は少なく服用しやすい。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後,発熱時', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.0225, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'カロナール細粒50%', 'aliases': 'アセトアミノフェン細粒50％', 'type': '解熱鎮痛薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3,4', 'notes': '服用量を減らせるため、体重が重い児に適する。苦味が強くなることがあるため、飲みにくさに注意。少量で済むが誤投与時のリスクがやや上がる。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後,発熱時', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'カロナールシロップ2%', 'aliases': 'アセトアミノフェンシロップ2％', 'type': '解熱鎮痛薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2,3', 'notes': '乳児や粉薬を嫌がる児に適する。甘味があり飲みやすいが、糖分が多く虫歯リスクに注意。計量ミス防止のため、スポイトやシリンジを活用。冷蔵保存不要。', 'usage_type': '内服', 'timing_options': '朝夕食後,毎食後,発熱時', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.3, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 30.0},
-    {'drug_name': 'ザイザルシロップ0.05%', 'aliases': 'レボセチリジン塩酸塩シロップ0.05％', 'type': '抗アレルギー薬（第2世代抗ヒスタミン薬）', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 6, 'max_age_months': 191, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1,2', 'notes': '生後6ヵ月以上～1歳未満：1回2.5 mL（1.25 mg）を1日1回経口投与\n腎機能低下時は減量必要 。眠気は少ないが報告あり。季節性アレルギーでは発症前から使用継続が望ましい 。', 'usage_type': '内服', 'timing_options': '眠前,朝食後眠前', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"6-11":1.25, "12-95":2.5, "96-191":5.0}', 'max_daily_fixed_dose': 20.0},
-    {'drug_name': 'オノンドライシロップ 10％', 'aliases': 'プランルカスト水和物ドライシロップ10％', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': 18, 'max_age_months': 540, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '12 kg以上～18 kg未満        0.5 g（プランルカスト水和物として50 mg）\n18 kg以上～25 kg未満        0.7 g（プランルカスト水和物として70 mg）\n25 kg以上～35 kg未満        1.0 g（プランルカスト水和物として100 mg）\n35 kg以上～45 kg未満        1.4 g（プランルカスト水和物として140 mg）\n喘息合併・皮疹対応も可能。瓶・分包あり、服用しやすい。', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.07, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'ホクナリンテープ0.5mg', 'aliases': 'ツロブテロールテープ0.5 mg', 'type': '気管支拡張薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 0, 'max_age_months': 47, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '副作用として頻脈・振戦・発疹などあり。皮膚刺激やかぶれに注意し、貼付部位は毎日変える。貼付部位は胸部・背部・上腕部・下腹部のいずれか。入浴や発汗でも剥がれにくいが、貼付状態は確認する。β2刺激薬による中枢刺激症状（興奮、不眠など）にも注意が必要。貼り忘れに注意し、朝の貼付が一般的。', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': 'テープ', 'calculated_dose_unit': '枚', 'daily_dose_per_kg': None, 'daily_fixed_dose': 0.5, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'ホクナリンテープ1mg', 'aliases': 'ツロブテロールテープ1 mg', 'type': '気管支拡張薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 48, 'max_age_months': 119, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '副作用として頻脈・振戦・発疹などあり。皮膚刺激やかぶれに注意し、貼付部位は毎日変える。貼付部位は胸部・背部・上腕部・下腹部のいずれか。入浴や発汗でも剥がれにくいが、貼付状態は確認する。β2刺激薬による中枢刺激症状（興奮、不眠など）にも注意が必要。貼り忘れに注意し、朝の貼付が一般的。', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': 'テープ', 'calculated_dose_unit': '枚', 'daily_dose_per_kg': None, 'daily_fixed_dose': 1.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'ホクナリンテープ2mg', 'aliases': 'ツロブテロール2mg', 'type': '気管支拡張薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 120, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '副作用として頻脈・振戦・発疹などあり。皮膚刺激やかぶれに注意し、貼付部位は毎日変える。貼付部位は胸部・背部・上腕部・下腹部のいずれか。入浴や発汗でも剥がれにくいが、貼付状態は確認する。β2刺激薬による中枢刺激症状（興奮、不眠など）にも注意が必要。貼り忘れに注意し、朝の貼付が一般的。', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': 'テープ', 'calculated_dose_unit': '枚', 'daily_dose_per_kg': None, 'daily_fixed_dose': 2.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 2.0},
-    {'drug_name': 'ステロイド軟膏0.1%', 'aliases': None, 'type': 'ステロイド', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '患部に塗布', 'usage_type': '外用', 'timing_options': '入浴後', 'formulation_type': '軟膏', 'calculated_dose_unit': '本', 'daily_dose_per_kg': None, 'daily_fixed_dose': 1.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 10.0},
-    {'drug_name': 'アスベリンシロップ0.75%', 'aliases': None, 'type': '鎮咳薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': 'シロップ剤は乳児・幼児に適し、スポイト・シリンジ使用で正確な投与が可能。甘味があり飲みやすいが、糖分が多いため虫歯予防指導が必要。', 'usage_type': '内服', 'timing_options': '朝食後,昼食後,夕食後', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': None, 'daily_fixed_dose': 0.6, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 2.4},
-    {'drug_name': 'シングレア細粒4mg', 'aliases': 'モンテルカストナトリウム細粒4 mg「DSEP」', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 12, 'max_age_months': 71, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '味は甘く服用しやすい。夜間の気管支収縮を抑制。吸入ステロイドと併用されることが多い。まれに興奮・イライラ・不眠などの中枢神経症状に注意が必要。食物と混ぜる場合は水分量に注意し、速やかに服用する。6歳未満', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '細粒', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': None, 'daily_fixed_dose': 4.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'シングレアチュアブル錠5mg', 'aliases': 'モンテルカストナトリウム', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 72, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '飴状ではないため噛んでから飲み込むことを指導。歯に残るため、就寝前の歯磨きを忘れずに。OD錠ではない。6歳以上', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '錠', 'calculated_dose_unit': '錠', 'daily_dose_per_kg': None, 'daily_fixed_dose': 1.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'セフスパン小児用細粒10%', 'aliases': 'セフィキシムナトリウム細粒100 mg/g', 'type': '抗菌薬（第3世代セフェム系経口）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '味は比較的良好で、服用しやすい。セフェム系の中でも皮膚感染症や中耳炎などに適応。食事と一緒に服用することで吸収が良好になる。発疹や下痢などの副作用に注意。重篤なペニシリンアレルギー歴がある場合は慎重に使用する。製剤的にはメイアクトと同一成分。\n症状によって増減', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 7.2},
-    {'drug_name': 'ゾビラックス顆粒40%', 'aliases': 'アシクロビル顆粒40％', 'type': '抗ウイルス薬（ヘルペスウイルス類）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': 'できるだけ発疹出現から48時間以内に投与開始が効果的。腎排泄性であり、腎機能障害時は注意が必要。脱水防止も重要。甘味はあるが苦味が残ることもあり、服薬補助の工夫が必要。再発性単純疱疹の抑制には反復投与の必要性あり。', 'usage_type': '内服', 'timing_options': '毎食後眠前', 'formulation_type': '顆粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.2, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 20.0},
-    {'drug_name': 'カルボシステインシロップ5％', 'aliases': 'カルボシステインシロップ5%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': None, 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.6, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'カルボシステインドライシロップ50%', 'aliases': 'カルボシステインドライシロップ50%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgのお子様には標準として、1回0.6 g（カルボシステイン300 mg）を1日3回、総量1.8 g（成分900 mg）を投与します。症状が重い場合には1回0.7〜1.0 g（350〜500 mg）まで増量可ですが、1日総量はおおよそ2.1〜3.0 g（成分1,050〜1,500 mg）を超えない範囲としてください。重大副作用（TEN、肝機能障害、アナフィラキシーなど）や消化器症状にも注意し、異常時には速やかに対応をお願いします', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.06, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'アンブロキソール塩酸塩シロップ小児用0.3％', 'aliases': 'アンブロキソロール塩酸塩シロップ小児用0.3％', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgのお子様には、1回9 mL（アンブロキソール塩酸塩27 mg）を1日3回、総量約27 mL（27 g）を目安に用時溶解して投与します。一般的にはこれが標準投与量ですが、症状や耐性を鑑みて増減を行う場合は2〜4日ごとに状態を観察してください。過剰投与による副作用（下痢、腹痛、吐き気など）発生リスクがあるため、慎重に判断してください', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.9, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 27.0},
-    {'drug_name': 'アンブロキソール塩酸塩DS小児用1.5%', 'aliases': 'アンブロキソロール塩酸塩DS小児用1.5%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgの小児には、1回1.8 g（成分27 mg）を1日3回、総量5.4 g（成分81 mg）を用時に投与します。通常、この標準用量範囲内で十分な去痰効果が期待でき、増量は症状に応じて慎重にご判断ください。重大副作用（ショック、アナフィラキシー、皮膚粘膜眼症候群）発現の可能性があり、投与中は皮膚・呼吸状態に注意し、異常時には速やかに対応をお願いします', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.06, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 5.4},
-    {'drug_name': 'アスベリン散10%', 'aliases': 'チペピジンヒベンズ酸塩散10%', 'type': '鎮咳薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 0, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': None, 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"0-11":0.05, "12-47":0.18, "48-83":0.3, "84-999":0.9}', 'max_daily_fixed_dose': 1.2},
-    {'drug_name': '幼児用 PL 配合顆粒', 'aliases': 'サリチルアミド・アセトアミノフェン・無水カフェイン・プロメタジンメチレンジサリチル酸塩配合顆粒', 'type': '解熱鎮痛剤', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 143, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': '体重30 kg程度では、9～11歳相当として**1回3 g、1日4回（総量12 g／日）**が標準量です。ただし、アセトアミノフェンを含むため、重篤な肝障害リスクやサリチル酸系による出血傾向に注意し、同類の薬剤との併用を避けてください。2歳未満には禁忌となりますので、ご注意願います。', 'usage_type': '内服', 'timing_options': '毎食後眠前', 'formulation_type': '顆粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-59":4.0, "60-107":8.0, "108-143":12.0}', 'max_daily_fixed_dose': 13.0},
-    {'drug_name': 'アルピニー坐剤100mg', 'aliases': 'アセトアミノフェン坐剤100 mg', 'type': '解熱鎮痛剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '1回あたり注意。坐剤のため、個数計算必要', 'usage_type': '頓服', 'timing_options': '発熱時', 'formulation_type': '坐剤', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': 30.0, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1800.0},
-    {'drug_name': 'レボセチリジン塩酸塩ドライシロップ0.5％', 'aliases': 'レボセチリジン塩酸塩ドライシロップ0.5％', 'type': '抗アレルギー薬（第2世代抗ヒスタミン薬）', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 6, 'max_age_months': 191, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1,2', 'notes': '6ヵ月以上1歳未満の小児には1回0.25g（レボセチリジン塩酸塩として1.25mg）を1日1回、用時溶解して経口投与する', 'usage_type': '内服', 'timing_options': '眠前,朝食後眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"6-11":0.25, "12-95":0.5, "96-191":1.0}', 'max_daily_fixed_dose': 2.0},
-    {'drug_name': 'フェキソフェナジン塩酸塩DS5%', 'aliases': 'フェキソフェナジン塩酸塩DS5%', 'type': '第二世代抗ヒスタミン薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 60, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': None, 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"60-359":0.6, "360-999":1.2}', 'max_daily_fixed_dose': 2.5},
-    {'drug_name': 'アレグラ錠60mg', 'aliases': 'フェキソフェナジン塩酸塩錠60mg', 'type': '第二世代抗ヒスタミン薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 108, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': None, 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': '錠', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"108-155":60.0, "156-999":120.0}', 'max_daily_fixed_dose': 180.0},
-    {'drug_name': 'クラリチンドライシロップ1％', 'aliases': 'ロラタジンドライシロップ1%', 'type': '抗アレルギー薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 48, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': 'クラリチン®ドライシロップは1日1回で済む服用回数の少なさが小児にとって大きな利点です。また、甘味があり飲みやすく調製されており、粉薬が苦手なお子さんにも比較的受け入れられやすい剤形です。水で溶かして速やかに服用するよう保護者へも指導をお願いします。副作用としては眠気が少なく、学童期の集中力への影響も最小限ですが、長期連用時は効果の評価を行ってください', 'usage_type': '内服', 'timing_options': '夕食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"48-95":0.5, "96-999":1.0}', 'max_daily_fixed_dose': 1.1},
-    {'drug_name': 'メプチンシロップ5μg/ml', 'aliases': 'プロカテロール塩酸塩水和物シロップ5μg/mL', 'type': '気管支拡張薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '5ml以上は適宜確認して下さい\nメプチンシロップは1回5 mL×1〜2回/日とシンプルかつ用法が少なく、小児にとって服用しやすい点が大きな利点です。甘味がありすぎず、量も少なめなので嫌がらずに飲ませやすく、親御さんの管理もしやすいです。ただし、β₂刺激薬により動悸や振戦、頻脈の副作用が出やすいため、初回使用時や増量時には注意が必要です。使用中に心拍数の変化や振戦がある場合には、できるだけ少量からスタートするか、服用タイミングを調整するなど配慮をお願いします。使用が長引く場合には、喘息発作時の吸入リリーバー（短時間作用型β₂作動薬）の使用指導も併せて行ったほうが安心です。', 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.5, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 20.0},
-    {'drug_name': 'メプチンDS0.005%', 'aliases': 'プロカテロール塩酸塩水和物ドライシロップ0.005%', 'type': '気管支拡張薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': 'メプチンDSは、1回0.5 g（25 μg）を用時溶解で1～2回/日と、服薬回数と量がシンプルな点が小児にとって大きなメリットです。甘味があり飲みやすく、少量で済むため服薬を嫌がるお子様でも比較的受け入れやすい剤形です。ただしβ₂刺激薬の特性上、**初回投与時や増量時に動悸や振戦が現れることがあるため、少量から開始して状態をよく観察してください。特に心拍数の変化がある場合は間隔の調整や減量も検討を。使用が長期化する場合には、吸入ステロイド等との併用・吸入リリーバーの併用指導を併せて行うと安心です。', 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.05, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'メプチンエアー10μg吸入100回', 'aliases': 'プロカテロール塩酸塩水和物エアゾール10 μg吸入100回', 'type': '気管支拡張薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': None, 'usage_type': '頓服', 'timing_options': '発作時', 'formulation_type': 'キット', 'calculated_dose_unit': '回', 'daily_dose_per_kg': None, 'daily_fixed_dose': 4.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'ミヤBM細粒', 'aliases': '宮入菌末細粒40 mg/g', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.6, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'ラックビーR散', 'aliases': '耐性乳酸菌製剤', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '散', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.21, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'セルベックス細粒10%', 'aliases': 'テプレノン細粒10%', 'type': '防御因子増強薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'ビオフェルミン配合散', 'aliases': 'ビオフェルミン配合散', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '生菌剤ですので開封後の湿気に注意し、できるだけ早く使用してください。消化器症状が強い場合は、量を上限（2.16 g/10 kg/日）としながら経過を確認し、効果不十分な場合は診療科へご相談をおすすめします。', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '散', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.18, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 9.0},
-    {'drug_name': 'モビコール配合内用剤LD', 'aliases': 'マクロゴール4000塩化ナトリウム・炭酸水素ナトリウム・塩化カリウム混合製剤', 'type': '便秘症改善薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '効果発現には2日程度かかる目安です。増量は2日以上間隔をあけて行い、便の状態を確認しながら漸増してください。腹痛や下痢がみられた場合は速やかに減量や中止の検討をお願いします。水分摂取を十分に促してください。', 'usage_type': '内服', 'timing_options': '食後', 'formulation_type': '配合剤', 'calculated_dose_unit': '包', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-95":1.0, "96-155":2.0, "156-999":2.0}', 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'モビコール配合内用剤HD', 'aliases': 'マクロゴール4000塩化ナトリウム・炭酸水素ナトリウム・塩化カリウム混合製剤', 'type': '便秘症改善薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': None, 'usage_type': '内服', 'timing_options': '食後', 'formulation_type': '配合剤', 'calculated_dose_unit': '包', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-95":1.0, "96-155":1.0, "156-999":1.0}', 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'ナウゼリンドライシロップ1%', 'aliases': 'ドンペリドンドライシロップ1%', 'type': '抗ドパミン薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '小児では1日1.0〜2.0 mg/kgを3回に分けて食前に服用しますが、6歳以上では最大1.0 mg/kg/日までとし、1日30 mgを超えないよう注意ください。特に乳幼児には錐体外路症状や意識障害のリスクがありますので、3歳以下での長期連用（7日以上）は避けてください。副作用の発現時には減量または中止の検討をお願いします。', 'usage_type': '内服', 'timing_options': '食前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.002, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 0.03},
-    {'drug_name': 'シングレア細粒4mg', 'aliases': 'モンテルカストナトリウム細粒4 mg「DSEP」', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 12, 'max_age_months': 71, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '味は甘く服用しやすい。夜間の気管支収縮を抑制。吸入ステロイドと併用されることが多い。まれに興奮・イライラ・不眠などの中枢神経症状に注意が必要。食物と混ぜる場合は水分量に注意し、速やかに服用する。6歳未満', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '細粒', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': None, 'daily_fixed_dose': 4.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'シングレアチュアブル錠5mg', 'aliases': 'モンテルカストナトリウム', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 72, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '飴状ではないため噛んでから飲み込むことを指導。歯に残るため、就寝前の歯磨きを忘れずに。OD錠ではない。6歳以上', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '錠', 'calculated_dose_unit': '錠', 'daily_dose_per_kg': None, 'daily_fixed_dose': 1.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'セフスパン小児用細粒10%', 'aliases': 'セフィキシムナトリウム細粒100 mg/g', 'type': '抗菌薬（第3世代セフェム系経口）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '味は比較的良好で、服用しやすい。セフェム系の中でも皮膚感染症や中耳炎などに適応。食事と一緒に服用することで吸収が良好になる。発疹や下痢などの副作用に注意。重篤なペニシリンアレルギー歴がある場合は慎重に使用する。製剤的にはメイアクトと同一成分。\n症状によって増減', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 7.2},
-    {'drug_name': 'ゾビラックス顆粒40%', 'aliases': 'アシクロビル顆粒40％', 'type': '抗ウイルス薬（ヘルペスウイルス類）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': 'できるだけ発疹出現から48時間以内に投与開始が効果的。腎排泄性であり、腎機能障害時は注意が必要。脱水防止も重要。甘味はあるが苦味が残ることもあり、服薬補助の工夫が必要。再発性単純疱疹の抑制には反復投与の必要性あり。', 'usage_type': '内服', 'timing_options': '毎食後眠前', 'formulation_type': '顆粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.2, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 20.0},
-    {'drug_name': 'カルボシステインシロップ5％', 'aliases': 'カルボシステインシロップ5%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': None, 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.6, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'カルボシステインドライシロップ50%', 'aliases': 'カルボシステインドライシロップ50%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgのお子様には標準として、1回0.6 g（カルボシステイン300 mg）を1日3回、総量1.8 g（成分900 mg）を投与します。症状が重い場合には1回0.7〜1.0 g（350〜500 mg）まで増量可ですが、1日総量はおおよそ2.1〜3.0 g（成分1,050〜1,500 mg）を超えない範囲としてください。重大副作用（TEN、肝機能障害、アナフィラキシーなど）や消化器症状にも注意し、異常時には速やかに対応をお願いします', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.06, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'アンブロキソール塩酸塩シロップ小児用0.3％', 'aliases': 'アンブロキソロール塩酸塩シロップ小児用0.3％', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgのお子様には、1回9 mL（アンブロキソール塩酸塩27 mg）を1日3回、総量約27 mL（27 g）を目安に用時溶解して投与します。一般的にはこれが標準投与量ですが、症状や耐性を鑑みて増減を行う場合は2〜4日ごとに状態を観察してください。過剰投与による副作用（下痢、腹痛、吐き気など）発生リスクがあるため、慎重に判断してください', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.9, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 27.0},
-    {'drug_name': 'アンブロキソール塩酸塩DS小児用1.5%', 'aliases': 'アンブロキソロール塩酸塩DS小児用1.5%', 'type': '去痰薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '体重30 kgの小児には、1回1.8 g（成分27 mg）を1日3回、総量5.4 g（成分81 mg）を用時に投与します。通常、この標準用量範囲内で十分な去痰効果が期待でき、増量は症状に応じて慎重にご判断ください。重大副作用（ショック、アナフィラキシー、皮膚粘膜眼症候群）発現の可能性があり、投与中は皮膚・呼吸状態に注意し、異常時には速やかに対応をお願いします', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.06, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 5.4},
-    {'drug_name': 'アスベリン散10%', 'aliases': 'チペピジンヒベンズ酸塩散10%', 'type': '鎮咳薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 0, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': None, 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"0-11":0.05, "12-47":0.18, "48-83":0.3, "84-999":0.9}', 'max_daily_fixed_dose': 1.2},
-    {'drug_name': '幼児用 PL 配合顆粒', 'aliases': 'サリチルアミド・アセトアミノフェン・無水カフェイン・プロメタジンメチレンジサリチル酸塩配合顆粒', 'type': '解熱鎮痛剤', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 143, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': '体重30 kg程度では、9～11歳相当として**1回3 g、1日4回（総量12 g／日）**が標準量です。ただし、アセトアミノフェンを含むため、重篤な肝障害リスクやサリチル酸系による出血傾向に注意し、同類の薬剤との併用を避けてください。2歳未満には禁忌となりますので、ご注意願います。', 'usage_type': '内服', 'timing_options': '毎食後眠前', 'formulation_type': '顆粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-59":4.0, "60-107":8.0, "108-143":12.0}', 'max_daily_fixed_dose': 13.0},
-    {'drug_name': 'アルピニー坐剤100mg', 'aliases': 'アセトアミノフェン坐剤100 mg', 'type': '解熱鎮痛剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '1回あたり注意。坐剤のため、個数計算必要', 'usage_type': '頓服', 'timing_options': '発熱時', 'formulation_type': '坐剤', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': 30.0, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1800.0},
-    {'drug_name': 'レボセチリジン塩酸塩ドライシロップ0.5％', 'aliases': 'レボセチリジン塩酸塩ドライシロップ0.5％', 'type': '抗アレルギー薬（第2世代抗ヒスタミン薬）', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 6, 'max_age_months': 191, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1,2', 'notes': '6ヵ月以上1歳未満の小児には1回0.25g（レボセチリジン塩酸塩として1.25mg）を1日1回、用時溶解して経口投与する', 'usage_type': '内服', 'timing_options': '眠前,朝食後眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"6-11":0.25, "12-95":0.5, "96-191":1.0}', 'max_daily_fixed_dose': 2.0},
-    {'drug_name': 'フェキソフェナジン塩酸塩DS5%', 'aliases': 'フェキソフェナジン塩酸塩DS5%', 'type': '第二世代抗ヒスタミン薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 60, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': None, 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"60-359":0.6, "360-999":1.2}', 'max_daily_fixed_dose': 2.5},
-    {'drug_name': 'アレグラ錠60mg', 'aliases': 'フェキソフェナジン塩酸塩錠60mg', 'type': '第二世代抗ヒスタミン薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 108, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': None, 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': '錠', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"108-155":60.0, "156-999":120.0}', 'max_daily_fixed_dose': 180.0},
-    {'drug_name': 'クラリチンドライシロップ1％', 'aliases': 'ロラタジンドライシロップ1%', 'type': '抗アレルギー薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 48, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': 'クラリチン®ドライシロップは1日1回で済む服用回数の少なさが小児にとって大きな利点です。また、甘味があり飲みやすく調製されており、粉薬が苦手なお子さんにも比較的受け入れられやすい剤形です。水で溶かして速やかに服用するよう保護者へも指導をお願いします。副作用としては眠気が少なく、学童期の集中力への影響も最小限ですが、長期連用時は効果の評価を行ってください', 'usage_type': '内服', 'timing_options': '夕食後', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"48-95":0.5, "96-999":1.0}', 'max_daily_fixed_dose': 1.1},
-    {'drug_name': 'メプチンシロップ5μg/ml', 'aliases': 'プロカテロール塩酸塩水和物シロップ5μg/mL', 'type': '気管支拡張薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '5ml以上は適宜確認して下さい\nメプチンシロップは1回5 mL×1〜2回/日とシンプルかつ用法が少なく、小児にとって服用しやすい点が大きな利点です。甘味がありすぎず、量も少なめなので嫌がらずに飲ませやすく、親御さんの管理もしやすいです。ただし、β₂刺激薬により動悸や振戦、頻脈の副作用が出やすいため、初回使用時や増量時には注意が必要です。使用中に心拍数の変化や振戦がある場合には、できるだけ少量からスタートするか、服用タイミングを調整するなど配慮をお願いします。使用が長引く場合には、喘息発作時の吸入リリーバー（短時間作用型β₂作動薬）の使用指導も併せて行ったほうが安心です。', 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'シロップ', 'calculated_dose_unit': 'ml', 'daily_dose_per_kg': 0.5, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 20.0},
-    {'drug_name': 'メプチンDS0.005%', 'aliases': 'プロカテロール塩酸塩水和物ドライシロップ0.005%', 'type': '気管支拡張薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': 'メプチンDSは、1回0.5 g（25 μg）を用時溶解で1～2回/日と、服薬回数と量がシンプルな点が小児にとって大きなメリットです。甘味があり飲みやすく、少量で済むため服薬を嫌がるお子様でも比較的受け入れやすい剤形です。ただしβ₂刺激薬の特性上、**初回投与時や増量時に動悸や振戦が現れることがあるため、少量から開始して状態をよく観察してください。特に心拍数の変化がある場合は間隔の調整や減量も検討を。使用が長期化する場合には、吸入ステロイド等との併用・吸入リリーバーの併用指導を併せて行うと安心です。', 'usage_type': '内服', 'timing_options': '朝眠前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.05, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'メプチンエアー10μg吸入100回', 'aliases': 'プロカテロール塩酸塩水和物エアゾール10 μg吸入100回', 'type': '気管支拡張薬', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': None, 'usage_type': '頓服', 'timing_options': '発作時', 'formulation_type': 'キット', 'calculated_dose_unit': '回', 'daily_dose_per_kg': None, 'daily_fixed_dose': 4.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'ミヤBM細粒', 'aliases': '宮入菌末細粒40 mg/g', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.6, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'ラックビーR散', 'aliases': '耐性乳酸菌製剤', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '散', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.21, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'セルベックス細粒10%', 'aliases': 'テプレノン細粒10%', 'type': '防御因子増強薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '添付文書に小児の記載なし', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.5},
-    {'drug_name': 'ビオフェルミン配合散', 'aliases': 'ビオフェルミン配合散', 'type': '整腸剤', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '生菌剤ですので開封後の湿気に注意し、できるだけ早く使用してください。消化器症状が強い場合は、量を上限（2.16 g/10 kg/日）としながら経過を確認し、効果不十分な場合は診療科へご相談をおすすめします。', 'usage_type': '内服', 'timing_options': '毎食後', 'formulation_type': '散', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.18, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 9.0},
-    {'drug_name': 'モビコール配合内用剤LD', 'aliases': 'マクロゴール4000塩化ナトリウム・炭酸水素ナトリウム・塩化カリウム混合製剤', 'type': '便秘症改善薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '効果発現には2日程度かかる目安です。増量は2日以上間隔をあけて行い、便の状態を確認しながら漸増してください。腹痛や下痢がみられた場合は速やかに減量や中止の検討をお願いします。水分摂取を十分に促してください。', 'usage_type': '内服', 'timing_options': '食後', 'formulation_type': '配合剤', 'calculated_dose_unit': '包', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-95":1.0, "96-155":2.0, "156-999":2.0}', 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'モビコール配合内用剤HD', 'aliases': 'マクロゴール4000塩化ナトリウム・炭酸水素ナトリウム・塩化カリウム混合製剤', 'type': '便秘症改善薬', 'dosage_unit': 'age', 'dose_per_kg': None, 'min_age_months': 36, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': None, 'usage_type': '内服', 'timing_options': '食後', 'formulation_type': '配合剤', 'calculated_dose_unit': '包', 'daily_dose_per_kg': None, 'daily_fixed_dose': None, 'daily_dose_age_specific': '{"36-95":1.0, "96-155":1.0, "156-999":1.0}', 'max_daily_fixed_dose': 3.0},
-    {'drug_name': 'ナウゼリンドライシロップ1%', 'aliases': 'ドンペリドンドライシロップ1%', 'type': '抗ドパミン薬', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '3', 'notes': '小児では1日1.0〜2.0 mg/kgを3回に分けて食前に服用しますが、6歳以上では最大1.0 mg/kg/日までとし、1日30 mgを超えないよう注意ください。特に乳幼児には錐体外路症状や意識障害のリスクがありますので、3歳以下での長期連用（7日以上）は避けてください。副作用の発現時には減量または中止の検討をお願いします。', 'usage_type': '内服', 'timing_options': '食前', 'formulation_type': 'ドライシロップ', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.002, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 0.03},
-    {'drug_name': 'シングレア細粒4mg', 'aliases': 'モンテルカストナトリウム細粒4 mg「DSEP」', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 12, 'max_age_months': 71, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '味は甘く服用しやすい。夜間の気管支収縮を抑制。吸入ステロイドと併用されることが多い。まれに興奮・イライラ・不眠などの中枢神経症状に注意が必要。食物と混ぜる場合は水分量に注意し、速やかに服用する。6歳未満', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '細粒', 'calculated_dose_unit': 'mg', 'daily_dose_per_kg': None, 'daily_fixed_dose': 4.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 4.0},
-    {'drug_name': 'シングレアチュアブル錠5mg', 'aliases': 'モンテルカストナトリウム', 'type': '抗アレルギー薬（ロイコトリエン受容体拮抗薬）', 'dosage_unit': 'fixed', 'dose_per_kg': None, 'min_age_months': 72, 'max_age_months': 999, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '1', 'notes': '飴状ではないため噛んでから飲み込むことを指導。歯に残るため、就寝前の歯磨きを忘れずに。OD錠ではない。6歳以上', 'usage_type': '内服', 'timing_options': '眠前', 'formulation_type': '錠', 'calculated_dose_unit': '錠', 'daily_dose_per_kg': None, 'daily_fixed_dose': 1.0, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 1.0},
-    {'drug_name': 'セフスパン小児用細粒10%', 'aliases': 'セフィキシムナトリウム細粒100 mg/g', 'type': '抗菌薬（第3世代セフェム系経口）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '2', 'notes': '味は比較的良好で、服用しやすい。セフェム系の中でも皮膚感染症や中耳炎などに適応。食事と一緒に服用することで吸収が良好になる。発疹や下痢などの副作用に注意。重篤なペニシリンアレルギー歴がある場合は慎重に使用する。製剤的にはメイアクトと同一成分。\n症状によって増減', 'usage_type': '内服', 'timing_options': '朝夕食後', 'formulation_type': '細粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.09, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 7.2},
-    {'drug_name': 'ゾビラックス顆粒40%', 'aliases': 'アシクロビル顆粒40％', 'type': '抗ウイルス薬（ヘルペスウイルス類）', 'dosage_unit': 'kg', 'dose_per_kg': None, 'min_age_months': None, 'max_age_months': None, 'dose_age_specific': None, 'fixed_dose': None, 'daily_frequency': '4', 'notes': 'できるだけ発疹出現から48時間以内に投与開始が効果的。腎排泄性であり、腎機能障害時は注意が必要。脱水防止も重要。甘味はあるが苦味が残ることもあり、服薬補助の工夫が必要。再発性単純疱疹の抑制には反復投与の必要性あり。', 'usage_type': '内服', 'timing_options': '毎食後眠前', 'formulation_type': '顆粒', 'calculated_dose_unit': 'g', 'daily_dose_per_kg': 0.2, 'daily_fixed_dose': None, 'daily_dose_age_specific': None, 'max_daily_fixed_dose': 20.0}
+# 既定で取り込むCSVファイルと、1回の INSERT でまとめて送る行数
+DEFAULT_CSV_FILE = 'drugs_data.csv'
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+
+# 取り込み対象のカラム (drugs テーブルに存在しないカラムは取り込み時に除外する)
+IMPORT_COLUMNS = [
+    'drug_name', 'aliases', 'type', 'dosage_unit',
+    'dose_per_kg', 'min_age_months', 'max_age_months',
+    'dose_age_specific', 'fixed_dose',
+    'daily_dose_per_kg', 'daily_fixed_dose', 'daily_dose_age_specific',
+    'daily_frequency', 'notes', 'usage_type', 'timing_options', 'formulation_type',
+    'calculated_dose_unit',
+    'max_daily_dose_per_kg', 'max_daily_fixed_dose',
+    'drug_name_key', 'aliases_key'
 ]
+REQUIRED_COLUMNS = ('drug_name', 'dosage_unit')
+JSON_COLUMNS = ('dose_age_specific', 'daily_dose_age_specific')
+NUMERIC_COLUMNS = ('dose_per_kg', 'min_age_months', 'max_age_months', 'fixed_dose',
+                   'daily_dose_per_kg', 'daily_fixed_dose',
+                   'max_daily_dose_per_kg', 'max_daily_fixed_dose')
+
+# import_drugs_from_embedded_data() で取り込む内蔵の薬データ (ご提供のCSV内容に基づく)
+EMBEDDED_DRUG_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedded_drug_data.json')
 
 def get_db_connection_for_import():
     if DATABASE_URL:
@@ -96,13 +57,13 @@ def get_db_connection_for_import():
             os.makedirs(DATABASE_DIR)
         DATABASE_FILE = os.path.join(DATABASE_DIR, 'drug_data.db')
         conn = sqlite3.connect(DATABASE_FILE)
-
-    conn.row_factory = sqlite3.Row # SQLiteの場合のみ設定
+        conn.row_factory = sqlite3.Row # SQLiteの場合のみ設定
     return conn
 
 def clear_all_drugs_data():
     conn = None
     try:
+        migrations.ensure_schema()
         conn = get_db_connection_for_import()
         # カーソル作成。PostgreSQLの場合は psycopg2.extras.DictCursor を使用
         if DATABASE_URL:
@@ -111,6 +72,8 @@ def clear_all_drugs_data():
             cursor = conn.cursor()
 
         cursor.execute("DELETE FROM drugs")
+        # Webアプリの各ワーカーがキャッシュを読み直すようにカタログのバージョンを上げる
+        drug_cache.bump_version(cursor)
         conn.commit()
         print("既存の薬データを全て削除しました。")
     except Exception as e:
@@ -119,91 +82,290 @@ def clear_all_drugs_data():
         if conn:
             conn.close()
 
-# 引数から csv_filepath_or_data を受け取るのではなく、内蔵データを使用
-def import_drugs_from_embedded_data():
+def read_csv_rows(source=DEFAULT_CSV_FILE):
+    """CSVファイル (source が '-' の場合は標準入力) を1行ずつ辞書として返すジェネレーター"""
+    if source == '-':
+        yield from csv.DictReader(sys.stdin)
+        return
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def convert_row(row_num, row_dict, columns):
+    """CSV/内蔵データの1行を、columns の順に並べた INSERT 用の値のタプルに変換する。
+
+    JSON・数値の形式が不正な値は警告を出して None にする。必須項目が空の行は None を返す。
+    """
+    missing = [col for col in REQUIRED_COLUMNS if not (row_dict.get(col) or '').strip()]
+    if missing:
+        print(f"警告: 行 {row_num} のデータ '{row_dict.get('drug_name') or '不明な薬名'}' は必須項目 ({', '.join(missing)}) が空のためスキップしました。")
+        return None
+    name_key, aliases_key = drug_search.search_key_values(row_dict.get('drug_name'), row_dict.get('aliases'))
+    row_dict = dict(row_dict, drug_name_key=name_key, aliases_key=aliases_key)
+    data_to_insert = []
+    for col in columns:
+        value = row_dict.get(col)
+        if value == '':
+            value = None
+
+        if col in JSON_COLUMNS and value:
+            try:
+                value = json.dumps(json.loads(value))
+            except json.JSONDecodeError:
+                print(f"警告: 行 {row_num} で '{col}' のJSON形式が不正です: {value}")
+                value = None
+
+        if col in NUMERIC_COLUMNS and value is not None:
+            try:
+                value = float(value) if '.' in str(value) else int(value)
+            except ValueError:
+                print(f"警告: 行 {row_num} で '{col}' の数値形式が不正です: {value}")
+                value = None
+
+        if col == 'usage_type' and (value is None or value.strip() == ''):
+            value = '内服'
+
+        data_to_insert.append(value)
+    return tuple(data_to_insert)
+
+
+def row_hash(values):
+    """変換後の値から行のハッシュを計算する (差分同期で変更の有無を判定するため drugs.row_hash に保存する)"""
+    return hashlib.sha256(json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+def _upsert_query(columns):
+    column_list = ', '.join(columns)
+    updates = ', '.join(f"{col} = excluded.{col}" for col in columns if col != 'drug_name')
+    if DATABASE_URL:
+        values = 'VALUES %s'  # execute_values が複数行の VALUES に展開する
+    else:
+        values = f"VALUES ({', '.join(['?'] * len(columns))})"
+    return f"INSERT INTO drugs ({column_list}) {values} ON CONFLICT (drug_name) DO UPDATE SET {updates}"
+
+
+def _prepare_import(cursor):
+    """取り込むカラムのリストを返す (末尾は source_key と row_hash)。スキーマは事前に migrations.ensure_schema() で最新にしておく"""
+    existing_columns = migrations.table_columns(cursor, 'drugs')
+    columns = [col for col in IMPORT_COLUMNS if col in existing_columns]
+    skipped_columns = [col for col in IMPORT_COLUMNS if col not in existing_columns]
+    if skipped_columns:
+        print(f"警告: drugs テーブルにないカラムは取り込みません: {', '.join(skipped_columns)}")
+    return columns + ['source_key', 'row_hash']
+
+
+def _converted_rows(rows, columns, skipped_names=None):
+    """行を変換し、末尾に取り込み元のキー (薬名) と行のハッシュを付けた値のタプルを返すジェネレーター。
+
+    skipped_names を渡した場合は、不正なためスキップした行の薬名を追加する。
+    """
+    source_columns = columns[:-2]
+    for row_num, row_dict in enumerate(rows, start=1):
+        values = convert_row(row_num, row_dict, source_columns)
+        if values is not None:
+            yield values + (values[0], row_hash(values))
+        elif skipped_names is not None and row_dict.get('drug_name'):
+            skipped_names.add(row_dict['drug_name'])
+
+
+def _converted_batches(rows, columns, batch_size):
+    """行を変換しながら batch_size 件ずつのリストにまとめる。
+
+    同じバッチに同じ薬名が複数あると ON CONFLICT で同じ行を2回更新することになるため、
+    バッチ内では後に現れた行だけを残す (バッチをまたぐ場合も後の行で上書きされる)。
+    """
+    batch = {}
+    for values in _converted_rows(rows, columns):
+        batch.pop(values[0], None)
+        batch[values[0]] = values
+        if len(batch) >= batch_size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def _insert_rows(cursor, columns, rows):
+    if DATABASE_URL:
+        query = f"INSERT INTO drugs ({', '.join(columns)}) VALUES %s"
+        psycopg2.extras.execute_values(cursor, query, rows, page_size=max(len(rows), 1))
+    else:
+        query = f"INSERT INTO drugs ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+        cursor.executemany(query, rows)
+
+
+def bulk_import_drugs(rows, batch_size=IMPORT_BATCH_SIZE, replace=False):
+    """薬データを1つのトランザクションでまとめて取り込む (薬名が同じ既存の薬は上書きする)。
+
+    rows は辞書のイテラブル (ジェネレーター可) で、batch_size 件ずつ変換して
+    PostgreSQL では execute_values、SQLite では executemany で送る。
+    replace=True の場合は、取り込み前に既存の薬を全て削除する。
+    途中でエラーが起きた場合はロールバックし、DB は取り込み前の状態のまま残る。
+    """
     conn = None
+    start = time.monotonic()
+    imported = 0
     try:
+        migrations.ensure_schema()
         conn = get_db_connection_for_import()
-        if DATABASE_URL:
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        else:
-            cursor = conn.cursor()
+        cursor = conn.cursor()
+        columns = _prepare_import(cursor)
+        query = _upsert_query(columns)
 
-        columns = [
-            'drug_name', 'aliases', 'type', 'dosage_unit',
-            'dose_per_kg', 'min_age_months', 'max_age_months',
-            'dose_age_specific', 'fixed_dose',
-            'daily_dose_per_kg', 'daily_fixed_dose', 'daily_dose_age_specific',
-            'daily_frequency', 'notes', 'usage_type', 'timing_options', 'formulation_type',
-            'calculated_dose_unit',
-            'max_daily_dose_per_kg', 'max_daily_fixed_dose'
-        ]
-
-        insert_placeholders = ', '.join(['%s'] * len(columns)) if DATABASE_URL else ', '.join(['?'] * len(columns))
-        insert_query = f"INSERT INTO drugs ({','.join(columns)}) VALUES ({insert_placeholders})"
-
-        print("内蔵リストデータからデータをインポート中...")
-
-        csv_rows = EMBEDDED_DRUG_DATA
-
-        for row_num, row_dict in enumerate(csv_rows, start=1):
-            data_to_insert = []
-            for col in columns:
-                value = row_dict.get(col)
-
-                if col == 'dose_age_specific' and value:
-                    try:
-                        value = json.dumps(json.loads(value))
-                    except json.JSONDecodeError:
-                        print(f"警告: 行 {row_num} で '{col}' のJSON形式が不正です: {value}")
-                        value = None
-
-                if col == 'daily_dose_age_specific' and value:
-                    try:
-                        value = json.dumps(json.loads(value))
-                    except json.JSONDecodeError:
-                        print(f"警告: 行 {row_num} で '{col}' のJSON形式が不正です: {value}")
-                        value = None
-
-                if col in ['dose_per_kg', 'min_age_months', 'max_age_months', 'fixed_dose',
-                           'daily_dose_per_kg', 'daily_fixed_dose',
-                           'max_daily_dose_per_kg', 'max_daily_fixed_dose']:
-                    if value == '':
-                        value = None
-                    elif value is not None:
-                        try:
-                            value = float(value) if '.' in str(value) else int(value)
-                        except ValueError:
-                            print(f"警告: 行 {row_num} で '{col}' の数値形式が不正です: {value}")
-                            value = None
-
-                if col == 'usage_type' and (value is None or value.strip() == ''):
-                    value = '内服'
-
-                data_to_insert.append(value)
+        if replace:
+            cursor.execute("DELETE FROM drugs")
 
-            try:
-                cursor.execute(insert_query, tuple(data_to_insert))
-                print(f"行 {row_num} のデータ '{row_dict.get('drug_name', '不明な薬名')}' を挿入しました。")
-            except (sqlite3.IntegrityError, psycopg2.IntegrityError):
-                print(f"警告: 行 {row_num} のデータ '{row_dict.get('drug_name', '不明な薬名')}' は既に存在するためスキップしました。")
-            except Exception as e:
-                print(f"エラー: 行 {row_num} のデータ挿入中に問題が発生しました: {e} (データ: {row_dict})")
+        for batch in _converted_batches(rows, columns, batch_size):
+            if DATABASE_URL:
+                psycopg2.extras.execute_values(cursor, query, batch, page_size=len(batch))
+            else:
+                cursor.executemany(query, batch)
+            imported += len(batch)
+
+        # Webアプリの各ワーカーがキャッシュを読み直すようにカタログのバージョンを上げる
+        drug_cache.bump_version(cursor)
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"致命的なエラーが発生しました。取り込みを取り消しました: {e}")
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+    elapsed = time.monotonic() - start
+    rate = imported / elapsed if elapsed > 0 else 0
+    print(f"データインポートが完了しました: {imported} 件 / {elapsed:.2f} 秒 ({rate:.0f} 件/秒)")
+    return imported
 
-            conn.commit()
 
-        print("データインポートが完了しました。")
+def _print_sync_changes(label, names, max_names=20):
+    print(f"  {label}: {len(names)} 件")
+    for name in sorted(names)[:max_names]:
+        print(f"    - {name}")
+    if len(names) > max_names:
+        print(f"    ... 他 {len(names) - max_names} 件")
 
+
+def sync_drugs(rows, dry_run=False):
+    """取り込み元の行と DB の行をハッシュで比べ、変わった薬だけを1つのトランザクションで反映する。
+
+    取り込み元の行と DB の行は source_key (取り込み時の薬名) で対応付けるので、管理画面で
+    薬名を変えた薬も同じ薬として扱う。取り込み元にない薬は新規追加、ハッシュが異なる薬は
+    id を変えずに更新し、取り込み元から消えた薬は削除する。
+    管理画面 (/drugs API) で追加・編集された薬 (row_hash が未設定) は上書きも削除もせず、
+    取り込み元と食い違う場合は競合として表示するだけにする。取り込み元の行が不正でスキップされた薬も削除しない。
+    変更がなければ DB には書き込まず、カタログのバージョンも上げない。
+    dry_run=True の場合は変更内容を表示するだけで反映しない。
+    変更件数を {"inserted", "updated", "deleted", "conflicts"} で返す (エラー時は None)。
+    """
+    conn = None
+    start = time.monotonic()
+    try:
+        migrations.ensure_schema()
+        conn = get_db_connection_for_import()
+        cursor = conn.cursor()
+        columns = _prepare_import(cursor)
+        skipped_names = set()
+        source = {values[0]: values for values in _converted_rows(rows, columns, skipped_names)}
+
+        cursor.execute("SELECT id, drug_name, source_key, row_hash FROM drugs")
+        db_rows = cursor.fetchall()
+        db_names = {row[1] for row in db_rows}
+        current = {}
+        for drug_id, _, source_key, stored_hash in db_rows:
+            # 全件取り込みで同じキーの行が増えた場合は、取り込み元から入った (ハッシュのある) 行を優先する
+            if source_key is not None and (source_key not in current or current[source_key][1] is None):
+                current[source_key] = (drug_id, stored_hash)
+
+        inserts, updates, conflicts = [], [], []
+        for name, values in source.items():
+            if name not in current:
+                if name in db_names:
+                    conflicts.append(name)  # 管理画面で追加・改名された同名の薬がある
+                else:
+                    inserts.append(values)
+            elif current[name][1] is None:
+                conflicts.append(name)  # 管理画面で編集された薬は上書きしない
+            elif current[name][1] != values[-1]:
+                updates.append((values, current[name][0]))
+        deletes = [(drug_id, source_key) for source_key, (drug_id, stored_hash) in current.items()
+                   if source_key not in source and source_key not in skipped_names and stored_hash is not None]
+
+        print(f"差分同期{' (ドライラン)' if dry_run else ''}: 取り込み元 {len(source)} 件 / DB {len(db_rows)} 件")
+        _print_sync_changes('追加', [values[0] for values in inserts])
+        _print_sync_changes('更新', [values[0] for values, _ in updates])
+        _print_sync_changes('削除', [name for _, name in deletes])
+        if conflicts:
+            _print_sync_changes('競合 (管理画面で編集済みのため反映しません)', conflicts)
+        changes = {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes),
+                   "conflicts": len(conflicts)}
+
+        if dry_run or not (inserts or updates or deletes):
+            conn.rollback()
+        else:
+            p = '%s' if DATABASE_URL else '?'
+            if deletes:
+                cursor.executemany(f"DELETE FROM drugs WHERE id = {p}", [(drug_id,) for drug_id, _ in deletes])
+            if updates:
+                assignments = ', '.join(f"{col} = {p}" for col in columns)
+                cursor.executemany(
+                    f"UPDATE drugs SET {assignments} WHERE id = {p}",
+                    [values + (drug_id,) for values, drug_id in updates],
+                )
+            if inserts:
+                _insert_rows(cursor, columns, inserts)
+            # Webアプリの各ワーカーがキャッシュを読み直すようにカタログのバージョンを上げる
+            drug_cache.bump_version(cursor)
+            conn.commit()
     except Exception as e:
-        print(f"致命的なエラーが発生しました: {e}")
+        if conn:
+            conn.rollback()
+        print(f"致命的なエラーが発生しました。同期を取り消しました: {e}")
+        return None
     finally:
         if conn:
             conn.close()
 
+    elapsed_ms = (time.monotonic() - start) * 1000
+    if dry_run:
+        print(f"ドライランのため変更は反映していません ({elapsed_ms:.1f} ms)。")
+    elif inserts or updates or deletes:
+        print(f"差分同期が完了しました ({elapsed_ms:.1f} ms)。")
+    else:
+        print(f"変更はありませんでした ({elapsed_ms:.1f} ms)。")
+    return changes
+
+
+def import_drugs_from_csv(source=DEFAULT_CSV_FILE, batch_size=IMPORT_BATCH_SIZE, replace=False):
+    """CSVファイル (または '-' で標準入力) から薬データを取り込む"""
+    print(f"{'標準入力' if source == '-' else source} からデータをインポート中...")
+    return bulk_import_drugs(read_csv_rows(source), batch_size=batch_size, replace=replace)
+
+
+def import_drugs_from_embedded_data():
+    print("内蔵リストデータからデータをインポート中...")
+    with open(EMBEDDED_DRUG_DATA_FILE, encoding='utf-8') as f:
+        return bulk_import_drugs(json.load(f))
+
 
 if __name__ == "__main__":
     # このスクリプトは、Render の Web Service デプロイ後に、Render の Shell から実行することを想定
-    # ローカルでテストインポートしたい場合は、以下のコメントアウトを外す
-    # clear_all_drugs_data()
-    # import_drugs_from_embedded_data()
-    print("このファイルはRenderのShellから 'python -c \"from import_drugs_from_csv import clear_all_drugs_data, import_drugs_from_embedded_data; clear_all_drugs_data(); import_drugs_from_embedded_data()\"' で実行してください。")
\ No newline at end of file
+    # デプロイ時 (render.yaml の postBuild) は --sync で変わった薬だけを反映する
+    parser = argparse.ArgumentParser(description="薬データをCSVから取り込む")
+    parser.add_argument('source', nargs='?', help="取り込むCSVファイル ('-' で標準入力)")
+    parser.add_argument('--sync', action='store_true', help="差分だけを反映する (追加・更新・削除)")
+    parser.add_argument('--dry-run', action='store_true', help="--sync で反映せずに変更内容だけを表示する")
+    parser.add_argument('--replace', action='store_true', help="既存の薬を全て削除してから取り込む")
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help="1回の INSERT で送る行数")
+    args = parser.parse_args()
+
+    if args.sync or args.dry_run:
+        sync_drugs(read_csv_rows(args.source or DEFAULT_CSV_FILE), dry_run=args.dry_run)
+    elif args.source:
+        import_drugs_from_csv(args.source, batch_size=args.batch_size, replace=args.replace)
+    else:
+        print("このファイルはRenderのShellから 'python import_drugs_from_csv.py --sync drugs_data.csv' (変更内容の確認は --dry-run)、"
+              "'python import_drugs_from_csv.py drugs_data.csv' (全件入れ替えは --replace を付ける)、"
+              "または 'python -c \"from import_drugs_from_csv import clear_all_drugs_data, import_drugs_from_embedded_data; clear_all_drugs_data(); import_drugs_from_embedded_data()\"' で実行してください。")
@@ -0,0 +1,58 @@
+import json
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # orjson がない環境では標準の json モジュールで変換する
+    orjson = None
+
+# orjson のオプション: Flask の既定と同じくキーをソートし、str 以外のキーも許可する
+_ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def dumps_bytes(obj):
+    """obj を UTF-8 の JSON バイト列に変換する (orjson があれば orjson を使う)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default, option=_ORJSON_OPTIONS)
+    return dumps(obj).encode('utf-8')
+
+
+def dumps(obj):
+    """obj を JSON 文字列に変換する。日本語は \\uXXXX にエスケープせずそのまま出力する"""
+    if orjson is not None:
+        return dumps_bytes(obj).decode('utf-8')
+    return json.dumps(obj, default=DefaultJSONProvider.default, ensure_ascii=False,
+                      sort_keys=True, separators=(',', ':'))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify などで使う JSON 変換を orjson (なければ標準の json) に差し替える。
+
+    日本語をエスケープしないので、薬名の多いレスポンスは標準の設定の半分程度のサイズになる。
+    indent などの引数を指定された場合と、デバッグ時の整形出力は標準の処理に任せる。
+    """
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        started_at = time.perf_counter()
+        body = dumps_bytes(obj) + b'\n'
+        metrics.record_phase('serialize', time.perf_counter() - started_at)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,467 @@
+"""リクエスト数・レイテンシ・DBクエリなどの計測値を集計し、Prometheus のテキスト形式で出力する。
+
+計測値はスレッドごとの辞書 (シャード) に記録するため、記録時にロックを取らない。
+出力時に全スレッドのシャードを合算する。
+
+gunicorn で複数のワーカーを動かす場合は、METRICS_DIR (gunicorn.conf.py が一時ディレクトリを設定する)
+に各ワーカーが計測値を定期的に書き出し、/metrics を処理したワーカーが全ワーカー分を合算する。
+終了したワーカーのカウンターとヒストグラムは dead-<pid>.json に移して合算し続ける (ゲージは捨てる)。
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import request
+
+import database
+
+# 複数ワーカーの計測値を共有するディレクトリ (未設定の場合は、このプロセスの計測値だけを出力する)
+METRICS_DIR = os.environ.get('METRICS_DIR')
+# 各ワーカーが METRICS_DIR に計測値を書き出す間隔 (秒)。/metrics の他のワーカーの値はこの秒数だけ遅れることがある
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '5'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+_registry = {}
+_collectors = []
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry[name] = self
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, value=1, *labelvalues):
+        shard = _shard()
+        key = (self.name, labelvalues)
+        shard[key] = shard.get(key, 0) + value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        shard = _shard()
+        key = (self.name, labelvalues)
+        entry = shard.get(key)
+        if entry is None:
+            # バケットごとの件数 (累積ではない) と、最後の要素に合計値を持つ
+            entry = shard[key] = [0] * (len(self.buckets) + 2)
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+
+class Gauge(_Metric):
+    """register_collector の関数が出力時に値を返すゲージ。
+
+    複数ワーカーの値は aggregate に応じて合計 ('sum') または最大値 ('max') にまとめる。
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), aggregate='sum'):
+        super().__init__(name, documentation, labelnames)
+        self.aggregate = aggregate
+
+
+def register_collector(collector):
+    """出力時に呼び出して (メトリクス, ラベル値のタプル, 値) を返させる関数を登録する。
+
+    キャッシュやプールが自分で数えている累積値 (Counter) や、現在の状態 (Gauge) の出力に使う。
+    """
+    _collectors.append(collector)
+
+
+# --- スレッドごとのシャード ---
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def _reset_after_fork():
+    # preload 時にマスターで記録した値 (起動時のクエリなど) を各ワーカーで重複して数えないようにする
+    global _local, _shards
+    _local = threading.local()
+    _shards = []
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# --- 集計 ---
+def _empty_snapshot():
+    return {'counters': {}, 'histograms': {}, 'gauges': {}}
+
+
+def snapshot():
+    """このプロセスの計測値を {'counters', 'histograms', 'gauges'} の辞書にまとめる"""
+    data = _empty_snapshot()
+    counters, histograms = data['counters'], data['histograms']
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in list(shard.items()):
+            if isinstance(value, list):
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = list(value)
+                else:
+                    for i, count in enumerate(value):
+                        total[i] += count
+            else:
+                counters[key] = counters.get(key, 0) + value
+    for collector in _collectors:
+        try:
+            samples = collector()
+        except Exception as e:
+            print(f"警告: 計測値の収集に失敗しました: {e}")
+            continue
+        for metric, labelvalues, value in samples:
+            target = data['gauges'] if metric.type == 'gauge' else counters
+            key = (metric.name, tuple(str(v) for v in labelvalues))
+            target[key] = target.get(key, 0) + value
+    return data
+
+
+def _merge(into, data, include_gauges=True):
+    for key, value in data['counters'].items():
+        into['counters'][key] = into['counters'].get(key, 0) + value
+    for key, value in data['histograms'].items():
+        total = into['histograms'].get(key)
+        if total is None:
+            into['histograms'][key] = list(value)
+        else:
+            for i, count in enumerate(value):
+                total[i] += count
+    if include_gauges:
+        for key, value in data['gauges'].items():
+            metric = _registry.get(key[0])
+            if key in into['gauges'] and metric is not None and metric.aggregate == 'max':
+                into['gauges'][key] = max(into['gauges'][key], value)
+            else:
+                into['gauges'][key] = into['gauges'].get(key, 0) + value
+
+
+# --- 複数ワーカーの計測値の共有 ---
+_flush_lock = threading.Lock()
+
+
+def _to_json(data):
+    return {kind: [[name, list(labels), value] for (name, labels), value in values.items()]
+            for kind, values in data.items()}
+
+
+def _from_json(raw):
+    data = _empty_snapshot()
+    for kind in data:
+        for name, labels, value in raw.get(kind, []):
+            data[kind][(name, tuple(labels))] = value
+    return data
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return _from_json(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_to_json(data), f)
+    os.replace(tmp_path, path)
+
+
+def _worker_file(pid):
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def flush(data=None):
+    """このプロセスの計測値 (data を渡した場合はその値) を METRICS_DIR に書き出す"""
+    if not METRICS_DIR:
+        return
+    try:
+        with _flush_lock:
+            _write(_worker_file(os.getpid()), snapshot() if data is None else data)
+    except OSError as e:
+        print(f"警告: 計測値を書き出せませんでした: {e}")
+
+
+_flusher_pid = None
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        flush()
+
+
+def _ensure_flusher():
+    """METRICS_DIR に定期的に書き出すスレッドを、プロセスごとに1つ起動する"""
+    global _flusher_pid
+    pid = os.getpid()
+    if not METRICS_DIR or _flusher_pid == pid:
+        return
+    with _flush_lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    threading.Thread(target=_flush_periodically, name='metrics-flusher', daemon=True).start()
+
+
+def mark_process_dead(pid):
+    """終了したワーカーの計測値を dead-<pid>.json に移す (gunicorn のマスターから呼び出す)。
+
+    シグナルハンドラーの中から呼ばれるため、ファイル名の変更だけで済ませる。
+    移したファイルはカウンターとヒストグラムだけを合算し、ゲージは捨てる。
+    """
+    if not METRICS_DIR:
+        return
+    try:
+        os.replace(_worker_file(pid), os.path.join(METRICS_DIR, f"dead-{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def collect():
+    """全ワーカー (METRICS_DIR がない場合はこのプロセス) の計測値を合算する"""
+    data = snapshot()
+    if not METRICS_DIR:
+        return data
+    flush(data)
+    own_file = os.path.basename(_worker_file(os.getpid()))
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return data
+    for name in names:
+        if name == own_file or not name.endswith('.json'):
+            continue
+        other = _read(os.path.join(METRICS_DIR, name))
+        if other is not None:
+            _merge(data, other, include_gauges=not name.startswith('dead-'))
+    return data
+
+
+# --- Prometheus のテキスト形式 ---
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) or abs(value) >= 1e15 else str(int(value))
+    return str(value)
+
+
+def render():
+    """計測値を Prometheus のテキスト形式 (version 0.0.4) で返す"""
+    data = collect()
+    by_name = {}
+    for kind in ('counters', 'histograms', 'gauges'):
+        for (name, labels), value in data[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        metric = _registry.get(name)
+        if metric is None:
+            continue
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        for labels, value in sorted(by_name[name]):
+            if metric.type != 'histogram':
+                lines.append(f"{name}{_labels(metric.labelnames, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(float(bound))
+                bucket_labels = _labels(metric.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric.labelnames, labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_labels(metric.labelnames, labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+# --- Flask と DB の計測 ---
+HTTP_REQUESTS = Counter('drug_app_http_requests_total', "HTTP リクエスト数", ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('drug_app_http_request_duration_seconds', "HTTP リクエストの処理時間 (秒)",
+                         ('route', 'method'))
+DB_QUERIES = Counter('drug_app_db_queries_total', "実行した SQL の数", ('route',))
+DB_QUERY_SECONDS = Counter('drug_app_db_query_seconds_total', "SQL の実行時間の合計 (秒)", ('route',))
+DB_QUERIES_PER_REQUEST = Histogram('drug_app_http_request_db_queries', "1リクエストあたりの SQL の数",
+                                   ('route',), buckets=QUERY_COUNT_BUCKETS)
+
+# リクエスト外 (起動時のウォームアップなど) の SQL の route ラベル
+NO_ROUTE = '-'
+
+# Server-Timing ヘッダーを付けるか (SERVER_TIMING=0 で無効)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') != '0'
+# リクエストごとに処理時間の内訳を JSON で1行出力するか (REQUEST_TIMING_LOG=1 で有効)
+REQUEST_TIMING_LOG = os.environ.get('REQUEST_TIMING_LOG', '0') == '1'
+# 内訳を出力するのは、処理時間がこのミリ秒以上のリクエストだけにする
+REQUEST_TIMING_LOG_MIN_MS = float(os.environ.get('REQUEST_TIMING_LOG_MIN_MS', '0'))
+
+# Server-Timing に出力する処理の段階 (compute は合計から他の段階を引いた残り)
+PHASES = ('db_connect', 'db_query', 'age_bands', 'compute', 'serialize', 'compress')
+
+
+class _RequestTiming:
+    """1リクエストの開始時刻と、段階ごとの処理時間 (秒)"""
+
+    __slots__ = ('started_at', 'queries', 'phases')
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+
+def record_phase(phase, seconds):
+    """処理中のリクエストの phase の時間に seconds を加える (リクエストの外では何もしない)"""
+    timing = getattr(_local, 'request', None)
+    if timing is not None:
+        timing.phases[phase] += seconds
+
+
+class timed_phase:
+    """with ブロックの処理時間を、処理中のリクエストの phase に加えるコンテキストマネージャ"""
+
+    __slots__ = ('phase', 'started_at')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_phase(self.phase, time.perf_counter() - self.started_at)
+        return False
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else '(unmatched)'
+
+
+def _record_query(cursor, sql, params, seconds):
+    timing = getattr(_local, 'request', None)
+    if timing is None:
+        DB_QUERIES.inc(1, NO_ROUTE)
+        DB_QUERY_SECONDS.inc(seconds, NO_ROUTE)
+    else:
+        timing.queries += 1
+        timing.phases['db_query'] += seconds
+
+
+def _record_connect(seconds):
+    record_phase('db_connect', seconds)
+
+
+def _server_timing_header(timing, total):
+    parts = []
+    for phase, seconds in timing.phases.items():
+        if seconds or phase == 'compute':
+            part = f"{phase};dur={seconds * 1000:.2f}"
+            if phase == 'db_query':
+                part += f';desc="{timing.queries} queries"'
+            parts.append(part)
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+def _log_timing(timing, total, route, response):
+    if total * 1000 < REQUEST_TIMING_LOG_MIN_MS:
+        return
+    entry = {
+        'event': 'request_timing',
+        'method': request.method,
+        'path': request.path,
+        'route': route,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 2),
+        'db_queries': timing.queries,
+    }
+    entry.update({f"{phase}_ms": round(seconds * 1000, 2) for phase, seconds in timing.phases.items()})
+    print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+
+def _before_request():
+    _local.request = _RequestTiming()
+
+
+def _after_request(response):
+    timing = getattr(_local, 'request', None)
+    if timing is None:
+        return response
+    _local.request = None
+    total = time.perf_counter() - timing.started_at
+    # ストリーミングのレスポンスは、ヘッダーを返すまでの時間になる
+    timing.phases['compute'] = max(0.0, total - sum(timing.phases.values()))
+
+    route = _route_label()
+    method = request.method
+    HTTP_REQUESTS.inc(1, route, method, str(response.status_code))
+    HTTP_LATENCY.observe(total, route, method)
+    DB_QUERIES_PER_REQUEST.observe(timing.queries, route)
+    if timing.queries:
+        DB_QUERIES.inc(timing.queries, route)
+        DB_QUERY_SECONDS.inc(timing.phases['db_query'], route)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = _server_timing_header(timing, total)
+    if REQUEST_TIMING_LOG:
+        _log_timing(timing, total, route, response)
+    _ensure_flusher()
+    return response
+
+
+def init_app(app):
+    """リクエストごとの計測を登録する。
+
+    圧縮などの after_request の時間も含めるため、他の after_request より先に呼び出す
+    (after_request は登録と逆の順に実行される)。
+    処理時間の内訳は Server-Timing ヘッダーに付けるので、ブラウザの開発者ツールで確認できる。
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    database.add_query_listener(_record_query)
+    database.add_connect_listener(_record_connect)
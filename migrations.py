@@ -0,0 +1,449 @@
+import re
+import sys
+import unicodedata
+
+import database
+from database import DATABASE_URL
+
+# 複数のワーカー・デプロイ処理が同時にマイグレーションを実行しないようにする advisory lock のキー
+MIGRATION_LOCK_KEY = 7243001
+
+
+# --- 共通の処理 ---
+def table_columns(cursor, table_name):
+    """テーブルのカラム名の集合を返す"""
+    if DATABASE_URL:
+        cursor.execute(
+            f"SELECT column_name FROM information_schema.columns WHERE table_name = {database.PARAM}",
+            (table_name,),
+        )
+        return {row[0] for row in cursor.fetchall()}
+    cursor.execute(f"PRAGMA table_info({table_name})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def add_columns(cursor, table_name, columns):
+    """{カラム名: 型} のうち、まだないカラムを追加する"""
+    existing_columns = table_columns(cursor, table_name)
+    for column_name, column_type in columns.items():
+        if column_name not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+            print(f"カラム '{column_name}' が '{table_name}' テーブルに追加されました。")
+
+
+# --- マイグレーション (既存のDBにも適用できるよう、どれも何度実行しても同じ結果になるようにする) ---
+# 適用済みの DB と新しい DB が同じスキーマになるよう、各マイグレーションの処理は drug_cache・drug_search などの
+# 実行時の関数を呼ばず、追加した時点の SQL をここに書き写しておく (後から変えたい場合は新しいマイグレーションを足す)
+DRUGS_TABLE_COLUMNS_SQL = '''
+    drug_name TEXT NOT NULL UNIQUE,
+    aliases TEXT,
+    type TEXT,
+    dosage_unit TEXT NOT NULL, -- 'kg', 'age', 'fixed' (基本単位)
+
+    -- 1回あたり用量に関するフィールド (頓服や内服の1回量計算に使用)
+    single_dose_per_kg REAL,
+    single_fixed_dose REAL,
+    single_dose_age_specific TEXT, -- JSON形式: {"min_age-max_age": dose}
+
+    -- 1日総量に関するフィールド (主に内服薬の1日総量計算に使用)
+    daily_dose_per_kg REAL,
+    daily_fixed_dose REAL,
+    daily_dose_age_specific TEXT, -- JSON形式: {"min_age-max_age": dose}
+
+    -- 各薬で共通の用量情報
+    min_age_months INTEGER,
+    max_age_months INTEGER,
+
+    daily_frequency TEXT,       -- カンマ区切り例: "1,2,3"
+    notes TEXT,
+    usage_type TEXT DEFAULT '内服', -- '内服' or '頓服'
+    timing_options TEXT,        -- カンマ区切り例: "毎食後,必要時"
+    formulation_type TEXT,      -- 剤形 (例: 細粒, テープ, 坐剤)
+    calculated_dose_unit TEXT,  -- 最終的な計算結果の単位 (例: mg, ml, g, 個)
+
+    max_daily_fixed_dose REAL,  -- 絶対的な1日最大量 (例: カロナールは4000mg)
+    max_daily_times INTEGER     -- 頓服薬の1日最大服用回数 (例: 頓服は1日3回まで)
+'''
+
+
+def _id_column_sql():
+    return "id SERIAL PRIMARY KEY" if DATABASE_URL else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+
+
+def create_drugs_table(cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS drugs ({_id_column_sql()}, {DRUGS_TABLE_COLUMNS_SQL})")
+
+
+def add_legacy_columns(cursor):
+    """旧 add_*_column.py で追加していたカラムと、旧スキーマ (create_db.py) のカラムをそろえる"""
+    add_columns(cursor, 'drugs', {
+        # add_new_columns.py
+        'timing_options': "TEXT",
+        'formulation_type': "TEXT",
+        # add_daily_dose_columns.py
+        'daily_dose_per_kg': "REAL",
+        'daily_fixed_dose': "REAL",
+        'daily_dose_age_specific': "TEXT",
+        # add_max_daily_dose_columns.py
+        'max_daily_dose_per_kg': "REAL",
+        'max_daily_fixed_dose': "REAL",
+        # add_usage_type_column.py
+        'usage_type': "TEXT DEFAULT '内服'",
+        # add_calculated_dose_unit_column.py
+        'calculated_dose_unit': "TEXT",
+        # 旧スキーマのカラム (薬の追加API・インポートで使用)
+        'dose_per_kg': "REAL",
+        'dose_age_specific': "TEXT",
+        'fixed_dose': "REAL",
+        # 旧スキーマにない現行のカラム
+        'single_dose_per_kg': "REAL",
+        'single_fixed_dose': "REAL",
+        'single_dose_age_specific': "TEXT",
+        'max_daily_times': "INTEGER",
+    })
+
+
+def fix_sqlite_id_column(cursor):
+    """SQLite で 'id SERIAL PRIMARY KEY' として作られたテーブルを作り直し、id を自動採番にする。
+
+    SQLite の SERIAL は INTEGER の別名ではないため、id が採番されず NULL のまま登録されていた。
+    NULL の id には既存の id と重ならない番号を振る。
+    """
+    if DATABASE_URL:
+        return
+    cursor.execute("PRAGMA table_info(drugs)")
+    columns = cursor.fetchall()
+    id_column = next((row for row in columns if row[1] == 'id'), None)
+    if id_column is not None and id_column[2].upper() == 'INTEGER' and id_column[5]:
+        return
+
+    cursor.execute(f"CREATE TABLE drugs_new ({_id_column_sql()}, {DRUGS_TABLE_COLUMNS_SQL})")
+    new_columns = table_columns(cursor, 'drugs_new')
+    for row in columns:
+        if row[1] not in new_columns:
+            cursor.execute(f"ALTER TABLE drugs_new ADD COLUMN {row[1]} {row[2]}")
+    column_names = [row[1] for row in columns if row[1] != 'id']
+    column_list = ', '.join(column_names)
+    cursor.execute(f'''
+        INSERT INTO drugs_new (id, {column_list})
+        SELECT COALESCE(id, rowid + (SELECT COALESCE(MAX(id), 0) FROM drugs)), {column_list} FROM drugs
+    ''')
+    cursor.execute("DROP TABLE drugs")
+    cursor.execute("ALTER TABLE drugs_new RENAME TO drugs")
+    print("drugs テーブルの id を自動採番に変更しました。")
+
+
+def create_catalog_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO catalog_version (id, version)
+        SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM catalog_version WHERE id = 1)
+    ''')
+
+
+# マイグレーション 5 の時点の検索キーの正規化 (drug_search.normalize_search_key と同じ処理)
+_SEARCH_KEY_WHITESPACE_RE = re.compile(r'\s+')
+_SEARCH_KEY_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def _search_key(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = text.translate(_SEARCH_KEY_KATAKANA_TO_HIRAGANA)
+    return _SEARCH_KEY_WHITESPACE_RE.sub('', text)
+
+
+def add_search_key_columns(cursor):
+    """検索キーのカラムを追加し、キーが未設定の行を埋める"""
+    if DATABASE_URL:
+        cursor.execute("ALTER TABLE drugs ADD COLUMN IF NOT EXISTS drug_name_key TEXT")
+        cursor.execute("ALTER TABLE drugs ADD COLUMN IF NOT EXISTS aliases_key TEXT")
+    else:
+        existing_columns = table_columns(cursor, 'drugs')
+        for column_name in ('drug_name_key', 'aliases_key'):
+            if column_name not in existing_columns:
+                cursor.execute(f"ALTER TABLE drugs ADD COLUMN {column_name} TEXT")
+
+    cursor.execute("SELECT id, drug_name, aliases FROM drugs WHERE drug_name_key IS NULL OR aliases_key IS NULL")
+    missing = cursor.fetchall()
+    if missing:
+        p = database.PARAM
+        cursor.executemany(
+            f"UPDATE drugs SET drug_name_key = {p}, aliases_key = {p} WHERE id = {p}",
+            [(_search_key(row[1]), _search_key(row[2]), row[0]) for row in missing],
+        )
+        cursor.execute("UPDATE catalog_version SET version = version + 1 WHERE id = 1")
+        print(f"{len(missing)} 件の薬に検索キーを設定しました。")
+
+
+def create_search_indexes(cursor):
+    """部分一致検索用の索引 (PostgreSQL は pg_trgm の GIN 索引、SQLite は FTS5 trigram の仮想テーブル) を作る"""
+    if DATABASE_URL:
+        cursor.execute("SAVEPOINT search_indexes")
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("DROP INDEX IF EXISTS idx_drugs_drug_name_trgm")
+            cursor.execute("DROP INDEX IF EXISTS idx_drugs_aliases_trgm")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_drug_name_key_trgm ON drugs USING gin (drug_name_key gin_trgm_ops)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_drugs_aliases_key_trgm ON drugs USING gin (aliases_key gin_trgm_ops)")
+            cursor.execute("RELEASE SAVEPOINT search_indexes")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT search_indexes")
+            print(f"警告: pg_trgm の索引を作成できませんでした。索引なしで検索します: {e}")
+        return
+
+    # 以前の (正規化前の drug_name / aliases を索引にしていた) 仮想テーブルは作り直す
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'drugs_fts'")
+    existing = cursor.fetchone()
+    if existing and 'drug_name_key' not in existing[0]:
+        for trigger_name in ('drugs_fts_insert', 'drugs_fts_delete', 'drugs_fts_update'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+        cursor.execute("DROP TABLE drugs_fts")
+
+    import sqlite3  # SQLite のときだけ使う (database と同じく、選ばれたバックエンドのドライバだけを読み込む)
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS drugs_fts USING fts5(
+                drug_name_key, aliases_key, content='drugs', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"警告: FTS5 trigram の仮想テーブルを作成できませんでした。LIKE で検索します: {e}")
+        return
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS drugs_fts_insert AFTER INSERT ON drugs BEGIN
+            INSERT INTO drugs_fts(rowid, drug_name_key, aliases_key) VALUES (new.id, new.drug_name_key, new.aliases_key);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS drugs_fts_delete AFTER DELETE ON drugs BEGIN
+            INSERT INTO drugs_fts(drugs_fts, rowid, drug_name_key, aliases_key) VALUES ('delete', old.id, old.drug_name_key, old.aliases_key);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS drugs_fts_update AFTER UPDATE ON drugs BEGIN
+            INSERT INTO drugs_fts(drugs_fts, rowid, drug_name_key, aliases_key) VALUES ('delete', old.id, old.drug_name_key, old.aliases_key);
+            INSERT INTO drugs_fts(rowid, drug_name_key, aliases_key) VALUES (new.id, new.drug_name_key, new.aliases_key);
+        END
+    ''')
+    # 既存データを索引に取り込む (トリガー作成前に登録された行のため)
+    cursor.execute("INSERT INTO drugs_fts(drugs_fts) VALUES ('rebuild')")
+
+
+def add_row_hash_column(cursor):
+    """差分同期 (import_drugs_from_csv.py --sync) で使う行のハッシュ"""
+    add_columns(cursor, 'drugs', {'row_hash': "TEXT"})
+
+
+def _create_postgres_change_log_triggers(cursor):
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION record_drug_change() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO drug_changes (drug_id, version)
+            VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END, NULL)
+            ON CONFLICT (drug_id) DO UPDATE SET version = NULL;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION stamp_drug_changes() RETURNS trigger AS $$
+        BEGIN
+            UPDATE drug_changes SET version = NEW.version WHERE version IS NULL;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS drugs_record_change ON drugs")
+    cursor.execute('''
+        CREATE TRIGGER drugs_record_change AFTER INSERT OR UPDATE OR DELETE ON drugs
+        FOR EACH ROW EXECUTE PROCEDURE record_drug_change()
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS catalog_version_stamp_changes ON catalog_version")
+    cursor.execute('''
+        CREATE TRIGGER catalog_version_stamp_changes AFTER UPDATE ON catalog_version
+        FOR EACH ROW EXECUTE PROCEDURE stamp_drug_changes()
+    ''')
+
+
+def create_change_log(cursor):
+    """変更履歴 (drug_changes) のテーブルとトリガーを作り、既存の薬を現在のバージョンで登録する。
+
+    仕組みは drug_cache の「変更履歴」の説明を参照。
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS drug_changes (
+            drug_id INTEGER PRIMARY KEY,
+            version INTEGER -- NULL は bump_version() 前の未確定の変更
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_drug_changes_version ON drug_changes (version)")
+    if DATABASE_URL:
+        _create_postgres_change_log_triggers(cursor)
+    else:
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS drugs_record_{event.lower()} AFTER {event} ON drugs
+                BEGIN
+                    INSERT OR REPLACE INTO drug_changes (drug_id, version) VALUES ({row}.id, NULL);
+                END
+            ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS catalog_version_stamp_changes AFTER UPDATE ON catalog_version
+            BEGIN
+                UPDATE drug_changes SET version = NEW.version WHERE version IS NULL;
+            END
+        ''')
+    cursor.execute('''
+        INSERT INTO drug_changes (drug_id, version)
+        SELECT id, (SELECT version FROM catalog_version WHERE id = 1) FROM drugs WHERE true
+        ON CONFLICT (drug_id) DO NOTHING
+    ''')
+
+
+def recreate_change_log_triggers_with_upsert(cursor):
+    """変更履歴のトリガーを作り直す。
+
+    SQLite のトリガー内の INSERT OR REPLACE は外側の文の競合処理で上書きされ、インポートの
+    INSERT ... ON CONFLICT DO UPDATE から呼ばれると UNIQUE 制約違反になるため、UPSERT で書く。
+    """
+    if DATABASE_URL:
+        _create_postgres_change_log_triggers(cursor)
+        return
+    for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+        cursor.execute(f"DROP TRIGGER IF EXISTS drugs_record_{event.lower()}")
+        cursor.execute(f'''
+            CREATE TRIGGER drugs_record_{event.lower()} AFTER {event} ON drugs
+            BEGIN
+                INSERT INTO drug_changes (drug_id, version) VALUES ({row}.id, NULL)
+                ON CONFLICT (drug_id) DO UPDATE SET version = NULL;
+            END
+        ''')
+    cursor.execute("DROP TRIGGER IF EXISTS catalog_version_stamp_changes")
+    cursor.execute('''
+        CREATE TRIGGER catalog_version_stamp_changes AFTER UPDATE ON catalog_version
+        BEGIN
+            UPDATE drug_changes SET version = NEW.version WHERE version IS NULL;
+        END
+    ''')
+
+
+def add_source_key_column(cursor):
+    """差分同期で取り込み元の行と DB の行を対応付けるキー (取り込み元の薬名)。
+
+    管理画面で薬名が変わっても同じ行として扱えるよう、取り込み時の薬名を別に保存する。
+    既に取り込み済みの行 (row_hash がある行) は現在の薬名をキーにする。
+    """
+    add_columns(cursor, 'drugs', {'source_key': "TEXT"})
+    cursor.execute("UPDATE drugs SET source_key = drug_name WHERE source_key IS NULL AND row_hash IS NOT NULL")
+
+
+# (バージョン, 説明, 関数)。新しいマイグレーションは末尾に追加し、既存のものは変更しない
+MIGRATIONS = [
+    (1, "drugs テーブルを作成", create_drugs_table),
+    (2, "旧 add_*_column.py のカラムと旧スキーマのカラムを追加", add_legacy_columns),
+    (3, "SQLite の id を自動採番に修正", fix_sqlite_id_column),
+    (4, "カタログバージョンのテーブルを作成", create_catalog_version_table),
+    (5, "検索キーのカラムを追加", add_search_key_columns),
+    (6, "検索用の索引を作成", create_search_indexes),
+    (7, "行のハッシュのカラムを追加", add_row_hash_column),
+    (8, "差分同期用の変更履歴のテーブルとトリガーを作成", create_change_log),
+    (9, "変更履歴のトリガーを UPSERT で作り直す", recreate_change_log_triggers_with_upsert),
+    (10, "取り込み元のキーのカラムを追加", add_source_key_column),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# --- スキーマバージョン ---
+def _ensure_schema_version_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def current_version(cursor):
+    """適用済みのスキーマバージョンを返す (schema_version テーブルがなければ 0)"""
+    if DATABASE_URL:
+        cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    else:
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT MAX(version) FROM schema_version")
+    row = cursor.fetchone()
+    return row[0] or 0
+
+
+def _lock(cursor):
+    """マイグレーションのトランザクションを開始し、他のプロセスと排他する。
+
+    PostgreSQL ではトランザクション終了時に解放される advisory lock を、
+    SQLite では BEGIN IMMEDIATE で書き込みロックを取る。
+    """
+    if DATABASE_URL:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+    else:
+        cursor.execute("BEGIN IMMEDIATE")
+
+
+def migrate():
+    """未適用のマイグレーションを順に適用し、適用したバージョンのリストを返す。
+
+    全てのマイグレーションを1つのトランザクションで適用し、途中で失敗した場合は全て取り消す。
+    ロックを取った後にバージョンを読み直すので、同時に実行されても二重には適用されない。
+    """
+    applied = []
+    with database.connection() as conn:
+        cursor = database.cursor(conn)
+        _lock(cursor)
+        _ensure_schema_version_table(cursor)
+        version = current_version(cursor)
+        for migration_version, description, migration in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            print(f"マイグレーション {migration_version}: {description}")
+            migration(cursor)
+            p = database.PARAM
+            cursor.execute(
+                f"INSERT INTO schema_version (version, description) VALUES ({p}, {p})",
+                (migration_version, description),
+            )
+            applied.append(migration_version)
+        conn.commit()
+    return applied
+
+
+def ensure_schema():
+    """スキーマが最新かを確認し、古ければマイグレーションを適用する (ワーカー起動時に呼び出す)。
+
+    最新であればバージョンを1回読むだけで済む。
+    """
+    with database.connection() as conn:
+        version = current_version(database.cursor(conn))
+    if version >= LATEST_VERSION:
+        return []
+    return migrate()
+
+
+if __name__ == "__main__":
+    # デプロイ時 (render.yaml の postBuild) に実行する。--status の場合は適用状況だけを表示する
+    if '--status' in sys.argv[1:]:
+        with database.connection() as conn:
+            version = current_version(database.cursor(conn))
+        print(f"スキーマバージョン: {version} (最新: {LATEST_VERSION})")
+    else:
+        applied = migrate()
+        if applied:
+            print(f"マイグレーションを適用しました: {', '.join(map(str, applied))} (現在のバージョン: {LATEST_VERSION})")
+        else:
+            print(f"スキーマは最新です (バージョン {LATEST_VERSION})。")
@@ -1,13 +1,128 @@
 import tkinter as tk
 from tkinter import ttk # ttkモジュールは、よりモダンな見た目のウィジェットを提供します
-import sqlite3
-import json
+import dosage_engine
+from desktop_catalog import CatalogLoader
+
+# バックグラウンドで読み込んだカタログを確認する間隔 (ミリ秒)
+CATALOG_POLL_MS = 200
+NO_RESULTS_MESSAGE = "該当する薬が見つかりませんでした。"
+
+
+# --- 大量の項目を表示するリスト ---
+class VirtualListbox(ttk.Frame):
+    """表示されている行だけを Listbox に入れる、仮想化したリスト。
+
+    数万件の結果でも Listbox に入るのは height 行だけなので、絞り込みのたびの再描画が一瞬で終わる。
+    スクロールバー・マウスホイール・上下キーは全体の項目に対する位置で動かす。
+    項目が選択されると on_select(項目) を呼び出す。
+    """
+
+    def __init__(self, master, height=8, width=70, on_select=None):
+        super().__init__(master)
+        self.height = height
+        self.on_select = on_select
+        self.items = []
+        self.offset = 0
+        self.selected = None
+        self.placeholder = ""
+
+        self.listbox = tk.Listbox(self, height=height, width=width, exportselection=False, activestyle='none')
+        self.listbox.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S, tk.W))
+        self.columnconfigure(0, weight=1)
+
+        self.listbox.bind('<<ListboxSelect>>', self._on_listbox_select)
+        self.listbox.bind('<MouseWheel>', self._on_mouse_wheel)
+        self.listbox.bind('<Button-4>', lambda event: self.scroll_by(-3))  # Linux のホイール
+        self.listbox.bind('<Button-5>', lambda event: self.scroll_by(3))
+        self.listbox.bind('<Up>', lambda event: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda event: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda event: self._move_selection(-self.height))
+        self.listbox.bind('<Next>', lambda event: self._move_selection(self.height))
+
+    def set_items(self, items, placeholder=""):
+        """表示する項目を入れ替える。選択中の項目が新しい一覧にもあれば選択を残す"""
+        selected_item = self.selected_item()
+        self.items = items
+        self.placeholder = placeholder
+        self.selected = None
+        self.offset = 0
+        if selected_item is not None:
+            try:
+                self.selected = items.index(selected_item)
+            except ValueError:
+                pass
+            else:
+                self.offset = self._clamp(self.selected - self.height // 2)
+        self._render()
+
+    def selected_item(self):
+        if self.selected is None or self.selected >= len(self.items):
+            return None
+        return self.items[self.selected]
+
+    def scroll_by(self, rows):
+        self._scroll_to(self.offset + rows)
+        return 'break'
+
+    def _clamp(self, offset):
+        return max(0, min(offset, len(self.items) - self.height))
+
+    def _scroll_to(self, offset):
+        offset = self._clamp(offset)
+        if offset != self.offset:
+            self.offset = offset
+            self._render()
+
+    def _render(self):
+        self.listbox.delete(0, tk.END)
+        if not self.items:
+            if self.placeholder:
+                self.listbox.insert(tk.END, self.placeholder)
+            self.scrollbar.set(0.0, 1.0)
+            return
+        visible = self.items[self.offset:self.offset + self.height]
+        self.listbox.insert(tk.END, *visible)
+        if self.selected is not None and self.offset <= self.selected < self.offset + len(visible):
+            self.listbox.selection_set(self.selected - self.offset)
+            self.listbox.activate(self.selected - self.offset)
+        total = len(self.items)
+        self.scrollbar.set(self.offset / total, (self.offset + len(visible)) / total)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self._scroll_to(int(float(amount) * len(self.items)))
+        elif action == 'scroll':
+            self.scroll_by(int(amount) * (self.height if unit == 'pages' else 1))
+
+    def _on_mouse_wheel(self, event):
+        # Windows は 120 単位、macOS は 1 単位で delta が届く
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll_by(-step * 3)
+
+    def _select(self, index):
+        self.selected = index
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.height:
+            self.offset = index - self.height + 1
+        self._render()
+        if self.on_select is not None:
+            self.on_select(self.items[index])
+
+    def _move_selection(self, step):
+        if self.items:
+            current = self.selected if self.selected is not None else self.offset - 1 if step > 0 else self.offset
+            self._select(max(0, min(current + step, len(self.items) - 1)))
+        return 'break'
+
+    def _on_listbox_select(self, event):
+        selected_indices = self.listbox.curselection()
+        if not selected_indices or not self.items:
+            return
+        self._select(self.offset + selected_indices[0])
 
-# --- データベース関連関数（以前のスクリプトから抜粋） ---
-def get_db_connection():
-    conn = sqlite3.connect('drug_data.db')
-    conn.row_factory = sqlite3.Row # これにより、カラム名をキーとしてデータにアクセスできるようになります
-    return conn
 
 # --- メインアプリケーションクラス ---
 class PediatricDrugApp:
@@ -27,27 +142,23 @@ class PediatricDrugApp:
 
         # --- 薬名検索エリア ---
         ttk.Label(self.main_frame, text="薬名検索:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.drug_name_entry = ttk.Entry(self.main_frame, width=50)
+        self.search_var = tk.StringVar()
+        self.drug_name_entry = ttk.Entry(self.main_frame, width=50, textvariable=self.search_var)
         self.drug_name_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), pady=5)
-        # 後で予測検索（オートコンプリート）機能をここに追加します
 
         self.search_drug_button = ttk.Button(self.main_frame, text="薬を検索")
         self.search_drug_button.grid(row=0, column=2, sticky=tk.W, padx=5, pady=5)
         
-        # 検索結果を表示するリストボックス
+        # 検索結果を表示するリスト (表示されている行だけを描画する)
         ttk.Label(self.main_frame, text="検索結果:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.drug_listbox = tk.Listbox(self.main_frame, height=8, width=70)
-        self.drug_listbox.grid(row=1, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=5)
-        
-        # スクロールバー
-        self.listbox_scrollbar = ttk.Scrollbar(self.main_frame, orient=tk.VERTICAL, command=self.drug_listbox.yview)
-        self.listbox_scrollbar.grid(row=1, column=3, sticky=(tk.N, tk.S, tk.W))
-        self.drug_listbox.config(yscrollcommand=self.listbox_scrollbar.set)
+        self.drug_list = VirtualListbox(self.main_frame, height=8, width=70, on_select=self.on_drug_select)
+        self.drug_list.grid(row=1, column=1, columnspan=3, sticky=(tk.W, tk.E), pady=5)
 
 
         # --- 薬の種類で検索エリア ---
         ttk.Label(self.main_frame, text="薬の種類:").grid(row=2, column=0, sticky=tk.W, pady=5)
-        self.drug_type_combobox = ttk.Combobox(self.main_frame, width=47,
+        self.drug_type_var = tk.StringVar()
+        self.drug_type_combobox = ttk.Combobox(self.main_frame, width=47, textvariable=self.drug_type_var,
                                                 values=["解熱鎮痛剤", "抗生剤", "鎮咳薬", "去痰薬", "ステロイド", "その他"]) # サンプルでいくつか種類を定義
         self.drug_type_combobox.grid(row=2, column=1, sticky=(tk.W, tk.E), pady=5)
         self.search_type_button = ttk.Button(self.main_frame, text="種類で検索")
@@ -68,96 +179,82 @@ class PediatricDrugApp:
         self.result_text = tk.Text(self.main_frame, height=5, width=60, wrap=tk.WORD) # wrap=tk.WORD で単語単位で改行
         self.result_text.grid(row=5, column=1, columnspan=2, sticky=(tk.W, tk.E), pady=10)
 
-        # コピーボタン
+        # コピーボタンと、カタログの状態の表示
+        self.status_label = ttk.Label(self.main_frame, text="カタログを読み込んでいます…")
+        self.status_label.grid(row=6, column=1, sticky=tk.W, pady=5)
         self.copy_button = ttk.Button(self.main_frame, text="結果をコピー")
         self.copy_button.grid(row=6, column=1, sticky=tk.E, pady=5)
 
-        # --- イベントバインディング（後で関数を割り当てます） ---
+        # --- イベントバインディング ---
+        # 入力のたびにメモリ上のカタログで絞り込む (ボタンは即時に絞り込み直すためのもの)
         self.search_drug_button.config(command=self.search_drugs)
         self.search_type_button.config(command=self.search_by_type)
-        self.drug_listbox.bind('<<ListboxSelect>>', self.on_drug_select) # リストボックス選択時にイベントを発生
+        self.search_var.trace_add('write', lambda *args: self.schedule_filter())
+        self.drug_type_var.trace_add('write', lambda *args: self.schedule_filter())
         self.copy_button.config(command=self.copy_result_to_clipboard)
-
-        # 初期表示のために、すべての薬をリストボックスに表示
-        self.display_all_drugs()
-
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+
+        # カタログはバックグラウンドのスレッドで読み込み、読み込めたら一覧に反映する
+        self.catalog = None
+        self._filter_pending = None
+        self.catalog_loader = CatalogLoader()
+        self.catalog_loader.start()
+        self.root.after(CATALOG_POLL_MS, self.poll_catalog)
+
+
+    def poll_catalog(self):
+        """バックグラウンドで読み込んだカタログがあれば入れ替える (Tk のメインスレッドで定期的に実行する)"""
+        snapshot, error = self.catalog_loader.poll()
+        if snapshot is not None:
+            self.catalog = snapshot
+            # 種類の候補は、カタログに実際にある種類にする
+            self.drug_type_combobox.config(values=sorted(snapshot.names_by_type))
+            self.apply_filter()
+        if error:
+            self.status_label.config(text=error)
+        self.root.after(CATALOG_POLL_MS, self.poll_catalog)
+
+    def schedule_filter(self):
+        """続けて入力された文字は、まとめて1回の絞り込みにする"""
+        if self._filter_pending is None:
+            self._filter_pending = self.root.after_idle(self.apply_filter)
+
+    def apply_filter(self):
+        """薬名 (別名) と薬の種類の入力で、メモリ上のカタログを絞り込んで表示する"""
+        if self._filter_pending is not None:
+            self.root.after_cancel(self._filter_pending)
+            self._filter_pending = None
+        if self.catalog is None:
+            return
+        names = self.catalog.filter(self.search_var.get().strip(), self.drug_type_var.get().strip())
+        self.drug_list.set_items(names, placeholder=NO_RESULTS_MESSAGE)
+        self.status_label.config(text=f"{len(names)} 件 / 全 {len(self.catalog)} 件")
 
     def search_drugs(self):
-        """薬名（部分一致または別名）で薬を検索し、リストボックスに表示する"""
-        search_term = self.drug_name_entry.get().strip()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # drug_name または aliases に部分一致するものを検索
-        query = """
-            SELECT drug_name FROM drugs
-            WHERE drug_name LIKE ? OR aliases LIKE ?
-            ORDER BY drug_name
-        """
-        cursor.execute(query, (f'%{search_term}%', f'%{search_term}%'))
-        
-        results = cursor.fetchall()
-        conn.close()
-
-        self.drug_listbox.delete(0, tk.END) # 現在のリストをクリア
-        if results:
-            for row in results:
-                self.drug_listbox.insert(tk.END, row['drug_name'])
-        else:
-            self.drug_listbox.insert(tk.END, "該当する薬が見つかりませんでした。")
+        """薬名（部分一致または別名）で薬を検索し、リストに表示する"""
+        self.apply_filter()
 
     def search_by_type(self):
-        """薬の種類で薬を検索し、リストボックスに表示する"""
-        selected_type = self.drug_type_combobox.get().strip()
-        if not selected_type:
-            self.display_all_drugs() # 種類が選択されていなければ全件表示
-            return
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = "SELECT drug_name FROM drugs WHERE type = ? ORDER BY drug_name"
-        cursor.execute(query, (selected_type,))
-        
-        results = cursor.fetchall()
-        conn.close()
-
-        self.drug_listbox.delete(0, tk.END)
-        if results:
-            for row in results:
-                self.drug_listbox.insert(tk.END, row['drug_name'])
-        else:
-            self.drug_listbox.insert(tk.END, "該当する薬が見つかりませんでした。")
+        """薬の種類で薬を検索し、リストに表示する (種類が未選択なら全件)"""
+        self.apply_filter()
 
     def display_all_drugs(self):
-        """すべての薬をリストボックスに表示する"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT drug_name FROM drugs ORDER BY drug_name")
-        results = cursor.fetchall()
-        conn.close()
-
-        self.drug_listbox.delete(0, tk.END)
-        for row in results:
-            self.drug_listbox.insert(tk.END, row['drug_name'])
-
-
-    def on_drug_select(self, event):
-        """リストボックスで薬が選択されたときに用量を計算・表示する"""
-        selected_indices = self.drug_listbox.curselection()
-        if not selected_indices:
-            return
+        """入力をクリアして、すべての薬をリストに表示する"""
+        self.search_var.set("")
+        self.drug_type_var.set("")
+        self.apply_filter()
+
+    def close(self):
+        self.catalog_loader.stop()
+        self.root.destroy()
 
-        selected_drug_name = self.drug_listbox.get(selected_indices[0])
-        self.calculate_and_display_dosage(selected_drug_name)
+    def on_drug_select(self, drug_name):
+        """リストで薬が選択されたときに用量を計算・表示する"""
+        self.calculate_and_display_dosage(drug_name)
 
     def calculate_and_display_dosage(self, drug_name):
         """選択された薬、体重、年齢に基づいて用量を計算し、表示エリアに表示する"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM drugs WHERE drug_name = ?", (drug_name,))
-        drug_info = cursor.fetchone()
-        conn.close()
+        drug_info = self.catalog.get(drug_name) if self.catalog is not None else None
 
         self.result_text.delete(1.0, tk.END) # 結果表示エリアをクリア
 
@@ -171,50 +268,32 @@ class PediatricDrugApp:
         except ValueError:
             self.result_text.insert(tk.END, "体重または年齢の入力が不正です。数値を入力してください。")
             return
+        if patient_weight <= 0 or patient_age_months < 0:
+            self.result_text.insert(tk.END, "患者体重と年齢 (ヶ月) を入力してください。")
+            return
 
-        dosage_output = f"薬名: {drug_info['drug_name']}\n"
-        calculated_dose = None
+        # 用量の計算は Web アプリと同じ用量エンジンで行う
+        result, status = dosage_engine.rule_for(drug_info).calculate(patient_weight, patient_age_months)
+        if status != 200:
+            self.result_text.insert(tk.END, result['error'])
+            return
 
-        if drug_info['dosage_unit'] == 'kg':
-            if patient_weight > 0 and drug_info['dose_per_kg'] is not None:
-                calculated_dose = patient_weight * drug_info['dose_per_kg']
-                dosage_output += f"1回量: 約{calculated_dose:.3f}g\n"
-            else:
-                dosage_output += "1回量: 体重が入力されていないか、用量データがありません。\n"
-        elif drug_info['dosage_unit'] == 'age':
-            if patient_age_months >= 0 and drug_info['dose_age_specific']:
-                age_doses = json.loads(drug_info['dose_age_specific'])
-                found_dose = False
-                for age_range_str, dose in age_doses.items():
-                    min_age, max_age = map(int, age_range_str.split('-'))
-                    if min_age <= patient_age_months <= max_age:
-                        calculated_dose = dose
-                        dosage_output += f"1回量: 約{calculated_dose:.1f}ml (年齢基準)\n"
-                        found_dose = True
-                        break
-                if not found_dose:
-                    dosage_output += "1回量: この年齢に対する用量が見つかりません。\n"
-            else:
-                dosage_output += "1回量: 年齢が入力されていないか、年齢基準の用量データがありません。\n"
-        elif drug_info['dosage_unit'] == 'fixed':
-            if drug_info['fixed_dose'] is not None:
-                calculated_dose = drug_info['fixed_dose']
-                dosage_output += f"1回量: {calculated_dose}ml (固定用量)\n"
-            else:
-                dosage_output += "1回量: 固定用量データがありません。\n"
-        else:
-            dosage_output += "用量計算の基準が不明です。\n"
+        dosage_output = f"薬名: {result['drug_name']}\n"
+        dose_label = "1回量" if result['initial_usage_type'] == '頓服' else "1日量"
+        dosage_output += f"{dose_label}: 約{result['calculated_daily_dose_value']:.3f}{result['dose_unit']}\n"
 
         # 1日の投与回数の表示
-        if drug_info['daily_frequency']:
-            frequencies = drug_info['daily_frequency'].split(',')
-            freq_str = ", ".join([f"1日{f}回" for f in frequencies])
+        if result['daily_frequency_options']:
+            freq_str = ", ".join([f"1日{f}回" for f in result['daily_frequency_options']])
             dosage_output += f"1日の投与回数候補: {freq_str}\n"
         else:
             dosage_output += "1日の投与回数候補: 不明\n"
 
-        if drug_info['notes']:
-            dosage_output += f"備考: {drug_info['notes']}\n"
+        if result['timing_options']:
+            dosage_output += f"タイミング候補: {', '.join(result['timing_options'])}\n"
+
+        if result['notes']:
+            dosage_output += f"備考: {result['notes']}\n"
 
         self.result_text.insert(tk.END, dosage_output)
 
@@ -229,10 +308,11 @@ class PediatricDrugApp:
 
 # --- アプリケーションの実行 ---
 if __name__ == "__main__":
-    # データベースが作成されていることを確認
-    # create_db.py と insert_sample_data.py を先に実行しておく必要があります
-    # ここでは便宜上、get_db_connectionを呼んでいますが、DBが存在しないとエラーになります
-    # 最初に create_db.py と insert_sample_data.py を実行してください。
+    # カレントディレクトリの drug_data.db を使う。次のどちらかで先に用意しておく
+    #   - 本番のカタログの複製: python drug_sync.py <本番のURL> (DRUG_SYNC_URL を設定すると起動中も同期する)
+    #   - サンプルデータ: python create_db.py && python insert_sample_data.py
+    #     (旧スキーマの DB。dose_per_kg などの用量は1回量として計算する)
+    # DBが存在しない場合は、カタログを読み込めなかったことが画面下部に表示されます
 
     app_root = tk.Tk()
     app = PediatricDrugApp(app_root)
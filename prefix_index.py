@@ -0,0 +1,103 @@
+from bisect import bisect_left, insort
+
+# 語の種類 (同じ一致の種類なら、薬名 > 別名 > 成分名などのトークンの順に並べる)
+SOURCE_NAME = 0
+SOURCE_ALIAS = 1
+SOURCE_TOKEN = 2
+
+# 一致の種類
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+
+
+class PrefixIndex:
+    """正規化済みの語をソートした配列で保持し、二分探索で前方一致の語を引く入力補完用の索引。
+
+    (語, 語の種類, 薬の id) のタプルを1本のソート済みリストに並べる。クエリで始まる語は
+    リスト上で連続するので、bisect で先頭を見つけてから順に読むだけで済む。
+    入力1文字目のように一致する語が非常に多い場合に備え、読む件数は scan_limit で打ち切る。
+    """
+
+    def __init__(self, scan_limit=500):
+        self.scan_limit = scan_limit
+        self._entries = []        # (語, 語の種類, 薬の id) のソート済みリスト
+        self._drug_entries = {}   # 薬の id -> 登録したタプルのリスト
+        self._drug_names = {}     # 薬の id -> 表示用の薬名
+
+    @staticmethod
+    def _unique_entries(drug_id, terms):
+        # 同じ語が複数の種類で現れる場合は、優先度の高い種類だけを残す
+        best = {}
+        for term, source in terms:
+            if term and (term not in best or source < best[term]):
+                best[term] = source
+        return [(term, source, drug_id) for term, source in best.items()]
+
+    def bulk_load(self, drugs):
+        """(薬の id, 薬名, [(語, 語の種類)]) の並びをまとめて登録し、最後に1回だけソートする。
+
+        登録済みの薬は置き換える (古い語のタプルは配列から取り除く)。
+        """
+        loaded = {}
+        for drug_id, drug_name, terms in drugs:
+            loaded[drug_id] = self._unique_entries(drug_id, terms)
+            self._drug_names[drug_id] = drug_name
+        if any(drug_id in self._drug_entries for drug_id in loaded):
+            self._entries = [entry for entry in self._entries if entry[2] not in loaded]
+        self._drug_entries.update(loaded)
+        for entries in loaded.values():
+            self._entries.extend(entries)
+        self._entries.sort()
+
+    def add(self, drug_id, drug_name, terms):
+        """薬を1件登録する (既に登録済みなら置き換える)"""
+        self.remove(drug_id)
+        entries = self._unique_entries(drug_id, terms)
+        self._drug_entries[drug_id] = entries
+        self._drug_names[drug_id] = drug_name
+        for entry in entries:
+            insort(self._entries, entry)
+
+    def _remove_entries(self, drug_id):
+        entries = self._drug_entries.pop(drug_id, None)
+        self._drug_names.pop(drug_id, None)
+        return entries
+
+    def remove(self, drug_id):
+        for entry in self._remove_entries(drug_id) or ():
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def lookup(self, query, limit=None):
+        """前方一致する薬を [(一致の種類, 薬名, 薬の id)] で返す。
+
+        語がクエリと完全に一致する薬を先に、前方一致の薬を後に並べ、同じ一致の種類の中では
+        語の種類 (薬名 > 別名 > トークン)、語の短さ、薬名の順に並べる。
+        """
+        if not query:
+            return []
+        entries = self._entries
+        best = {}
+        i = bisect_left(entries, (query,))
+        end = min(len(entries), i + self.scan_limit)
+        while i < end:
+            term, source, drug_id = entries[i]
+            if not term.startswith(query):
+                break
+            rank = (term != query, source, len(term))
+            current = best.get(drug_id)
+            if current is None or rank < current:
+                best[drug_id] = rank
+            i += 1
+
+        ranked = sorted((rank, self._drug_names[drug_id], drug_id) for drug_id, rank in best.items())
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [
+            (MATCH_PREFIX if rank[0] else MATCH_EXACT, drug_name, drug_id)
+            for rank, drug_name, drug_id in ranked
+        ]
+
+    def __len__(self):
+        return len(self._drug_entries)
@@ -0,0 +1,203 @@
+"""本番環境で、指定したリクエストだけをプロファイルする。
+
+PROFILING=1 のときだけ有効になり、X-Profile ヘッダーまたは _profile クエリパラメーターに
+PROFILE_TOKEN と同じ値を付けたリクエストをプロファイルする (PROFILE_TOKEN が未設定の場合は 1 で有効)。
+無効な場合はフックを登録しないので、通常のリクエストの負担はない。
+
+    curl -H 'X-Profile: <token>' -X POST .../calculate_dosage -d ...
+    → レスポンスの X-Profile-Id に保存したファイル名が入る
+
+結果は PROFILE_DIR に保存し、新しい PROFILE_KEEP 件だけを残す。保存したプロファイルは
+/admin/profiles (一覧) と /admin/profiles/<name> (?format=text で pstats の要約) から同じトークンで取得できる。
+ストリーミングのレスポンス (用量早見表など) は、本文を送る前までの処理だけが対象になる。
+PROFILER=cprofile (既定) は pstats 形式 (.prof、snakeviz などで表示できる)、
+PROFILER=sampling はスタックを一定間隔で記録し、flamegraph.pl などで使える collapsed 形式 (.collapsed) で保存する。
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+PROFILING_ENABLED = os.environ.get('PROFILING', '0') == '1'
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILER = os.environ.get('PROFILER', 'cprofile')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('.', 'profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '20'))
+# サンプリングの間隔 (秒)。計算中のスレッドは GIL を sys.getswitchinterval() (5ms) ごとにしか手放さないため、
+# これより短くしても実際の間隔は縮まらない
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_PARAM = '_profile'
+PROFILE_EXTENSIONS = ('.prof', '.collapsed')
+
+_store_lock = threading.Lock()
+# cProfile は同時に1つしか有効にできないため (Python 3.12 以降)、実行中は他のリクエストをプロファイルしない
+_cprofile_lock = threading.Lock()
+
+
+def authorized(req):
+    """リクエストにプロファイルの指定 (正しいトークン) が付いているか"""
+    value = req.headers.get(PROFILE_HEADER) or req.args.get(PROFILE_QUERY_PARAM)
+    if not value:
+        return False
+    if PROFILE_TOKEN:
+        return hmac.compare_digest(value.encode('utf-8'), PROFILE_TOKEN.encode('utf-8'))
+    return value == '1'
+
+
+class SamplingProfiler:
+    """別スレッドから対象スレッドのスタックを一定間隔で記録する"""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename == __file__:
+                    # プロファイルの終了処理中のサンプルは記録しない
+                    stack = []
+                    break
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _profile_name():
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{os.getpid()}-{request.method}-{slug}"
+
+
+def _start_profile():
+    # プロファイルの一覧・取得のリクエスト自体はプロファイルしない
+    if request.path.startswith('/admin/profiles') or not authorized(request):
+        return
+    if PROFILER == 'sampling':
+        profile = SamplingProfiler(threading.get_ident())
+        profile.start()
+        extension = '.collapsed'
+    else:
+        if not _cprofile_lock.acquire(blocking=False):
+            g.profile_skipped = True
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        extension = '.prof'
+    g.profile = (profile, _profile_name() + extension)
+
+
+def _add_profile_header(response):
+    current = g.get('profile')
+    if current is not None:
+        response.headers['X-Profile-Id'] = current[1]
+    elif g.get('profile_skipped'):
+        response.headers['X-Profile-Id'] = 'skipped (another request is being profiled)'
+    return response
+
+
+def _finish_profile(exc):
+    current = g.pop('profile', None)
+    if current is None:
+        return
+    profile, name = current
+    if isinstance(profile, SamplingProfiler):
+        profile.stop()
+    else:
+        profile.disable()
+        _cprofile_lock.release()
+    try:
+        _store(profile, name)
+    except OSError as e:
+        print(f"警告: プロファイルを保存できませんでした: {e}")
+
+
+def _store(profile, name):
+    with _store_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        if isinstance(profile, SamplingProfiler):
+            profile.dump(os.path.join(PROFILE_DIR, name))
+        else:
+            profile.dump_stats(os.path.join(PROFILE_DIR, name))
+        # 古いプロファイルを消して、新しい PROFILE_KEEP 件だけを残す
+        for old in list_profiles()[PROFILE_KEEP:]:
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old['name']))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """保存済みのプロファイルを新しい順に返す"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(PROFILE_EXTENSIONS)]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        profiles.append({'name': name, 'size': stat.st_size, 'created_at': stat.st_mtime})
+    profiles.sort(key=lambda profile: (profile['created_at'], profile['name']), reverse=True)
+    return profiles
+
+
+def profile_path(name):
+    """保存済みのプロファイルのパスを返す (不正な名前や存在しない場合は None)"""
+    if os.path.basename(name) != name or not name.endswith(PROFILE_EXTENSIONS):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def summary_text(path, limit=40):
+    """pstats 形式のプロファイルを、累積時間の順に並べたテキストにする"""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def init_app(app):
+    """PROFILING=1 の場合だけ、プロファイル用のフックを登録する。
+
+    計測の開始をできるだけ早くするため、他の before_request より先に呼び出す。
+    """
+    if not PROFILING_ENABLED:
+        return
+    if not PROFILE_TOKEN:
+        print("警告: PROFILE_TOKEN が設定されていないため、X-Profile: 1 を付けた誰でもプロファイルを取得できます。")
+    app.before_request(_start_profile)
+    app.after_request(_add_profile_header)
+    app.teardown_request(_finish_profile)
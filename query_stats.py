@@ -0,0 +1,202 @@
+"""SQL の実行時間を文の形 (フィンガープリント) ごとに集計し、遅い SQL を記録する。
+
+database.cursor() のラッパーから全ての SQL の実行時間を受け取る。SLOW_QUERY_MS 以上かかった SQL は
+パラメーターの値を伏せてログに出力し、実行計画 (PostgreSQL は EXPLAIN (ANALYZE)、SQLite は
+EXPLAIN QUERY PLAN) を取得して保存する。集計は /admin/query_stats で確認できる (ワーカーごと)。
+/admin/query_stats には ADMIN_TOKEN と同じ値の X-Admin-Token ヘッダーが必要。
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from flask import has_request_context, request
+
+import database
+
+# これ以上かかった SQL を遅いクエリとして記録する (ミリ秒)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+# 遅いクエリの実行計画を取得するか (SLOW_QUERY_EXPLAIN=0 で無効)
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+# 同じ形の SQL の実行計画を取り直すまでの秒数 (遅い SQL を何度も二重に実行しないため)
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', '300'))
+# 直近の遅いクエリを保持する件数
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '50'))
+# 集計する SQL の形の最大数 (超えた場合は最も長く使われていないものから捨てる)
+QUERY_STATS_MAX_FINGERPRINTS = int(os.environ.get('QUERY_STATS_MAX_FINGERPRINTS', '500'))
+
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?(?![\w$])")
+_PLACEHOLDER_RE = re.compile(r"%s|\?")
+_VALUES_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE_RE = re.compile(r"^(?:SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+_READ_ONLY_RE = re.compile(r"^(?:SELECT|WITH)\b(?!.*\b(?:INSERT|UPDATE|DELETE)\b)", re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """SQL からリテラルとプレースホルダーを ? に置き換え、空白をまとめた文の形を返す"""
+    text = _STRING_LITERAL_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = _PLACEHOLDER_RE.sub('?', text)
+    text = _VALUES_LIST_RE.sub('(...)', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def redact_params(params):
+    """ログに出すパラメーターを、値を伏せた型名だけにする (患者情報などを残さないため)"""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    if len(params) > 20:  # executemany の行の一覧など
+        return [f"{len(params)} 件"]
+    return [type(value).__name__ for value in params]
+
+
+class _StatementStats:
+    __slots__ = ('calls', 'total_seconds', 'max_seconds', 'slow_calls', 'last_plan', 'explained_at')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow_calls = 0
+        self.last_plan = None
+        self.explained_at = None
+
+
+class QueryStats:
+    """フィンガープリントごとの実行回数・時間と、直近の遅いクエリ"""
+
+    def __init__(self, max_fingerprints=QUERY_STATS_MAX_FINGERPRINTS, slow_log_size=SLOW_QUERY_LOG_SIZE):
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._statements = OrderedDict()
+        self._slow_log = deque(maxlen=slow_log_size)
+
+    def record(self, sql_fingerprint, seconds):
+        """実行結果を集計し、実行計画を取得すべき遅いクエリなら True を返す"""
+        slow = seconds * 1000 >= SLOW_QUERY_MS
+        with self._lock:
+            stats = self._statements.get(sql_fingerprint)
+            if stats is None:
+                stats = self._statements[sql_fingerprint] = _StatementStats()
+                while len(self._statements) > self.max_fingerprints:
+                    self._statements.popitem(last=False)
+            else:
+                self._statements.move_to_end(sql_fingerprint)
+            stats.calls += 1
+            stats.total_seconds += seconds
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+            if not slow:
+                return False
+            stats.slow_calls += 1
+            now = time.monotonic()
+            if stats.explained_at is not None and now - stats.explained_at < SLOW_QUERY_EXPLAIN_INTERVAL:
+                return False
+            stats.explained_at = now
+            return True
+
+    def add_slow_query(self, entry, sql_fingerprint, plan):
+        with self._lock:
+            self._slow_log.append(entry)
+            stats = self._statements.get(sql_fingerprint)
+            if stats is not None and plan is not None:
+                stats.last_plan = plan
+
+    def snapshot(self, limit=50):
+        with self._lock:
+            statements = [
+                {
+                    'fingerprint': sql_fingerprint,
+                    'calls': stats.calls,
+                    'slow_calls': stats.slow_calls,
+                    'total_ms': round(stats.total_seconds * 1000, 3),
+                    'mean_ms': round(stats.total_seconds * 1000 / stats.calls, 3),
+                    'max_ms': round(stats.max_seconds * 1000, 3),
+                    'last_plan': stats.last_plan,
+                }
+                for sql_fingerprint, stats in self._statements.items()
+            ]
+            slow_queries = list(self._slow_log)
+        statements.sort(key=lambda statement: statement['total_ms'], reverse=True)
+        return {
+            'pid': os.getpid(),
+            'slow_query_ms': SLOW_QUERY_MS,
+            'statements': statements[:limit],
+            'slow_queries': slow_queries[::-1],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._slow_log.clear()
+
+
+query_stats = QueryStats()
+
+
+def explain(cursor, sql, params):
+    """cursor と同じ接続で、SQL の実行計画を行のリストで返す (取得できない SQL は None)。
+
+    PostgreSQL では SELECT だけを EXPLAIN (ANALYZE) で実際に実行し、更新系の SQL は実行せずに
+    EXPLAIN だけを取る。失敗してもトランザクションを壊さないよう SAVEPOINT の中で実行する。
+    """
+    if not _EXPLAINABLE_RE.match(sql.lstrip()):
+        return None
+    explain_cursor = cursor.connection.cursor()
+    args = (params,) if params else ()
+    try:
+        if not database.DATABASE_URL:
+            explain_cursor.execute('EXPLAIN QUERY PLAN ' + sql, *args)
+            return [row[-1] for row in explain_cursor.fetchall()]
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if _READ_ONLY_RE.match(sql.lstrip()) else 'EXPLAIN '
+        explain_cursor.execute('SAVEPOINT query_stats_explain')
+        try:
+            explain_cursor.execute(prefix + sql, *args)
+            plan = [row[0] for row in explain_cursor.fetchall()]
+        except Exception:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT query_stats_explain')
+            raise
+        explain_cursor.execute('RELEASE SAVEPOINT query_stats_explain')
+        return plan
+    finally:
+        explain_cursor.close()
+
+
+def record_query(cursor, sql, params, seconds):
+    """database のクエリリスナー。集計し、遅い SQL はログと実行計画を残す"""
+    sql_fingerprint = fingerprint(sql)
+    if not query_stats.record(sql_fingerprint, seconds):
+        return
+
+    plan = None
+    if SLOW_QUERY_EXPLAIN and cursor is not None:
+        try:
+            plan = explain(cursor, sql, params)
+        except Exception as e:
+            plan = [f"実行計画を取得できませんでした: {e}"]
+    route = f"{request.method} {request.path}" if has_request_context() else None
+    entry = {
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'duration_ms': round(seconds * 1000, 3),
+        'route': route,
+        'fingerprint': sql_fingerprint,
+        'params': redact_params(params),
+        'plan': plan,
+    }
+    query_stats.add_slow_query(entry, sql_fingerprint, plan)
+    print(f"遅いクエリ ({entry['duration_ms']:.1f} ms{', ' + route if route else ''}): {sql_fingerprint} "
+          f"パラメーター: {entry['params']}")
+    if plan:
+        print("  実行計画:\n    " + "\n    ".join(plan))
+
+
+def init_app(app):
+    """全ての SQL の実行時間を集計するよう、database にリスナーを登録する"""
+    database.add_query_listener(record_query)
@@ -0,0 +1,56 @@
+"""スクリプト (migrations.py・import_drugs_from_csv.py など) を一時ディレクトリで実行するテストの共通部分。
+
+スクリプトはカレントディレクトリの drug_data.db を使うので、テストごとに空のディレクトリで実行する。
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_FILE = os.path.join(REPO_DIR, 'drugs_data.csv')
+
+
+class ScriptWorkdirTest(unittest.TestCase):
+    # False にすると、空のディレクトリのまま (マイグレーション前の DB を作るテスト用) で始める
+    migrate_on_setup = True
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.workdir = self._tmp.name
+        env = dict(os.environ)
+        env.pop('DATABASE_URL', None)
+        env['STARTUP_WARMUP'] = '0'
+        self.env = env
+        if self.migrate_on_setup:
+            self.run_script('migrations.py')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def run_script(self, script, *args):
+        result = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, script), *args],
+            cwd=self.workdir, env=self.env, capture_output=True, text=True, check=True,
+        )
+        self.assertNotIn('取り込みを取り消しました', result.stdout)
+        self.assertNotIn('同期を取り消しました', result.stdout)
+        self.assertNotIn('エラーが発生しました', result.stdout)
+        return result.stdout
+
+    def run_python(self, code, *args):
+        """リポジトリのモジュールを読み込めるようにして、一時ディレクトリで Python のコードを実行する"""
+        result = subprocess.run(
+            [sys.executable, '-c', f"import sys; sys.path.insert(0, {REPO_DIR!r})\n{code}", *args],
+            cwd=self.workdir, env=self.env, capture_output=True, text=True, check=True,
+        )
+        return result.stdout
+
+    def query(self, sql, params=()):
+        conn = sqlite3.connect(os.path.join(self.workdir, 'drug_data.db'))
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
@@ -0,0 +1,65 @@
+"""年齢別用量の区間表 (age_bands.compile_age_bands) の引き方を確認する"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from age_bands import AgeBandError, compile_age_bands  # noqa: E402
+
+
+def bands(age_doses):
+    return compile_age_bands(json.dumps(age_doses))
+
+
+class AgeBandTableTest(unittest.TestCase):
+    def test_band_boundaries_are_inclusive(self):
+        table = bands({"36-95": 1.0, "96-155": 2.0, "156-999": 3.0})
+        self.assertIsNone(table.lookup(35))
+        self.assertEqual(table.lookup(36), 1.0)
+        self.assertEqual(table.lookup(95), 1.0)
+        self.assertEqual(table.lookup(96), 2.0)
+        self.assertEqual(table.lookup(155), 2.0)
+        self.assertEqual(table.lookup(156), 3.0)
+        self.assertEqual(table.lookup(999), 3.0)
+        self.assertIsNone(table.lookup(1000))
+        self.assertEqual(table.gaps, [])
+        self.assertEqual(table.overlaps, [])
+
+    def test_unsorted_bands_and_gaps(self):
+        table = bands({"24-35": 2.0, "0-11": 1.0})
+        self.assertEqual(table.lookup(0), 1.0)
+        self.assertEqual(table.lookup(11), 1.0)
+        self.assertIsNone(table.lookup(12))
+        self.assertIsNone(table.lookup(23))
+        self.assertEqual(table.lookup(24), 2.0)
+        self.assertEqual(table.gaps, [(12, 23)])
+
+    def test_earlier_band_wins_where_bands_overlap(self):
+        # 以前の「辞書の先頭から順に探す」実装と同じく、先に書かれた帯を優先する
+        table = bands({"12-36": 1.5, "0-24": 1.0, "30-60": 2.0})
+        self.assertEqual(table.lookup(0), 1.0)
+        self.assertEqual(table.lookup(11), 1.0)
+        self.assertEqual(table.lookup(12), 1.5)
+        self.assertEqual(table.lookup(24), 1.5)
+        self.assertEqual(table.lookup(36), 1.5)
+        self.assertEqual(table.lookup(37), 2.0)
+        self.assertEqual(table.lookup(60), 2.0)
+        self.assertEqual(len(table.overlaps), 2)
+
+    def test_single_month_band(self):
+        table = bands({"6-6": 0.5})
+        self.assertIsNone(table.lookup(5))
+        self.assertEqual(table.lookup(6), 0.5)
+        self.assertIsNone(table.lookup(7))
+
+    def test_invalid_data(self):
+        for age_doses_json in ('{"0-12": 1.0', '[1, 2]', '{"0to12": 1.0}', '{"24-12": 1.0}'):
+            with self.subTest(age_doses_json=age_doses_json):
+                with self.assertRaises(AgeBandError):
+                    compile_age_bands(age_doses_json)
+
+
+if __name__ == '__main__':
+    unittest.main()
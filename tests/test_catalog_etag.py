@@ -0,0 +1,53 @@
+"""カタログを読むAPIの ETag と 304 (If-None-Match) がカタログのバージョンに追従することを確認する"""
+import unittest
+
+from web_client import client
+
+CATALOG_URLS = [
+    '/search?q=%E7%B4%B0%E7%B2%92',
+    '/autocomplete?q=%E3%82%AB%E3%83%AD',
+    '/search_all_drug_data',
+    '/dose_chart?drug_name=%E3%82%AA%E3%82%BC%E3%83%83%E3%82%AF%E3%82%B9%E7%B4%B0%E7%B2%9215%25',
+]
+
+
+class CatalogEtagTest(unittest.TestCase):
+    def test_not_modified(self):
+        for url in CATALOG_URLS:
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response.headers['ETag']
+                self.assertEqual(response.headers['Cache-Control'], 'public, no-cache')  # CATALOG_RESPONSE_MAX_AGE の既定値は 0
+
+                cached = client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(cached.status_code, 304)
+                self.assertEqual(cached.get_data(), b'')
+                self.assertEqual(cached.headers['ETag'], etag)
+                # 圧縮などで弱い ETag に変えられても一致する
+                self.assertEqual(client.get(url, headers={'If-None-Match': f'W/{etag}'}).status_code, 304)
+                self.assertEqual(client.get(url, headers={'If-None-Match': '"catalog-0"'}).status_code, 200)
+
+    def test_etag_changes_when_catalog_changes(self):
+        url = CATALOG_URLS[0]
+        etag = client.get(url).headers['ETag']
+        created = client.post('/drugs', json={'drug_name': 'ETagテスト細粒', 'dosage_unit': 'fixed', 'daily_fixed_dose': 1})
+        self.assertEqual(created.status_code, 201)
+        try:
+            response = client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers['ETag'], etag)
+            self.assertIn({'drug_name': 'ETagテスト細粒'}, response.get_json())
+        finally:
+            self.assertEqual(client.delete(f"/drugs/{created.get_json()['id']}").status_code, 200)
+
+    def test_errors_have_no_etag(self):
+        for url in ('/drugs/999999', '/dose_chart?drug_name=x', '/autocomplete?q=a&limit=x'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertGreaterEqual(response.status_code, 400)
+                self.assertNotIn('ETag', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+"""変更履歴 (drug_changes) のトリガーが、CSV の再インポート・差分同期でも動くことを確認する"""
+import unittest
+
+from script_workdir import CSV_FILE, ScriptWorkdirTest
+
+
+class ChangeLogImportTest(ScriptWorkdirTest):
+    def assert_change_log_complete(self):
+        # 全ての薬が確定済みの変更として記録され、未確定 (NULL) の記録が残っていないこと
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drug_changes WHERE version IS NULL"), [(0,)])
+        missing = self.query("SELECT id FROM drugs WHERE id NOT IN (SELECT drug_id FROM drug_changes)")
+        self.assertEqual(missing, [])
+
+    def test_import_twice_then_sync_then_import(self):
+        self.run_script('import_drugs_from_csv.py', CSV_FILE)
+        drug_count = self.query("SELECT COUNT(*) FROM drugs")[0][0]
+        self.assertGreater(drug_count, 0)
+
+        self.run_script('import_drugs_from_csv.py', CSV_FILE)
+        self.run_script('import_drugs_from_csv.py', CSV_FILE, '--sync')
+        self.run_script('import_drugs_from_csv.py', CSV_FILE)
+
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drugs")[0][0], drug_count)
+        self.assert_change_log_complete()
+        # 再インポートで更新された薬は、最新のカタログバージョンで記録されていること
+        version = self.query("SELECT version FROM catalog_version WHERE id = 1")[0][0]
+        self.assertEqual(self.query("SELECT MAX(version) FROM drug_changes"), [(version,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
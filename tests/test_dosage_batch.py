@@ -0,0 +1,61 @@
+"""一括計算API (/calculate_dosage_batch) が /calculate_dosage と同じ結果を返し、不正な項目だけを 400 にすることを確認する"""
+import unittest
+
+from web_client import client
+
+ITEMS = [
+    {'drug_name': 'オゼックス細粒15%', 'weight': 12.5, 'age_years': 3},
+    ['オゼックス細粒15%', '20', '6'],
+    ['オゼックス細粒15%', 400, 10],  # 1日最大量を超える
+    ['モビコール配合内用剤LD', 15, 4],
+    ['モビコール配合内用剤LD', 15, 2],  # 該当する年齢帯がない
+    ['シングレア細粒4mg', 18, 4],  # 固定用量のデータが設定されていない
+    ['存在しない薬', 10, 3],
+]
+
+
+class DosageBatchTest(unittest.TestCase):
+    def batch(self, items):
+        response = client.post('/calculate_dosage_batch', json={'items': items})
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['results']
+
+    def test_results_match_single_calculation(self):
+        results = self.batch(ITEMS)
+        self.assertEqual([result['index'] for result in results], list(range(len(ITEMS))))
+        for item, result in zip(ITEMS, results):
+            if isinstance(item, list):
+                item = dict(zip(('drug_name', 'weight', 'age_years'), item))
+            single = client.post('/calculate_dosage', json=item)
+            with self.subTest(item=item):
+                self.assertEqual(result['status'], single.status_code)
+                self.assertEqual(result['result'], single.get_json())
+        self.assertAlmostEqual(results[0]['result']['calculated_daily_dose_value'], 1.0)
+        self.assertEqual([result['status'] for result in results], [200, 200, 400, 200, 400, 400, 404])
+
+    def test_invalid_items_are_rejected_individually(self):
+        invalid_items = [
+            {'drug_name': {'a': 1}, 'weight': 10, 'age_years': 3},
+            [['オゼックス細粒15%'], 10, 3],
+            ['オゼックス細粒15%', 'nan', 3],
+            ['オゼックス細粒15%', 'inf', 3],
+            ['オゼックス細粒15%', -1, 3],
+            ['オゼックス細粒15%', 10, 'abc'],
+            ['オゼックス細粒15%', 10],
+            'オゼックス細粒15%',
+        ]
+        results = self.batch(invalid_items + [['オゼックス細粒15%', 10, 3]])
+        for item, result in zip(invalid_items, results):
+            with self.subTest(item=item):
+                self.assertEqual(result['status'], 400)
+                self.assertIsNone(result['result']['drug_data'])
+        self.assertEqual(results[-1]['status'], 200)
+
+    def test_request_errors(self):
+        self.assertEqual(client.post('/calculate_dosage_batch', json={'items': 'x'}).status_code, 400)
+        too_many = [['オゼックス細粒15%', 10, 3]] * 501
+        self.assertEqual(client.post('/calculate_dosage_batch', json={'items': too_many}).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
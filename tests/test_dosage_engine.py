@@ -0,0 +1,148 @@
+"""用量エンジン (dosage_engine.DoseRule) の計算結果を確認する"""
+import json
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dosage_engine  # noqa: E402
+
+
+CURRENT_COLUMNS = (
+    'drug_name', 'aliases', 'type', 'dosage_unit',
+    'single_dose_per_kg', 'single_fixed_dose', 'single_dose_age_specific',
+    'daily_dose_per_kg', 'daily_fixed_dose', 'daily_dose_age_specific',
+    'min_age_months', 'max_age_months', 'daily_frequency', 'notes', 'usage_type', 'timing_options',
+    'formulation_type', 'calculated_dose_unit', 'max_daily_fixed_dose', 'max_daily_times',
+)
+
+
+def drug_row(**values):
+    """現行のスキーマの行 (指定しなかったカラムは None、用法タイプは内服)"""
+    row = dict.fromkeys(CURRENT_COLUMNS)
+    row.update(usage_type='内服', calculated_dose_unit='g')
+    row.update(values)
+    return row
+
+
+def calculate(row, weight=10, age_months=36):
+    return dosage_engine.DoseRule(row).calculate(weight, age_months)
+
+
+class DoseRuleTest(unittest.TestCase):
+    def test_weight_based_daily_and_single_doses(self):
+        row = drug_row(drug_name='薬', dosage_unit='kg', daily_dose_per_kg=0.08, single_dose_per_kg=0.02,
+                       daily_frequency='2,3', timing_options='朝夕食後,毎食後,発熱時')
+        result, status = calculate(row, weight=12.5)
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(result['calculated_daily_dose_value'], 1.0)
+        self.assertEqual(result['daily_frequency_options'], ['2', '3'])
+        self.assertEqual(result['timing_options'], ['朝夕食後', '毎食後'])
+
+        result, status = calculate(dict(row, usage_type='頓服', max_daily_times=3), weight=12.5)
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(result['calculated_daily_dose_value'], 0.25)
+        self.assertEqual(result['daily_frequency_options'], ['1', '2', '3'])
+        self.assertEqual(result['timing_options'], ['発熱時'])
+
+        # 一括計算済みの用量を渡した場合はそれを使う
+        self.assertEqual(dosage_engine.DoseRule(row).calculate(12.5, 36, kg_dose=0.9)[0]['calculated_daily_dose_value'], 0.9)
+
+    def test_fixed_and_age_based_doses(self):
+        result, status = calculate(drug_row(drug_name='薬', dosage_unit='fixed', daily_fixed_dose=4.0))
+        self.assertEqual((status, result['calculated_daily_dose_value']), (200, 4.0))
+
+        row = drug_row(drug_name='薬', dosage_unit='age', daily_dose_age_specific='{"36-95": 1.0, "96-155": 2.0}')
+        self.assertEqual(calculate(row, age_months=95)[0]['calculated_daily_dose_value'], 1.0)
+        self.assertEqual(calculate(row, age_months=96)[0]['calculated_daily_dose_value'], 2.0)
+        result, status = calculate(row, age_months=35)
+        self.assertEqual(status, 400)
+        self.assertIn('2歳11ヶ月', result['error'])
+
+    def test_age_limits_are_inclusive(self):
+        row = drug_row(drug_name='薬', dosage_unit='fixed', daily_fixed_dose=4.0, min_age_months=12, max_age_months=71)
+        self.assertEqual(calculate(row, age_months=11)[1], 400)
+        self.assertIn('1歳未満', calculate(row, age_months=11)[0]['error'])
+        self.assertEqual(calculate(row, age_months=12)[1], 200)
+        self.assertEqual(calculate(row, age_months=71)[1], 200)
+        self.assertIn('5歳11ヶ月を超える', calculate(row, age_months=72)[0]['error'])
+
+    def test_max_daily_dose(self):
+        row = drug_row(drug_name='薬', dosage_unit='kg', daily_dose_per_kg=0.3, max_daily_fixed_dose=9.0)
+        self.assertEqual(calculate(row, weight=30)[1], 200)  # ちょうど最大量は許容する
+        result, status = calculate(row, weight=30.1)
+        self.assertEqual(status, 400)
+        self.assertIn('9.030', result['error'])
+        self.assertIn('9.000', result['error'])
+
+    def test_missing_or_invalid_data(self):
+        cases = [
+            (drug_row(drug_name='薬', dosage_unit='kg'), '体重基準ですが'),
+            (drug_row(drug_name='薬', dosage_unit='kg', daily_dose_per_kg=0.1, usage_type='頓服'), '1回あたりの用量'),
+            (drug_row(drug_name='薬', dosage_unit='fixed'), '固定用量ですが'),
+            (drug_row(drug_name='薬', dosage_unit='age'), '年齢基準ですが'),
+            (drug_row(drug_name='薬', dosage_unit='age', daily_dose_age_specific='{"x": 1}'), 'データが不正です'),
+            (drug_row(drug_name='薬', dosage_unit='mg'), '基準が不明です'),
+        ]
+        for row, message in cases:
+            with self.subTest(message=message):
+                result, status = calculate(row)
+                self.assertEqual(status, 400)
+                self.assertIn(message, result['error'])
+                self.assertEqual(dosage_engine.DoseRule(row).data_error, result['error'])
+
+    def test_rules_are_cached_per_row_object(self):
+        row = drug_row(drug_name='薬', dosage_unit='kg', daily_dose_per_kg=0.1)
+        rule = dosage_engine.rule_for(row)
+        self.assertIs(dosage_engine.rule_for(row), rule)
+        self.assertIsNot(dosage_engine.rule_for(dict(row)), rule)
+        with self.assertRaises(AttributeError):
+            rule.dose_per_kg = 1.0
+
+
+def legacy_row(**values):
+    """create_db.py の旧スキーマで作った DB の行 (sqlite3.Row)"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE drugs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, drug_name TEXT NOT NULL UNIQUE, aliases TEXT, type TEXT,
+            dosage_unit TEXT NOT NULL, dose_per_kg REAL, min_age_months INTEGER, max_age_months INTEGER,
+            dose_age_specific TEXT, fixed_dose REAL, daily_frequency TEXT, notes TEXT
+        )
+    ''')
+    columns = ', '.join(values)
+    conn.execute(f"INSERT INTO drugs ({columns}) VALUES ({', '.join('?' * len(values))})", tuple(values.values()))
+    row = conn.execute("SELECT * FROM drugs").fetchone()
+    conn.close()
+    return row
+
+
+class LegacySchemaTest(unittest.TestCase):
+    def test_weight_based_dose_is_single_dose_in_grams(self):
+        row = legacy_row(drug_name='カロナール細粒20%', dosage_unit='kg', dose_per_kg=0.005, daily_frequency='1,2,3')
+        result, status = dosage_engine.rule_for(row).calculate(10, 36)
+        self.assertEqual(status, 200)
+        self.assertAlmostEqual(result['calculated_daily_dose_value'], 0.05)
+        self.assertEqual(result['dose_unit'], 'g')
+        self.assertEqual(result['initial_usage_type'], '頓服')
+        self.assertEqual(result['daily_frequency_options'], ['1', '2', '3'])
+        self.assertEqual(result['timing_options'], [])
+
+    def test_fixed_and_age_based_doses(self):
+        row = legacy_row(drug_name='カロナールシロップ2%', dosage_unit='fixed', fixed_dose=5.0)
+        result, status = dosage_engine.rule_for(row).calculate(10, 36)
+        self.assertEqual((status, result['calculated_daily_dose_value'], result['dose_unit']), (200, 5.0, 'ml'))
+
+        row = legacy_row(drug_name='リンデロンシロップ0.01%', dosage_unit='age', min_age_months=0, max_age_months=120,
+                         dose_age_specific=json.dumps({"0-12": 0.5, "13-36": 1.0, "37-72": 1.5}))
+        rule = dosage_engine.rule_for(row)
+        self.assertEqual(rule.calculate(10, 36)[0]['calculated_daily_dose_value'], 1.0)
+        self.assertEqual(rule.calculate(10, 37)[0]['calculated_daily_dose_value'], 1.5)
+        self.assertEqual(rule.calculate(10, 121)[1], 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
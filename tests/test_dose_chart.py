@@ -0,0 +1,64 @@
+"""用量早見表 (/dose_chart) の内容が /calculate_dosage と一致し、不正な範囲を 400 にすることを確認する"""
+import unittest
+
+from web_client import client
+
+
+def dose_chart(**params):
+    params.setdefault('drug_name', 'オゼックス細粒15%')
+    return client.get('/dose_chart', query_string=params)
+
+
+class DoseChartTest(unittest.TestCase):
+    def assert_matches_single_calculation(self, drug_name):
+        chart = dose_chart(drug_name=drug_name, weight_min=5, weight_max=350, weight_step=15,
+                           age_min=1, age_max=15).get_json()
+        for row in chart['rows']:
+            for age_years, dose, clamped in zip(chart['ages_years'], row['doses'], row['clamped']):
+                single = client.post('/calculate_dosage', json={
+                    'drug_name': drug_name, 'weight': row['weight_kg'], 'age_years': age_years}).get_json()
+                with self.subTest(weight=row['weight_kg'], age_years=age_years):
+                    if dose is None or clamped:
+                        # 年齢制限外・年齢帯なしは空欄、1日最大量を超える場合は最大量で頭打ち
+                        self.assertIn('error', single)
+                    else:
+                        self.assertAlmostEqual(single['calculated_daily_dose_value'], dose)
+                        self.assertEqual(single['dose_unit'], chart['dose_unit'])
+        return chart
+
+    def test_weight_based_chart(self):
+        chart = self.assert_matches_single_calculation('オゼックス細粒15%')
+        doses = [row['doses'][0] for row in chart['rows']]
+        self.assertAlmostEqual(doses[0], 0.4)
+        self.assertEqual(max(doses), 24.0)
+        self.assertTrue(chart['rows'][-1]['clamped'][0])
+
+    def test_age_based_chart(self):
+        chart = self.assert_matches_single_calculation('モビコール配合内用剤LD')
+        self.assertEqual(chart['age_status'][:3], ['no_age_band', 'no_age_band', 'ok'])
+        self.assertEqual(chart['rows'][0]['doses'][2:9], [1, 1, 1, 1, 1, 2, 2])
+
+    def test_drug_without_dose_data_uses_engine_message(self):
+        chart = dose_chart(drug_name='シングレア細粒4mg')
+        single = client.post('/calculate_dosage', json={'drug_name': 'シングレア細粒4mg', 'weight': 18, 'age_years': 4})
+        self.assertEqual(chart.status_code, 400)
+        self.assertEqual(chart.get_json()['error'], single.get_json()['error'])
+
+    def test_csv_format(self):
+        response = dose_chart(weight_min=10, weight_max=11, weight_step=1, age_min=3, age_max=4, format='csv')
+        self.assertEqual(response.status_code, 200)
+        lines = response.get_data(as_text=True).lstrip('\ufeff').splitlines()
+        self.assertEqual(lines, ['体重(kg),3歳,4歳', '10,0.800,0.800', '11,0.880,0.880'])
+
+    def test_invalid_ranges(self):
+        for params in ({'weight_min': 'nan'}, {'weight_max': 'inf'}, {'weight_step': 'nan'}, {'weight_step': '-inf'},
+                       {'weight_min': 'abc'}, {'weight_min': 0}, {'weight_max': 1, 'weight_min': 2},
+                       {'age_min': 5, 'age_max': 4}, {'weight_step': '1e-308', 'weight_max': '1e308'},
+                       {'format': 'xml'}):
+            with self.subTest(params=params):
+                self.assertEqual(dose_chart(**params).status_code, 400)
+        self.assertEqual(dose_chart(drug_name='存在しない薬').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
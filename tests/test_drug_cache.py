@@ -0,0 +1,85 @@
+"""薬カタログのキャッシュ (drug_cache.DrugCatalogCache) の更新と、バージョン確認中も読み取りを止めないことを確認する"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+from web_client import client  # noqa: F401 (一時ディレクトリの DB を使えるようにする)
+
+import database  # noqa: E402
+import drug_cache  # noqa: E402
+
+
+def bump_catalog_version():
+    with database.connection() as conn:
+        version = drug_cache.bump_version(database.cursor(conn))
+        conn.commit()
+    return version
+
+
+class DrugCatalogCacheTest(unittest.TestCase):
+    def test_reloads_when_version_changes(self):
+        cache = drug_cache.DrugCatalogCache(check_interval=0)
+        version = cache.current_version()
+        rows = cache.all_rows()
+        self.assertTrue(rows)
+        self.assertIsNotNone(cache.get_by_name(rows[0]['drug_name']))
+        generation = cache.generation
+
+        self.assertEqual(cache.current_version(), version)
+        self.assertEqual(cache.generation, generation)  # バージョンが同じなら読み直さない
+        new_version = bump_catalog_version()
+        self.assertEqual(cache.current_version(), new_version)
+        self.assertNotEqual(cache.generation, generation)
+
+    def test_reads_are_not_blocked_by_version_check(self):
+        cache = drug_cache.DrugCatalogCache(check_interval=0.05)
+        drug_name = cache.all_rows()[0]['drug_name']
+        time.sleep(0.06)
+
+        started = threading.Event()
+        release = threading.Event()
+        read_version = drug_cache.read_version
+
+        def slow_read_version(cursor):
+            started.set()
+            release.wait(5)
+            return read_version(cursor)
+
+        with mock.patch.object(drug_cache, 'read_version', slow_read_version):
+            checker = threading.Thread(target=cache.current_version)
+            checker.start()
+            try:
+                self.assertTrue(started.wait(5))
+                # 他のスレッドが DB のバージョンを確認している間も、キャッシュから読める
+                reader_result = []
+                reader = threading.Thread(target=lambda: reader_result.append(cache.get_by_name(drug_name)))
+                reader.start()
+                reader.join(1)
+                self.assertFalse(reader.is_alive())
+                self.assertEqual(reader_result[0]['drug_name'], drug_name)
+            finally:
+                release.set()
+                checker.join(5)
+
+    def test_invalidate_during_reload_is_kept(self):
+        cache = drug_cache.DrugCatalogCache(check_interval=0)
+        cache.current_version()
+        read_catalog = cache._read_catalog
+
+        def read_catalog_then_invalidate(cursor):
+            # 全件を読み込んでいる間に、他のスレッドがキャッシュを破棄する
+            result = read_catalog(cursor)
+            cache.invalidate()
+            return result
+
+        bump_catalog_version()
+        with mock.patch.object(cache, '_read_catalog', read_catalog_then_invalidate):
+            cache.current_version()
+        # 破棄される前に読んだ内容でキャッシュを戻さない
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertTrue(cache.all_rows())
+
+
+if __name__ == '__main__':
+    unittest.main()
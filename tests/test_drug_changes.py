@@ -0,0 +1,105 @@
+"""薬の取得API・差分同期API (/drugs/changes) のレスポンスと、デスクトップ版の複製への反映を確認する"""
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from web_client import client, web_app
+
+import desktop_catalog  # noqa: E402
+import drug_sync  # noqa: E402
+
+
+class DrugApiTest(unittest.TestCase):
+    def test_internal_columns_are_not_exposed(self):
+        drug = client.get('/drugs/1').get_json()
+        self.assertEqual(drug['id'], 1)
+        self.assertIn('drug_name', drug)
+        self.assertFalse(set(web_app.INTERNAL_DRUG_COLUMNS) & set(drug))
+
+        changes = client.get('/drugs/changes').get_json()
+        self.assertTrue(changes['reset'])
+        self.assertTrue(changes['drugs'])
+        for row in changes['drugs']:
+            self.assertFalse(set(web_app.INTERNAL_DRUG_COLUMNS) & set(row))
+
+    def test_changes_since_current_version(self):
+        version = client.get('/drugs/changes').get_json()['version']
+        self.assertEqual(client.get('/drugs/changes', query_string={'since': version}).get_json(),
+                         {'version': version, 'reset': False, 'drugs': [], 'deleted': []})
+        self.assertEqual(client.get('/drugs/changes', query_string={'since': 'x'}).status_code, 400)
+
+    def test_replica_is_searchable_without_search_keys(self):
+        changes = client.get('/drugs/changes').get_json()
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, 'drug_data.db')
+            conn = sqlite3.connect(db_path)
+            try:
+                drug_sync.ensure_replica_schema(conn.cursor())
+                self.assertEqual(drug_sync.apply_changes(conn, changes, 'http://example.test'),
+                                 (len(changes['drugs']), 0))
+            finally:
+                conn.close()
+            snapshot = desktop_catalog.load_snapshot(db_path)
+        self.assertEqual(len(snapshot), len(changes['drugs']))
+        self.assertEqual(snapshot.filter('ﾜｲﾄﾞｼﾘﾝ'), ['ワイドシリン細粒10%', 'ワイドシリン細粒20%'])
+
+
+def fake_response(payload):
+    response = io.BytesIO(json.dumps(payload).encode('utf-8'))
+    response.headers = {}
+    return response
+
+
+class DrugSyncValidationTest(unittest.TestCase):
+    VALID = {'version': 3, 'reset': False, 'drugs': [{'id': 1, 'drug_name': 'A', 'notes': None}], 'deleted': [2]}
+
+    def test_invalid_payloads_raise_value_error(self):
+        invalid_payloads = [
+            [],
+            {'reset': False, 'drugs': [], 'deleted': []},
+            dict(self.VALID, version='3'),
+            dict(self.VALID, reset=None),
+            dict(self.VALID, deleted=['2']),
+            dict(self.VALID, drugs={'id': 1}),
+            dict(self.VALID, drugs=[{'id': 1}]),
+            dict(self.VALID, drugs=[{'id': 1, 'drug_name': 'A'}, {'id': 2, 'drug_name': 'B', 'notes': None}]),
+            dict(self.VALID, drugs=[{'id': 1, 'drug_name': 'A', 'notes) VALUES (1); DROP TABLE drugs; --': None}]),
+            dict(self.VALID, drugs=[{'id': '1', 'drug_name': 'A'}]),
+        ]
+        for payload in invalid_payloads:
+            with self.subTest(payload=payload):
+                with mock.patch('urllib.request.urlopen', return_value=fake_response(payload)):
+                    with self.assertRaises(ValueError):
+                        drug_sync.fetch_changes('http://example.test', 0)
+        with mock.patch('urllib.request.urlopen', return_value=fake_response(self.VALID)):
+            self.assertEqual(drug_sync.fetch_changes('http://example.test', 0)[0], self.VALID)
+
+    def test_loader_keeps_running_after_malformed_response(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            db_path = os.path.join(workdir, 'drug_data.db')
+            loader = desktop_catalog.CatalogLoader(db_path, interval=60, sync_url='http://example.test')
+            with mock.patch('urllib.request.urlopen', return_value=fake_response({'version': 1})):
+                loader.start()
+                deadline = time.monotonic() + 5
+                snapshot, error = None, None
+                while snapshot is None and time.monotonic() < deadline:
+                    result_snapshot, result_error = loader.poll()
+                    snapshot = snapshot or result_snapshot
+                    error = error or result_error
+                    time.sleep(0.01)
+            try:
+                self.assertIn('本番と同期できませんでした', error)
+                self.assertEqual(len(snapshot), 0)
+                self.assertTrue(loader._thread.is_alive())
+            finally:
+                loader.stop()
+                loader._thread.join(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""検索キーの正規化、薬名・別名の部分一致検索の順位、メモリ上の索引と SQL の検索結果の一致と、入力補完を確認する"""
+import unittest
+
+from web_client import client, web_app  # noqa: F401 (一時ディレクトリの DB で drug_search を使えるようにする)
+
+import drug_search  # noqa: E402
+import prefix_index  # noqa: E402
+from drug_search import NgramIndex, search_key_values  # noqa: E402
+
+
+def catalog_row(drug_id, drug_name, aliases):
+    name_key, aliases_key = search_key_values(drug_name, aliases)
+    return {'id': drug_id, 'drug_name': drug_name, 'aliases': aliases,
+            'drug_name_key': name_key, 'aliases_key': aliases_key}
+
+
+ROWS = [
+    catalog_row(1, 'カロナール細粒20%', 'アセトアミノフェン'),
+    catalog_row(2, 'カロナール', 'アセトアミノフェン'),
+    catalog_row(3, 'アンヒバ坐剤小児用100mg', 'アセトアミノフェン坐剤'),
+    catalog_row(4, 'ワイドシリン細粒10%', 'アモキシシリン水和物100mg/g'),
+    catalog_row(5, '小児用カロナールシロップ', ''),
+]
+
+
+class NormalizeSearchKeyTest(unittest.TestCase):
+    def test_normalization(self):
+        cases = [
+            ('１０％', '10%'),
+            ('ｼﾛｯﾌﾟ', 'しろっぷ'),
+            ('シロップ', 'しろっぷ'),
+            ('ドライシロップ', 'どらいしろっぷ'),
+            ('ＭＧ mg', 'mgmg'),
+            (' カロナール　細粒\t20% ', 'かろなーる細粒20%'),
+            ('ヴィ', 'ゔぃ'),
+            ('', ''),
+            (None, ''),
+        ]
+        for text, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(drug_search.normalize_search_key(text), expected)
+
+    def test_search_key_values(self):
+        self.assertEqual(search_key_values('ワイドシリン細粒10%', 'アモキシシリン,ＡＭＰＣ'),
+                         ('わいどしりん細粒10%', 'あもきししりん,ampc'))
+
+    def test_equivalent_queries_return_same_results(self):
+        expected = client.get('/search', query_string={'q': 'シロップ'}).get_json()
+        self.assertTrue(expected)
+        for query in ('ｼﾛｯﾌﾟ', 'しろっぷ', ' シロ ップ '):
+            with self.subTest(query=query):
+                self.assertEqual(client.get('/search', query_string={'q': query}).get_json(), expected)
+
+
+class NgramIndexTest(unittest.TestCase):
+    def search(self, term, limit=None):
+        return [row['drug_name'] for row in NgramIndex(ROWS).search(drug_search.normalize_search_key(term), limit)]
+
+    def test_rank_order(self):
+        # 薬名の完全一致 > 薬名の前方一致 > 別名の前方一致 > 部分一致、同じ順位の中では薬名の順
+        self.assertEqual(self.search('カロナール'), ['カロナール', 'カロナール細粒20%', '小児用カロナールシロップ'])
+        self.assertEqual(self.search('アセトアミノフェン'), ['アンヒバ坐剤小児用100mg', 'カロナール', 'カロナール細粒20%'])
+        self.assertEqual(self.search('細粒'), ['カロナール細粒20%', 'ワイドシリン細粒10%'])
+
+    def test_single_character_and_limit(self):
+        self.assertEqual(self.search('ル'), ['カロナール', 'カロナール細粒20%', '小児用カロナールシロップ'])
+        self.assertEqual(self.search('カロナール', limit=1), ['カロナール'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search('イブプロフェン'), [])
+        self.assertEqual(self.search('ルカ'), [])
+
+
+class SearchBackendTest(unittest.TestCase):
+    QUERIES = ['細粒', 'シロップ', 'ｼﾛｯﾌﾟ', 'あもきし', 'アモキシシリン', 'ドライシロップ3%', 'mg', '%', '_', 'z']
+
+    def test_sql_search_matches_memory_index(self):
+        index = drug_search._get_memory_index()
+        self.assertIsNotNone(index)
+        for query in self.QUERIES:
+            query_key = drug_search.normalize_search_key(query)
+            with self.subTest(query=query):
+                self.assertEqual(drug_search._search_sql(query_key, None), index.search(query_key))
+
+    def test_search_endpoint(self):
+        response = client.get('/search', query_string={'q': 'ワイドシリン'})
+        self.assertEqual(response.get_json(), [{'drug_name': 'ワイドシリン細粒10%'}, {'drug_name': 'ワイドシリン細粒20%'}])
+        self.assertLessEqual(len(client.get('/search', query_string={'q': 'シロップ'}).get_json()), 5)
+
+
+class AutocompleteTest(unittest.TestCase):
+    def autocomplete(self, query, **params):
+        return client.get('/autocomplete', query_string=dict(params, q=query))
+
+    def test_autocomplete_terms(self):
+        self.assertEqual(drug_search.autocomplete_terms('わいどしりん細粒10%', 'あもきししりん水和物100mg/g'), [
+            ('わいどしりん細粒10%', prefix_index.SOURCE_NAME),
+            ('あもきししりん水和物100mg/g', prefix_index.SOURCE_ALIAS),
+            ('わいどしりん', prefix_index.SOURCE_TOKEN),
+            ('細粒', prefix_index.SOURCE_TOKEN),
+            ('あもきししりん', prefix_index.SOURCE_TOKEN),
+            ('水和物', prefix_index.SOURCE_TOKEN),
+            ('mg', prefix_index.SOURCE_TOKEN),
+        ])
+
+    def test_prefix_and_exact_matches(self):
+        expected = [{'drug_name': 'ワイドシリン細粒10%', 'match': 'prefix'},
+                    {'drug_name': 'ワイドシリン細粒20%', 'match': 'prefix'}]
+        for query in ('ワイド', 'ﾜｲﾄﾞ', 'わいど'):
+            with self.subTest(query=query):
+                self.assertEqual(self.autocomplete(query).get_json(), expected)
+        self.assertEqual(self.autocomplete('ワイドシリン細粒10%').get_json(),
+                         [{'drug_name': 'ワイドシリン細粒10%', 'match': 'exact'}])
+        # 別名や成分名のトークンの途中からでも候補に出る
+        self.assertIn({'drug_name': 'サワシリン細粒10%', 'match': 'prefix'}, self.autocomplete('アモキシ').get_json())
+        self.assertEqual(self.autocomplete('細粒', limit=3).get_json()[0]['match'], 'exact')
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.autocomplete('細粒', limit=2).get_json()), 2)
+        self.assertEqual(len(self.autocomplete('細粒', limit=0).get_json()), 1)
+        self.assertEqual(self.autocomplete('細粒', limit='x').status_code, 400)
+        self.assertEqual(self.autocomplete('').get_json(), [])
+        self.assertEqual(self.autocomplete('zzz').get_json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""曖昧検索 (fuzzy_index と /search?fuzzy=1) で入力ミスのある薬名の候補が編集距離の順に出ることを確認する"""
+import unittest
+
+from web_client import client
+
+from fuzzy_index import SymSpellIndex, allowed_distance, prefix_edit_distance  # noqa: E402
+
+
+class PrefixEditDistanceTest(unittest.TestCase):
+    def test_distance(self):
+        cases = [
+            ('かろなーる', 'かろなーる', 0),
+            ('かろなーる', 'かろなーる細粒20%', 0),  # 語の先頭部分との距離
+            ('かろなある', 'かろなーる', 1),  # 置換
+            ('かろなる', 'かろなーる', 1),  # 挿入
+            ('かろなーーる', 'かろなーる', 1),  # 削除
+            ('かなろーる', 'かろなーる', 1),  # 隣接文字の入れ替え
+            ('かなろある', 'かろなーる', 2),
+            ('むこだいん', 'かろなーる', None),
+        ]
+        for query, term, expected in cases:
+            with self.subTest(query=query, term=term):
+                self.assertEqual(prefix_edit_distance(query, term, 2), expected)
+
+    def test_allowed_distance_depends_on_query_length(self):
+        self.assertEqual([allowed_distance('x' * n, 2) for n in (1, 2, 3, 5, 6)], [0, 0, 1, 1, 2])
+        self.assertEqual(allowed_distance('x' * 10, 1), 1)
+
+
+class SymSpellIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SymSpellIndex(max_edit_distance=2, prefix_length=7)
+        self.index.add(1, 'カロナール細粒20%', ['かろなーる細粒20%', 'あせとあみのふぇん'])
+        self.index.add(2, 'ムコダイン細粒50%', ['むこだいん細粒50%', 'かるぼしすていん'])
+        self.index.add(3, 'ムコサール', ['むこさーる'])
+
+    def test_lookup_orders_by_distance(self):
+        self.assertEqual(self.index.lookup('かろなある'), [(1, 'カロナール細粒20%', 1)])
+        self.assertEqual(self.index.lookup('あせとあみのへん'), [(2, 'カロナール細粒20%', 1)])  # 'ふぇ' → 'へ' は置換と削除
+        self.assertEqual(self.index.lookup('むこだいる'), [(1, 'ムコダイン細粒50%', 2)])
+        self.assertEqual(self.index.lookup('むこ'), [(0, 'ムコサール', 3), (0, 'ムコダイン細粒50%', 2)])
+        self.assertEqual(self.index.lookup('むこ', limit=1), [(0, 'ムコサール', 3)])
+
+    def test_short_query_requires_exact_prefix(self):
+        self.assertEqual(self.index.lookup('むか'), [])
+
+    def test_add_replaces_and_remove_forgets(self):
+        self.index.add(1, 'カロナール', ['かろなーる'])
+        self.assertEqual(self.index.lookup('あせとあみのふぇん'), [])
+        self.assertEqual(self.index.lookup('かろなある'), [(1, 'カロナール', 1)])
+        self.index.remove(1)
+        self.index.remove(1)
+        self.assertEqual(self.index.lookup('かろなある'), [])
+        self.assertEqual(len(self.index), 2)
+
+
+class FuzzySearchEndpointTest(unittest.TestCase):
+    def search(self, query):
+        return client.get('/search', query_string={'q': query, 'fuzzy': '1'}).get_json()
+
+    def test_typo_is_found_after_exact_matches(self):
+        results = self.search('ワイドシリン')
+        self.assertEqual(results[:2], [{'drug_name': 'ワイドシリン細粒10%', 'distance': 0},
+                                       {'drug_name': 'ワイドシリン細粒20%', 'distance': 0}])
+        typo = self.search('ワイドシリソ')
+        self.assertEqual({row['drug_name'] for row in typo if row['distance'] == 1},
+                         {'ワイドシリン細粒10%', 'ワイドシリン細粒20%'})
+        self.assertEqual([row['distance'] for row in typo], sorted(row['distance'] for row in typo))
+        self.assertLessEqual(len(typo), 5)
+
+    def test_without_fuzzy_typo_is_not_found(self):
+        self.assertEqual(client.get('/search', query_string={'q': 'ワイドシリソ'}).get_json(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
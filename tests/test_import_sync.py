@@ -0,0 +1,136 @@
+"""CSV の差分同期 (import_drugs_from_csv.py --sync) の追加・更新・削除、管理画面での編集の扱いと、内蔵データの取り込みを確認する"""
+import csv
+import json
+import os
+import unittest
+
+from script_workdir import CSV_FILE, ScriptWorkdirTest
+
+# 管理画面と同じく、GET /drugs/<id> で取得した内容の一部を変えて PUT する
+PUT_DRUG = '''
+import json
+import web_app
+client = web_app.app.test_client()
+drug_id, changes = int(sys.argv[1]), json.loads(sys.argv[2])
+drug = client.get(f'/drugs/{drug_id}').get_json()
+drug.update(changes)
+response = client.put(f'/drugs/{drug_id}', json=drug)
+assert response.status_code == 200, response.get_json()
+'''
+
+CSV_COLUMNS = ['drug_name', 'aliases', 'type', 'dosage_unit', 'daily_dose_per_kg', 'daily_frequency']
+
+
+class SyncDrugsTest(ScriptWorkdirTest):
+    def write_csv(self, rows, name='drugs.csv'):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+        return path
+
+    def sync(self, source):
+        return self.run_script('import_drugs_from_csv.py', '--sync', source)
+
+    def drugs(self):
+        return dict(self.query("SELECT drug_name, daily_dose_per_kg FROM drugs"))
+
+    def drug_id(self, drug_name):
+        return self.query("SELECT id FROM drugs WHERE drug_name = ?", (drug_name,))[0][0]
+
+    def put_drug(self, current_name, **changes):
+        self.run_python(PUT_DRUG, str(self.drug_id(current_name)), json.dumps(changes))
+
+    def test_insert_update_delete_and_skip(self):
+        self.sync(self.write_csv([
+            {'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.1'},
+            {'drug_name': '薬B', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.2'},
+            {'drug_name': '薬C', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.3'},
+        ]))
+        self.assertEqual(self.drugs(), {'薬A': 0.1, '薬B': 0.2, '薬C': 0.3})
+        id_a = self.drug_id('薬A')
+        version = self.query("SELECT version FROM catalog_version WHERE id = 1")[0][0]
+
+        # 変更がなければ何も書き込まず、カタログのバージョンも上げない
+        self.assertIn('変更はありませんでした', self.sync(self.write_csv([
+            {'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.1'},
+            {'drug_name': '薬B', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.2'},
+            {'drug_name': '薬C', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.3'},
+        ])))
+        self.assertEqual(self.query("SELECT version FROM catalog_version WHERE id = 1")[0][0], version)
+
+        # 薬A は更新、薬B は行が不正 (dosage_unit が空) でスキップ、薬C は削除、薬D は追加
+        output = self.sync(self.write_csv([
+            {'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.15'},
+            {'drug_name': '薬B', 'dosage_unit': '', 'daily_dose_per_kg': '0.2'},
+            {'drug_name': '薬D', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.4'},
+        ]))
+        self.assertIn('スキップしました', output)
+        self.assertEqual(self.drugs(), {'薬A': 0.15, '薬B': 0.2, '薬D': 0.4})
+        self.assertEqual(self.drug_id('薬A'), id_a)
+        self.assertGreater(self.query("SELECT version FROM catalog_version WHERE id = 1")[0][0], version)
+
+    def test_admin_edit_is_not_reverted(self):
+        self.sync(CSV_FILE)
+        drug_count = len(self.drugs())
+        self.put_drug('オゼックス細粒15%', daily_dose_per_kg=0.06)
+
+        output = self.sync(CSV_FILE)
+        self.assertIn('競合', output)
+        self.assertIn('更新: 0 件', output)
+        drugs = self.drugs()
+        self.assertEqual(drugs['オゼックス細粒15%'], 0.06)
+        self.assertEqual(len(drugs), drug_count)
+
+    def test_admin_rename_is_not_duplicated(self):
+        self.sync(CSV_FILE)
+        drug_count = len(self.drugs())
+        drug_id = self.drug_id('オゼックス細粒15%')
+        self.put_drug('オゼックス細粒15%', drug_name='オゼックス細粒小児用15%')
+
+        output = self.sync(CSV_FILE)
+        self.assertIn('追加: 0 件', output)
+        self.assertIn('削除: 0 件', output)
+        drugs = self.drugs()
+        self.assertEqual(len(drugs), drug_count)
+        self.assertNotIn('オゼックス細粒15%', drugs)
+        self.assertEqual(self.drug_id('オゼックス細粒小児用15%'), drug_id)
+
+    def test_drug_added_in_admin_is_kept(self):
+        self.sync(self.write_csv([{'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.1'}]))
+        self.run_python('''
+import web_app
+response = web_app.app.test_client().post('/drugs', json={'drug_name': '薬X', 'dosage_unit': 'kg'})
+assert response.status_code == 201, response.get_json()
+''')
+        # 取り込み元にない、管理画面で追加した薬は削除しない。同じ名前の薬が取り込み元に現れても上書きしない
+        self.sync(self.write_csv([{'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.1'}]))
+        self.assertIn('薬X', self.drugs())
+        output = self.sync(self.write_csv([
+            {'drug_name': '薬A', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.1'},
+            {'drug_name': '薬X', 'dosage_unit': 'kg', 'daily_dose_per_kg': '0.5'},
+        ]))
+        self.assertIn('競合', output)
+        self.assertIsNone(self.drugs()['薬X'])
+
+
+class EmbeddedDataImportTest(ScriptWorkdirTest):
+    def test_import_embedded_data(self):
+        output = self.run_python('''
+from import_drugs_from_csv import clear_all_drugs_data, import_drugs_from_embedded_data
+clear_all_drugs_data()
+print(import_drugs_from_embedded_data())
+print('psycopg2' in sys.modules)
+''')
+        imported, psycopg2_loaded = output.splitlines()[-2:]
+        self.assertGreater(int(imported), 0)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drugs"), [(int(imported),)])
+        self.assertEqual(self.query("SELECT daily_dose_per_kg FROM drugs WHERE drug_name = 'オゼックス細粒15%'"), [(0.08,)])
+        # SQLite を使う場合は PostgreSQL のドライバを読み込まない
+        self.assertEqual(psycopg2_loaded, 'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
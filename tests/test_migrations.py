@@ -0,0 +1,82 @@
+"""旧スキーマ (create_db.py) の DB などに migrations.py を適用し、現行のスキーマにそろうことを確認する"""
+import unittest
+
+from script_workdir import ScriptWorkdirTest
+
+
+class MigrateTest(ScriptWorkdirTest):
+    migrate_on_setup = False
+
+    def columns(self, table_name):
+        return {row[1] for row in self.query(f"PRAGMA table_info({table_name})")}
+
+    def schema(self):
+        return self.query("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")
+
+    def latest_version(self):
+        return int(self.run_python("import migrations; print(migrations.LATEST_VERSION)"))
+
+    def test_legacy_create_db_schema(self):
+        self.run_script('create_db.py')
+        self.run_script('insert_sample_data.py')
+        legacy_rows = self.query("SELECT id, drug_name, dose_per_kg, fixed_dose, dose_age_specific FROM drugs ORDER BY id")
+        self.assertTrue(legacy_rows)
+
+        self.run_script('migrations.py')
+        latest = self.latest_version()
+        self.assertEqual(self.query("SELECT version FROM schema_version ORDER BY version"),
+                         [(version,) for version in range(1, latest + 1)])
+        self.assertLessEqual({'single_dose_per_kg', 'daily_dose_per_kg', 'usage_type', 'calculated_dose_unit',
+                              'drug_name_key', 'aliases_key', 'row_hash', 'source_key'}, self.columns('drugs'))
+        # 旧スキーマのデータはそのまま残る
+        self.assertEqual(self.query("SELECT id, drug_name, dose_per_kg, fixed_dose, dose_age_specific FROM drugs ORDER BY id"),
+                         legacy_rows)
+
+        # 既存の行に検索キーが付き、部分一致検索の索引・変更履歴にも登録される
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drugs WHERE drug_name_key IS NULL OR aliases_key IS NULL"), [(0,)])
+        self.assertEqual(self.query("SELECT drug_name_key FROM drugs WHERE drug_name = 'カロナール細粒20%'"),
+                         [('かろなーる細粒20%',)])
+        self.assertEqual(self.query("SELECT rowid FROM drugs_fts WHERE drugs_fts MATCH '\"ろなー\"'"),
+                         self.query("SELECT id FROM drugs WHERE drug_name_key LIKE '%ろなー%' ORDER BY id"))
+        version = self.query("SELECT version FROM catalog_version WHERE id = 1")[0][0]
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drug_changes WHERE version = ?", (version,)),
+                         [(len(legacy_rows),)])
+        # 管理画面などで追加された行と同じく、差分同期では上書き・削除しない
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drugs WHERE source_key IS NOT NULL OR row_hash IS NOT NULL"), [(0,)])
+
+    def test_migrate_is_idempotent(self):
+        self.run_script('create_db.py')
+        self.run_script('migrations.py')
+        schema = self.schema()
+        output = self.run_script('migrations.py')
+        self.assertIn('スキーマは最新です', output)
+        self.assertEqual(self.schema(), schema)
+        self.assertIn(f"スキーマバージョン: {self.latest_version()}", self.run_script('migrations.py', '--status'))
+
+    def test_sqlite_serial_id_is_fixed(self):
+        # 以前の create_tables で 'id SERIAL PRIMARY KEY' として作られ、id が NULL のまま登録された DB
+        self.run_python(
+            "import sqlite3\n"
+            "conn = sqlite3.connect('drug_data.db')\n"
+            "conn.execute('CREATE TABLE drugs (id SERIAL PRIMARY KEY, drug_name TEXT NOT NULL UNIQUE, aliases TEXT,"
+            " dosage_unit TEXT NOT NULL)')\n"
+            "conn.execute(\"INSERT INTO drugs (id, drug_name, dosage_unit) VALUES (5, 'A', 'kg')\")\n"
+            "conn.execute(\"INSERT INTO drugs (drug_name, dosage_unit) VALUES ('B', 'kg')\")\n"
+            "conn.commit()\n"
+        )
+        self.run_script('migrations.py')
+        rows = self.query("SELECT id, drug_name FROM drugs ORDER BY drug_name")
+        self.assertEqual(rows[0], (5, 'A'))
+        self.assertIsNotNone(rows[1][0])
+        self.assertNotEqual(rows[1][0], 5)
+        self.run_python(
+            "import sqlite3\n"
+            "conn = sqlite3.connect('drug_data.db')\n"
+            "conn.execute(\"INSERT INTO drugs (drug_name, dosage_unit) VALUES ('C', 'kg')\")\n"
+            "conn.commit()\n"
+        )
+        self.assertEqual(self.query("SELECT COUNT(*) FROM drugs WHERE id IS NULL"), [(0,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
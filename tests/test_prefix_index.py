@@ -0,0 +1,58 @@
+"""入力補完の前方一致索引 (prefix_index.PrefixIndex) の並び順と、薬の登録・置き換え・削除を確認する"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prefix_index import MATCH_EXACT, MATCH_PREFIX, SOURCE_ALIAS, SOURCE_NAME, SOURCE_TOKEN, PrefixIndex  # noqa: E402
+
+DRUGS = [
+    (1, 'カロナール細粒20%', [('かろなーる細粒20%', SOURCE_NAME), ('あせとあみのふぇん', SOURCE_ALIAS),
+                          ('かろなーる', SOURCE_TOKEN), ('細粒', SOURCE_TOKEN)]),
+    (2, 'カロナール', [('かろなーる', SOURCE_NAME), ('あせとあみのふぇん', SOURCE_ALIAS)]),
+    (3, 'ムコダイン細粒50%', [('むこだいん細粒50%', SOURCE_NAME), ('細粒', SOURCE_TOKEN)]),
+]
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.bulk_load(DRUGS)
+
+    def test_lookup_order(self):
+        # 完全一致 > 前方一致、同じ一致の種類の中では 薬名 > 別名 > トークン、語の短さの順
+        self.assertEqual(self.index.lookup('かろなーる'), [(MATCH_EXACT, 'カロナール', 2), (MATCH_EXACT, 'カロナール細粒20%', 1)])
+        self.assertEqual(self.index.lookup('かろ'), [(MATCH_PREFIX, 'カロナール', 2), (MATCH_PREFIX, 'カロナール細粒20%', 1)])
+        self.assertEqual(self.index.lookup('細'), [(MATCH_PREFIX, 'カロナール細粒20%', 1), (MATCH_PREFIX, 'ムコダイン細粒50%', 3)])
+        self.assertEqual(self.index.lookup('かろ', limit=1), [(MATCH_PREFIX, 'カロナール', 2)])
+        self.assertEqual(self.index.lookup(''), [])
+        self.assertEqual(self.index.lookup('かろなーるし'), [])
+
+    def test_scan_limit(self):
+        index = PrefixIndex(scan_limit=1)
+        index.bulk_load(DRUGS)
+        self.assertEqual(len(index.lookup('あせと')), 1)
+
+    def test_add_and_remove(self):
+        self.index.add(3, 'ムコサール', [('むこさーる', SOURCE_NAME)])
+        self.assertEqual(self.index.lookup('むこ'), [(MATCH_PREFIX, 'ムコサール', 3)])
+        self.assertEqual(self.index.lookup('細粒'), [(MATCH_EXACT, 'カロナール細粒20%', 1)])
+        self.index.remove(2)
+        self.index.remove(2)
+        self.assertEqual(self.index.lookup('あせと'), [(MATCH_PREFIX, 'カロナール細粒20%', 1)])
+        self.assertEqual(len(self.index), 2)
+
+    def test_bulk_load_replaces_registered_drugs(self):
+        self.index.bulk_load([(3, 'ムコサール', [('むこさーる', SOURCE_NAME)])])
+        self.assertEqual(self.index.lookup('むこだいん'), [])
+        self.assertEqual(self.index.lookup('細粒'), [(MATCH_EXACT, 'カロナール細粒20%', 1)])
+        self.assertEqual(self.index.lookup('むこ'), [(MATCH_PREFIX, 'ムコサール', 3)])
+        self.assertEqual(len(self.index), 3)
+        # 置き換えた後も add / remove で配列と薬ごとの語が食い違わない
+        self.index.remove(3)
+        self.assertEqual(self.index.lookup('むこ'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+"""Web アプリ (web_app) をテストするためのクライアント。
+
+web_app はカレントディレクトリの drug_data.db を使うので、一時ディレクトリに drugs_data.csv を取り込み、
+そこをカレントディレクトリにしてから読み込む (テストのプロセスで1回だけ行う)。
+"""
+import atexit
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from script_workdir import CSV_FILE, REPO_DIR
+
+os.environ.pop('DATABASE_URL', None)
+os.environ['STARTUP_WARMUP'] = '0'
+
+workdir = tempfile.mkdtemp(prefix='drug_app_test_')
+atexit.register(shutil.rmtree, workdir, True)
+for script, *args in (('migrations.py',), ('import_drugs_from_csv.py', CSV_FILE)):
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, script), *args],
+                   cwd=workdir, capture_output=True, check=True)
+os.chdir(workdir)
+
+sys.path.insert(0, REPO_DIR)
+import web_app  # noqa: E402
+
+client = web_app.app.test_client()
@@ -1,371 +1,476 @@
-from flask import Flask, render_template, request, jsonify
-import sqlite3
-import json
-import os 
-import psycopg2 
-import psycopg2.extras 
-
-app = Flask(__name__)
-
-DATABASE_URL = os.environ.get('DATABASE_URL')
-
-def get_db_connection():
-    conn = None 
-    if DATABASE_URL:
-        conn = psycopg2.connect(DATABASE_URL)
-        cursor_factory_class = psycopg2.extras.DictCursor
-    else:
-        DATABASE_DIR = '.' 
-        if not os.path.exists(DATABASE_DIR):
-            os.makedirs(DATABASE_DIR)
-        DATABASE_FILE = os.path.join(DATABASE_DIR, 'drug_data.db')
-        conn = sqlite3.connect(DATABASE_FILE)
-        conn.row_factory = sqlite3.Row
-        cursor_factory_class = None 
-
-    return conn, cursor_factory_class 
-
-# アプリケーション起動時にDBの初期設定（テーブル作成）を行う
-with app.app_context():
-    conn = None
-    try:
-        conn_obj, cursor_factory_class = get_db_connection()
-        conn = conn_obj
+import time
+# 起動時間の内訳を記録するため、他のモジュールを読み込む前の時刻を控えておく
+_import_started_at = time.perf_counter()
 
-        if DATABASE_URL:
-            cursor = conn.cursor(cursor_factory=cursor_factory_class)
+from flask import Blueprint, Flask, Response, abort, make_response, render_template, request, jsonify, send_file
+import functools
+import hmac
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import compression
+import database
+import dosage_engine
+import drug_cache
+import drug_search
+import json_provider
+import metrics
+import migrations
+import profiler
+import query_stats
+from database import DATABASE_URL
+from drug_cache import catalog_cache
+
+bp = Blueprint('drug_app', __name__)
+
+
+def catalog_etag():
+    """カタログのバージョンから ETag を作る (カタログが変更されるたびに変わる)"""
+    etag = f"catalog-{catalog_cache.current_version()}"
+    return f"{etag}-{ETAG_BUILD_ID}" if ETAG_BUILD_ID else etag
+
+
+def conditional_on_catalog(view):
+    """カタログの内容とURLだけで決まるレスポンスに ETag と Cache-Control を付ける。
+
+    リクエストの If-None-Match が現在の ETag と一致すれば、ビューを呼び出さずに 304 を返す。
+    ETag はビューを呼び出す前のバージョンで作るので、途中でカタログが変わっても
+    古い ETag に新しい内容が付くだけで、次のリクエストで取り直される。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = catalog_etag()
+        # 圧縮などで弱い ETag (W/"...") に変えられても一致するよう、弱い比較を使う
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
         else:
-            cursor = conn.cursor()
-        
-        create_table_sql = '''
-            CREATE TABLE IF NOT EXISTS drugs (
-                id SERIAL PRIMARY KEY, 
-                drug_name TEXT NOT NULL UNIQUE,
-                aliases TEXT,
-                type TEXT,
-                dosage_unit TEXT NOT NULL, -- 'kg', 'age', 'fixed' (基本単位)
-
-                -- 1回あたり用量に関するフィールド (頓服や内服の1回量計算に使用)
-                single_dose_per_kg REAL,
-                single_fixed_dose REAL,
-                single_dose_age_specific TEXT, -- JSON形式: {"min_age-max_age": dose}
-
-                -- 1日総量に関するフィールド (主に内服薬の1日総量計算に使用)
-                daily_dose_per_kg REAL,
-                daily_fixed_dose REAL,
-                daily_dose_age_specific TEXT, -- JSON形式: {"min_age-max_age": dose}
-                
-                -- 各薬で共通の用量情報
-                min_age_months INTEGER,
-                max_age_months INTEGER,
-                
-                daily_frequency TEXT,       -- カンマ区切り例: "1,2,3"
-                notes TEXT,
-                usage_type TEXT DEFAULT '内服', -- '内服' or '頓服'
-                timing_options TEXT,        -- カンマ区切り例: "毎食後,必要時"
-                formulation_type TEXT,      -- 剤形 (例: 細粒, テープ, 坐剤)
-                calculated_dose_unit TEXT,  -- 最終的な計算結果の単位 (例: mg, ml, g, 個)
-
-                max_daily_fixed_dose REAL,  -- 絶対的な1日最大量 (例: カロナールは4000mg)
-                max_daily_times INTEGER     -- 頓服薬の1日最大服用回数 (例: 頓服は1日3回まで)
-            );
-        '''
-        cursor.execute(create_table_sql)
-        conn.commit()
-        print("データベーステーブル 'drugs' が存在することを確認（または作成）しました。")
-    except Exception as e:
-        print(f"データベースの初期化中にエラーが発生しました: {e}")
-    finally:
-        if conn:
-            conn.close()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        if CATALOG_RESPONSE_MAX_AGE > 0:
+            response.headers['Cache-Control'] = f"public, max-age={CATALOG_RESPONSE_MAX_AGE}, must-revalidate"
+        else:
+            response.headers['Cache-Control'] = "public, no-cache"
+        return response
+    return wrapper
 
+def admin_only(view):
+    """管理用の統計APIを、ADMIN_TOKEN と同じ値の X-Admin-Token を付けたリクエストだけに返す。
 
-@app.route('/')
+    ADMIN_TOKEN が未設定の場合と、トークンが正しくない場合はエンドポイントがないものとして 404 を返す。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get(ADMIN_TOKEN_HEADER, '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
+
+# 一括計算APIで1回に受け付ける最大件数
+DOSAGE_BATCH_MAX_ITEMS = int(os.environ.get('DOSAGE_BATCH_MAX_ITEMS', '500'))
+# 用量早見表の最大セル数 (体重の刻み数 × 年齢の数) と、生成済みの表を保持する件数
+DOSE_CHART_MAX_CELLS = int(os.environ.get('DOSE_CHART_MAX_CELLS', '20000'))
+DOSE_CHART_CACHE_MAX_ENTRIES = int(os.environ.get('DOSE_CHART_CACHE_MAX_ENTRIES', '64'))
+# 入力補完APIで返す候補数の既定値と上限
+AUTOCOMPLETE_DEFAULT_LIMIT = int(os.environ.get('AUTOCOMPLETE_DEFAULT_LIMIT', '10'))
+AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get('AUTOCOMPLETE_MAX_LIMIT', '50'))
+# 起動時にテンプレートのコンパイルとカタログの読み込みを済ませておくか (STARTUP_WARMUP=0 で無効)
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', '1') != '0'
+# カタログの読み取りAPIのレスポンスをブラウザ・プロキシにキャッシュさせる秒数。
+# 0 の場合は毎回 ETag で再検証させる (カタログが変わっていなければ 304 が返る)
+CATALOG_RESPONSE_MAX_AGE = int(os.environ.get('CATALOG_RESPONSE_MAX_AGE', '0'))
+# レスポンスの形式はアプリのコードによっても変わるため、デプロイしたコミットを ETag に含める
+ETAG_BUILD_ID = os.environ.get('RENDER_GIT_COMMIT', '')[:12]
+# /admin/ 以下の統計APIに必要なトークン (未設定の場合は統計APIを公開しない)
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+# API のレスポンスに含めない drugs の内部用カラム (検索キーと差分同期の管理用)
+INTERNAL_DRUG_COLUMNS = ('drug_name_key', 'aliases_key', 'row_hash', 'source_key')
+
+
+_numpy = None
+_numpy_checked = False
+
+def numpy_module():
+    """NumPy を初めて使うときに読み込んで返す (起動時間を短くするため遅延させる)。
+
+    NumPy がない環境では None を返し、呼び出し側は通常の計算で処理する。
+    """
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+        _numpy_checked = True
+    return _numpy
+
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/manage')
+@bp.route('/manage')
 def manage_drugs_page():
     return render_template('manage_drugs.html')
 
-@app.route('/search')
+@bp.route('/search')
+@conditional_on_catalog
 def search_drugs_api():
     search_term = request.args.get('q', '').strip()
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
-    
     limit = 5 
-    
-    query_placeholder = '%s' if DATABASE_URL else '?'
-
-    query = f"""
-        SELECT drug_name FROM drugs
-        WHERE drug_name ILIKE {query_placeholder} OR aliases ILIKE {query_placeholder}
-        ORDER BY drug_name
-        LIMIT {limit}
+    # fuzzy=1 の場合は、表記ゆれ・入力ミスのある候補も編集距離の近い順に返す
+    fuzzy = request.args.get('fuzzy', '').lower() in ('1', 'true')
+    results = drug_search.search_drugs(search_term, limit=limit, fuzzy=fuzzy)
+    if fuzzy:
+        return jsonify([{"drug_name": row['drug_name'], "distance": row['distance']} for row in results])
+    return jsonify([{"drug_name": row['drug_name']} for row in results])
+
+@bp.route('/autocomplete')
+@conditional_on_catalog
+def autocomplete_api():
+    """入力中の文字列に前方一致する薬名を返す (検索欄の入力補完用)。
+
+    DB には問い合わせず、ワーカー内の前方一致索引から引く。
     """
-    cursor.execute(query, (f'%{search_term}%', f'%{search_term}%'))
-    
-    results = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in results])
-
-@app.route('/search_by_type')
+    search_term = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', AUTOCOMPLETE_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit は整数で指定してください。"}), 400
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+    if not search_term:
+        return jsonify([])
+    results = drug_search.autocomplete(search_term, limit)
+    return jsonify([{"drug_name": row['drug_name'], "match": row['match']} for row in results])
+
+@bp.route('/search_by_type')
+@conditional_on_catalog
 def search_by_type_api():
     selected_type = request.args.get('type', '').strip()
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
-    
     limit = 5
 
-    query_base = "SELECT drug_name FROM drugs WHERE type = %s ORDER BY drug_name LIMIT %s"
-    if not DATABASE_URL: # SQLiteの場合
-        query_base = query_base.replace('%s', '?')
-
-    if selected_type:
-        cursor.execute(query_base, (selected_type, limit))
-    else: 
+    if not selected_type:
         return jsonify([]) 
 
-    results = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in results])
+    cached_rows = catalog_cache.all_rows()
+    if cached_rows is not None:
+        names = sorted(row['drug_name'] for row in cached_rows if row['type'] == selected_type)
+        return jsonify([{"drug_name": name} for name in names[:limit]])
 
-@app.route('/calculate_dosage', methods=['POST'])
-def calculate_dosage_api():
-    data = request.get_json()
-    drug_name = data.get('drug_name')
-    patient_weight_str = data.get('weight')
-    patient_age_years_str = data.get('age_years') 
+    with database.connection() as conn:
+        cursor = database.cursor(conn)
+        p = database.PARAM
+        cursor.execute(f"SELECT drug_name FROM drugs WHERE type = {p} ORDER BY drug_name LIMIT {p}", (selected_type, limit))
+        results = cursor.fetchall()
+    return jsonify([dict(row) for row in results])
 
+def parse_patient_inputs(patient_weight_str, patient_age_years_str):
+    """体重・年齢の入力値を検証し、(体重, 年齢(歳), エラー) を返す"""
     try:
         patient_weight = float(patient_weight_str) if patient_weight_str else 0.0
-        if patient_weight <= 0:
-            return jsonify({"error": "患者体重が正しくありません。", "drug_data": None}), 400
-    except ValueError:
-        return jsonify({"error": "患者体重は数値で入力してください。", "drug_data": None}), 400
+        if not 0 < patient_weight < math.inf:  # nan・inf も不正な体重として扱う
+            return None, None, "患者体重が正しくありません。"
+    except (TypeError, ValueError):
+        return None, None, "患者体重は数値で入力してください。"
 
-    patient_age_months = None
-    if not patient_age_years_str or int(patient_age_years_str) < 0: 
-        return jsonify({"error": "患者年齢は必須です。正しく入力してください。", "drug_data": None}), 400
     try:
+        if not patient_age_years_str or int(patient_age_years_str) < 0: 
+            return None, None, "患者年齢は必須です。正しく入力してください。"
         patient_age_years = int(patient_age_years_str)
-        patient_age_months = patient_age_years * 12
-    except ValueError:
-        return jsonify({"error": "患者年齢は数値で入力してください。", "drug_data": None}), 400
+    except (TypeError, ValueError):
+        return None, None, "患者年齢は数値で入力してください。"
+    return patient_weight, patient_age_years, None
+
+def dose_rule(drug_info):
+    """薬の行をコンパイル済みの用量規則にする (コンパイルは行ごとに一度だけで、年齢別用量の解析を含むため
+    その時間は Server-Timing の age_bands に記録する)"""
+    rule = dosage_engine.cached_rule(drug_info)
+    if rule is None:
+        with metrics.timed_phase('age_bands'):
+            rule = dosage_engine.rule_for(drug_info)
+    return rule
+
+@bp.route('/calculate_dosage', methods=['POST'])
+def calculate_dosage_api():
+    data = request.get_json()
+    drug_name = data.get('drug_name')
 
+    patient_weight, patient_age_years, input_error = parse_patient_inputs(data.get('weight'), data.get('age_years'))
+    if input_error:
+        return jsonify({"error": input_error, "drug_data": None}), 400
 
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
-    
-    query_placeholder = '%s' if DATABASE_URL else '?'
-    # 新しいカラムも取得するようにSELECT * を使用
-    cursor.execute(f"SELECT * FROM drugs WHERE drug_name = {query_placeholder}", (drug_name,))
-    drug_info = cursor.fetchone()
-    conn.close()
+    # 薬の情報はワーカー内のカタログキャッシュから取得する (全カラムを保持)
+    drug_info = catalog_cache.get_by_name(drug_name)
 
     if not drug_info:
         return jsonify({"error": "薬の情報が見つかりません。", "drug_data": None}), 404
 
-    # 年齢バリデーション
-    if patient_age_months is not None: 
-        min_age_drug = drug_info['min_age_months']
-        max_age_drug = drug_info['max_age_months']
+    response_data, status = dose_rule(drug_info).calculate(patient_weight, patient_age_years * 12)
+    return jsonify(response_data), status
 
-        if min_age_drug is not None and patient_age_months < min_age_drug:
-            min_age_years_display = f"{min_age_drug // 12}歳"
-            if min_age_drug % 12 > 0:
-                min_age_years_display += f"{min_age_drug % 12}ヶ月"
-            return jsonify({"error": f"{drug_name} は {min_age_years_display}未満の患者には推奨されません。", "drug_data": None}), 400
-        
-        if max_age_drug is not None and patient_age_months > max_age_drug:
-            max_age_years_display = f"{max_age_drug // 12}歳"
-            if max_age_drug % 12 > 0:
-                max_age_years_display += f"{max_age_drug % 12}ヶ月"
-            return jsonify({"error": f"{drug_name} は {max_age_years_display}を超える患者には推奨されません。", "drug_data": None}), 400
-
-    calculated_dose_for_frontend = None # フロントエンドに返す、計算された用量
-    final_dose_unit = "" 
-    usage_type = drug_info['usage_type'] if drug_info['usage_type'] else "内服"
-    
-    # 薬の用法タイプによって計算を分岐
-    if usage_type == '頓服':
-        # 頓服薬の1回用量を計算
-        single_dose_value = None
-        if drug_info['dosage_unit'] == 'kg':
-            if drug_info['single_dose_per_kg'] is not None:
-                single_dose_value = patient_weight * drug_info['single_dose_per_kg']
-            else:
-                return jsonify({"error": f"{drug_name} (頓服) は体重基準ですが、1回あたりの用量データが設定されていません。", "drug_data": None}), 400
-        elif drug_info['dosage_unit'] == 'age':
-            if drug_info['single_dose_age_specific']:
-                age_doses = json.loads(drug_info['single_dose_age_specific'])
-                for age_range_str, dose in age_doses.items():
-                    min_age_db, max_age_db = map(int, age_range_str.split('-'))
-                    if min_age_db <= patient_age_months <= max_age_db:
-                        single_dose_value = dose
-                        break
-                if single_dose_value is None:
-                    return jsonify({"error": f"{drug_name} (頓服) は年齢基準ですが、入力された年齢 ({patient_age_years}歳) に該当する1回用量が見つかりません。", "drug_data": None}), 400
-            else:
-                return jsonify({"error": f"{drug_name} (頓服) は年齢基準ですが、1回用量データが設定されていません。", "drug_data": None}), 400
-        elif drug_info['dosage_unit'] == 'fixed':
-            if drug_info['single_fixed_dose'] is not None:
-                single_dose_value = drug_info['single_fixed_dose']
-            else:
-                return jsonify({"error": f"{drug_name} (頓服) は固定用量ですが、1回用量データが設定されていません。", "drug_data": None}), 400
-        else:
-            return jsonify({"error": f"{drug_name} (頓服) の用量計算の基準が不明です。", "drug_data": None}), 400
-        
-        calculated_dose_for_frontend = single_dose_value # 頓服の場合、フロントエンドには1回用量を渡す
-        
-        # 1日最大総量のバリデーション (頓服でも適用される場合)
-        max_daily_fixed_dose = drug_info['max_daily_fixed_dose']
-        if max_daily_fixed_dose is not None and calculated_dose_for_frontend is not None:
-            # 暫定的に1回量がmax_daily_fixed_doseを超えるのはおかしい
-            if calculated_dose_for_frontend > max_daily_fixed_dose:
-                return jsonify({"error": f"{drug_name} の1回用量 ({calculated_dose_for_frontend:.3f}) が絶対的な1日最大量 ({max_daily_fixed_dose:.3f}) を超えています。", "drug_data": None}), 400
-
-    else: # 内服薬の場合
-        # 内服薬の1日総量を計算
-        if drug_info['dosage_unit'] == 'kg':
-            if drug_info['daily_dose_per_kg'] is not None: 
-                calculated_dose_for_frontend = patient_weight * drug_info['daily_dose_per_kg']
-            else:
-                return jsonify({"error": f"{drug_name} (内服) は体重基準ですが、1日あたりの用量データが設定されていません。", "drug_data": None}), 400
-        elif drug_info['dosage_unit'] == 'age':
-            if drug_info['daily_dose_age_specific']: 
-                age_doses = json.loads(drug_info['daily_dose_age_specific'])
-                for age_range_str, dose in age_doses.items():
-                    min_age_db, max_age_db = map(int, age_range_str.split('-'))
-                    if min_age_db <= patient_age_months <= max_age_db:
-                        calculated_dose_for_frontend = dose
-                        break
-                if calculated_dose_for_frontend is None:
-                    return jsonify({"error": f"{drug_name} (内服) は年齢基準ですが、入力された年齢 ({patient_age_years}歳) に該当する1日用量が見つかりません。", "drug_data": None}), 400
-            else:
-                return jsonify({"error": f"{drug_name} (内服) は年齢基準ですが、1日用量データが設定されていません。", "drug_data": None}), 400
-        elif drug_info['dosage_unit'] == 'fixed':
-            if drug_info['daily_fixed_dose'] is not None: 
-                calculated_dose_for_frontend = drug_info['daily_fixed_dose']
-            else:
-                return jsonify({"error": f"{drug_name} (内服) は固定用量ですが、1日総量データが設定されていません。", "drug_data": None}), 400
-        else:
-            return jsonify({"error": f"{drug_name} (内服) の用量計算の基準が不明です。", "drug_data": None}), 400
-
-        # 1日最大総量のバリデーション (内服でも適用される場合)
-        max_daily_fixed_dose = drug_info['max_daily_fixed_dose']
-        if max_daily_fixed_dose is not None and calculated_dose_for_frontend is not None:
-            if calculated_dose_for_frontend > max_daily_fixed_dose:
-                return jsonify({"error": f"{drug_name} の1日総量 ({calculated_dose_for_frontend:.3f}) は、絶対的な1日最大量 ({max_daily_fixed_dose:.3f}) を超えています。", "drug_data": None}), 400
-    
-    # 最終的な単位の設定
-    if drug_info['calculated_dose_unit']:
-        final_dose_unit = drug_info['calculated_dose_unit']
-    else: # calculated_dose_unit が設定されていない場合のフォールバック
-        if drug_info['formulation_type'] == '細粒':
-            final_dose_unit = "mg" # もしくは g など
-            # ここで濃度計算が必要であれば追加
-            # 例: もし calculated_dose_for_frontend が mg 単位で、表示は g にしたい場合
-            # if drug_info.get('concentration_mg_per_g'):
-            #    calculated_dose_for_frontend /= drug_info['concentration_mg_per_g']
-            #    final_dose_unit = "g"
-        elif drug_info['formulation_type'] == 'シロップ':
-            final_dose_unit = "ml"
-        elif drug_info['formulation_type'] in ['テープ', '貼付剤', '坐剤']:
-            final_dose_unit = "枚" # または 個
+def multiply_weights(weights, dose_per_kg):
+    """体重のリストに kg あたりの用量をまとめて掛ける"""
+    np = numpy_module()
+    if np is not None:
+        return (np.asarray(weights, dtype=float) * dose_per_kg).tolist()
+    return [weight * dose_per_kg for weight in weights]
+
+@bp.route('/calculate_dosage_batch', methods=['POST'])
+def calculate_dosage_batch_api():
+    """複数患者・複数薬の用量を一括で計算する (病棟回診用)。
+
+    リクエスト: {"items": [{"drug_name": ..., "weight": ..., "age_years": ...}, ...]}
+    (各要素は [drug_name, weight, age_years] の配列でもよい)
+    レスポンス: {"results": [{"index": i, "status": HTTPステータス, "result": /calculate_dosage と同じ本体}, ...]}
+    """
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({"error": "items には計算対象の配列を指定してください。"}), 400
+    if len(items) > DOSAGE_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"一度に計算できるのは {DOSAGE_BATCH_MAX_ITEMS} 件までです。"}), 400
+
+    parsed_items = []
+    for item in items:
+        if isinstance(item, dict):
+            drug_name, weight_str, age_years_str = item.get('drug_name'), item.get('weight'), item.get('age_years')
+        elif isinstance(item, (list, tuple)) and len(item) == 3:
+            drug_name, weight_str, age_years_str = item
         else:
-            final_dose_unit = "mg" # デフォルト
-
-    # フロントエンドに返す daily_frequency_options を usage_type に応じて調整
-    daily_frequency_options_for_frontend = []
-    if usage_type == '内服' and drug_info['daily_frequency']:
-        daily_frequency_options_for_frontend = drug_info['daily_frequency'].split(',')
-    elif usage_type == '頓服':
-        # 頓服の場合は、daily_frequency_options は空にするか、
-        # 1日最大服用回数があればそれをオプションとして渡す
-        if drug_info['max_daily_times'] is not None:
-            daily_frequency_options_for_frontend = [str(i) for i in range(1, drug_info['max_daily_times'] + 1)]
+            parsed_items.append((None, None, None, "各項目は drug_name, weight, age_years を指定してください。"))
+            continue
+        if not isinstance(drug_name, str):
+            parsed_items.append((None, None, None, "drug_name には薬名を文字列で指定してください。"))
+            continue
+        patient_weight, patient_age_years, input_error = parse_patient_inputs(weight_str, age_years_str)
+        parsed_items.append((drug_name, patient_weight, patient_age_years, input_error))
+
+    # 必要な薬の情報をまとめて取得する
+    drug_names = [drug_name for drug_name, _, _, input_error in parsed_items if not input_error]
+    drugs = catalog_cache.get_many_by_name(drug_names)
+
+    # 体重基準の薬は、薬ごとに患者の体重をまとめて計算する
+    weight_groups = {}
+    for index, (drug_name, patient_weight, _, input_error) in enumerate(parsed_items):
+        drug_info = drugs.get(drug_name) if not input_error else None
+        if drug_info and dose_rule(drug_info).dose_per_kg is not None:
+            weight_groups.setdefault(drug_name, []).append(index)
+    kg_doses = {}
+    for drug_name, indices in weight_groups.items():
+        doses = multiply_weights([parsed_items[i][1] for i in indices], dose_rule(drugs[drug_name]).dose_per_kg)
+        kg_doses.update(zip(indices, doses))
+
+    results = []
+    for index, (drug_name, patient_weight, patient_age_years, input_error) in enumerate(parsed_items):
+        drug_info = drugs.get(drug_name) if not input_error else None
+        if input_error:
+            response_data, status = {"error": input_error, "drug_data": None}, 400
+        elif not drug_info:
+            response_data, status = {"error": "薬の情報が見つかりません。", "drug_data": None}, 404
         else:
-            daily_frequency_options_for_frontend = [] # 空にしてフロントエンドで「必要時」を推奨
-
-    # フロントエンドに返す timing_options を usage_type に応じて調整
-    timing_options_for_frontend = []
-    if drug_info['timing_options']:
-        all_timing_options = drug_info['timing_options'].split(',')
-        if usage_type == '内服':
-            # 内服で一般的なタイミングを優先 (例: '毎食後', '朝食後', '夕食後' など)
-            general_timings = ['朝食後', '昼食後', '夕食後', '毎食後', '朝', '昼', '夕', '眠前', '就寝前', '食前', '食間', '1日1回', '1日2回', '1日3回', '1日4回']
-            timing_options_for_frontend = [t for t in all_timing_options if any(gt in t for gt in general_timings)]
-            if not timing_options_for_frontend: # 見つからなければ全て返す
-                 timing_options_for_frontend = all_timing_options
-        else: # 頓服
-            # 頓服で一般的なタイミングを優先 (例: '必要時', '発熱時', '疼痛時' など)
-            situational_timings = ['時', '必要時', '頓服', '発熱時', '疼痛時', '嘔吐時', '咳嗽時', '喘息時']
-            timing_options_for_frontend = [t for t in all_timing_options if any(st in t for st in situational_timings)]
-            if not timing_options_for_frontend: # 見つからなければ「必要時」をデフォルト
-                timing_options_for_frontend = ['必要時']
-    else: # timing_options がDBにない場合
-        if usage_type == '頓服':
-            timing_options_for_frontend = ['必要時']
-        # 内服の場合は空のまま（フロントエンドで「タイミング候補なし」が表示される）
-    
-
-    response_data = {
-        "drug_name": drug_info['drug_name'],
-        "aliases": drug_info.get('aliases'), # フロントエンドで一般名を使用するため追加
-        "calculated_daily_dose_value": calculated_dose_for_frontend, # 名前は daily_dose_value だが、頓服では1回量
-        "dose_unit": final_dose_unit,
-        "formulation_type": drug_info['formulation_type'] if drug_info['formulation_type'] else "",
-        "notes": drug_info['notes'] if drug_info['notes'] else "",
-        "daily_frequency_options": daily_frequency_options_for_frontend, # 調整済み
-        "timing_options": timing_options_for_frontend,                   # 調整済み
-        "initial_usage_type": usage_type,
-        "min_age_months": drug_info['min_age_months'], 
-        "max_age_months": drug_info['max_age_months'], 
-        "max_daily_fixed_dose": drug_info['max_daily_fixed_dose'], # 必要に応じてフロントエンドへ
-        "max_daily_times": drug_info['max_daily_times'],           # 頓服の最大回数
+            response_data, status = dose_rule(drug_info).calculate(
+                patient_weight, patient_age_years * 12, kg_dose=kg_doses.get(index))
+        results.append({"index": index, "status": status, "result": response_data})
+    return jsonify({"results": results})
+
+# --- 用量早見表 (体重 × 年齢) ---
+# キー: (薬名, 体重・年齢の範囲, 形式) / 値: (表の元になった薬の行, 出力済みのチャンク)
+_dose_chart_cache = OrderedDict()
+_dose_chart_cache_lock = threading.Lock()
+DOSE_CHART_CACHE_LOOKUPS = metrics.Counter('drug_app_dose_chart_cache_lookups_total',
+                                           "用量早見表のキャッシュの参照数", ('result',))
+
+def clamp_to_max_daily_dose(doses, max_daily_fixed_dose):
+    """用量のリストを1日最大量で頭打ちにし、(頭打ち後の用量, 頭打ちしたかどうか) を返す"""
+    if max_daily_fixed_dose is None:
+        return list(doses), [False] * len(doses)
+    np = numpy_module()
+    if np is not None:
+        dose_array = np.asarray(doses, dtype=float)
+        return np.minimum(dose_array, max_daily_fixed_dose).tolist(), (dose_array > max_daily_fixed_dose).tolist()
+    return [min(dose, max_daily_fixed_dose) for dose in doses], [dose > max_daily_fixed_dose for dose in doses]
+
+def build_dose_chart(drug_info, weights, ages_years):
+    """1つの薬について体重 × 年齢の用量表を作成し、(表, エラー) を返す。
+
+    用量・年齢制限・エラー文は /calculate_dosage と同じ規則 (dosage_engine.DoseRule) から求めるが、
+    1日最大量を超える場合はエラーにせず最大量で頭打ちにして clamped フラグを立てる。年齢制限外の列は用量を None にする。
+    """
+    rule = dose_rule(drug_info)
+    if rule.data_error is not None:
+        return None, rule.data_error
+
+    age_status = [rule.age_limit(age_years * 12) or 'ok' for age_years in ages_years]
+
+    # 用量は体重だけ、または年齢だけで決まるので、1次元で計算してから表に展開する
+    weight_doses = None
+    age_doses = None
+    if rule.dose_per_kg is not None:
+        weight_doses = multiply_weights(weights, rule.dose_per_kg)
+    else:
+        age_doses = [rule.base_dose(None, age_years * 12)[0] for age_years in ages_years]
+        age_status = [
+            'no_age_band' if status == 'ok' and dose is None else status
+            for status, dose in zip(age_status, age_doses)
+        ]
+
+    max_daily_fixed_dose = rule.max_daily_fixed_dose
+    if weight_doses is not None:
+        weight_doses, weight_clamped = clamp_to_max_daily_dose(weight_doses, max_daily_fixed_dose)
+    else:
+        known = [dose if dose is not None else 0.0 for dose in age_doses]
+        clamped_doses, age_clamped = clamp_to_max_daily_dose(known, max_daily_fixed_dose)
+        age_doses = [None if dose is None else clamped for dose, clamped in zip(age_doses, clamped_doses)]
+
+    rows = []
+    for weight_index, weight in enumerate(weights):
+        doses = []
+        clamped = []
+        for age_index, status in enumerate(age_status):
+            if status != 'ok':
+                doses.append(None)
+                clamped.append(False)
+            elif weight_doses is not None:
+                doses.append(weight_doses[weight_index])
+                clamped.append(weight_clamped[weight_index])
+            else:
+                doses.append(age_doses[age_index])
+                clamped.append(age_clamped[age_index])
+        rows.append({"weight_kg": weight, "doses": doses, "clamped": clamped})
+
+    chart = {
+        "drug_name": rule.drug_name,
+        "usage_type": rule.usage_type,
+        "dosage_unit": drug_info['dosage_unit'],
+        "dose_unit": rule.dose_unit,
+        "max_daily_fixed_dose": max_daily_fixed_dose,
+        "min_age_months": rule.min_age_months,
+        "max_age_months": rule.max_age_months,
+        "weights_kg": weights,
+        "ages_years": ages_years,
+        "age_status": age_status,
+        "rows": rows,
     }
-    return jsonify(response_data)
+    return chart, None
+
+def render_dose_chart_json(chart):
+    header = {key: value for key, value in chart.items() if key != 'rows'}
+    yield json_provider.dumps(header)[:-1] + ',"rows":['
+    for index, row in enumerate(chart['rows']):
+        yield (',' if index else '') + json_provider.dumps(row)
+    yield ']}'
+
+def render_dose_chart_csv(chart):
+    # Excel で文字化けしないように BOM を付ける
+    yield '\ufeff' + ','.join(['体重(kg)'] + [f"{age}歳" for age in chart['ages_years']]) + '\r\n'
+    for row in chart['rows']:
+        cells = [f"{row['weight_kg']:g}"]
+        for dose, clamped in zip(row['doses'], row['clamped']):
+            if dose is None:
+                cells.append('')
+            else:
+                cells.append(f"{dose:.3f}" + ("(上限)" if clamped else ""))
+        yield ','.join(cells) + '\r\n'
+
+def stream_and_cache_dose_chart(cache_key, drug_info, chunks):
+    """チャンクを順に送信しながら集め、最後まで出力できたら表をキャッシュする"""
+    rendered = []
+    for chunk in chunks:
+        rendered.append(chunk)
+        yield chunk
+    with _dose_chart_cache_lock:
+        _dose_chart_cache[cache_key] = (drug_info, rendered)
+        while len(_dose_chart_cache) > DOSE_CHART_CACHE_MAX_ENTRIES:
+            _dose_chart_cache.popitem(last=False)
+
+@bp.route('/dose_chart')
+@conditional_on_catalog
+def dose_chart_api():
+    """薬ごとの用量早見表を JSON または CSV で返す。
+
+    パラメータ: drug_name, weight_min, weight_max, weight_step (kg), age_min, age_max (歳), format (json/csv)
+    """
+    drug_name = request.args.get('drug_name', '').strip()
+    output_format = request.args.get('format', 'json').lower()
+    if output_format not in ('json', 'csv'):
+        return jsonify({"error": "format には json または csv を指定してください。"}), 400
+    try:
+        weight_min = float(request.args.get('weight_min', '3'))
+        weight_max = float(request.args.get('weight_max', '40'))
+        weight_step = float(request.args.get('weight_step', '0.5'))
+        age_min = int(request.args.get('age_min', '0'))
+        age_max = int(request.args.get('age_max', '15'))
+    except ValueError:
+        return jsonify({"error": "体重・年齢の範囲は数値で指定してください。"}), 400
+    # nan・inf は float() を通ってしまうので、有限の数値だけを受け付ける
+    if not all(math.isfinite(value) for value in (weight_min, weight_max, weight_step)):
+        return jsonify({"error": "体重・年齢の範囲は数値で指定してください。"}), 400
+    if weight_min <= 0 or weight_max < weight_min or weight_step <= 0 or age_min < 0 or age_max < age_min:
+        return jsonify({"error": "体重・年齢の範囲が正しくありません。"}), 400
+
+    # 刻みがごく小さいと割り算があふれて inf になるので、その場合も表が大きすぎるとして扱う
+    weight_span = (weight_max - weight_min) / weight_step
+    weight_count = int(weight_span + 1e-9) + 1 if math.isfinite(weight_span) else math.inf
+    age_count = age_max - age_min + 1
+    if weight_count * age_count > DOSE_CHART_MAX_CELLS:
+        return jsonify({"error": f"表が大きすぎます (最大 {DOSE_CHART_MAX_CELLS} セル)。範囲または刻みを調整してください。"}), 400
+
+    drug_info = catalog_cache.get_by_name(drug_name)
+    if not drug_info:
+        return jsonify({"error": "薬の情報が見つかりません。"}), 404
+
+    if output_format == 'csv':
+        mimetype = 'text/csv'
+        headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(drug_name)}_dose_chart.csv"}
+    else:
+        mimetype = 'application/json'
+        headers = {}
+
+    cache_key = (drug_name, weight_min, weight_max, weight_step, age_min, age_max, output_format)
+    with _dose_chart_cache_lock:
+        cached = _dose_chart_cache.get(cache_key)
+        # 薬の行が更新されるとキャッシュ上の行オブジェクトが入れ替わるので、同一の行から作った表だけを使う
+        if cached is not None and cached[0] is drug_info:
+            _dose_chart_cache.move_to_end(cache_key)
+            DOSE_CHART_CACHE_LOOKUPS.inc(1, 'hit')
+            return Response(cached[1], mimetype=mimetype, headers=headers)
+    DOSE_CHART_CACHE_LOOKUPS.inc(1, 'miss')
+
+    weights = [round(weight_min + i * weight_step, 6) for i in range(weight_count)]
+    ages_years = list(range(age_min, age_max + 1))
+    chart, error = build_dose_chart(drug_info, weights, ages_years)
+    if error:
+        return jsonify({"error": error}), 400
+
+    chunks = render_dose_chart_csv(chart) if output_format == 'csv' else render_dose_chart_json(chart)
+    return Response(stream_and_cache_dose_chart(cache_key, drug_info, chunks), mimetype=mimetype, headers=headers)
 
 # --- 薬の管理用API ---
-@app.route('/search_all_drug_data')
+@bp.route('/search_all_drug_data')
+@conditional_on_catalog
 def search_all_drug_data_api():
     search_term = request.args.get('q', '').strip()
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
-    
-    query_placeholder = '%s' if DATABASE_URL else '?'
-    
-    query = f"""
-        SELECT id, drug_name FROM drugs
-        WHERE drug_name ILIKE {query_placeholder} OR aliases ILIKE {query_placeholder}
-        ORDER BY drug_name
-    """
-    cursor.execute(query, (f'%{search_term}%', f'%{search_term}%'))
-    
-    results = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(row) for row in results])
+    return jsonify(drug_search.search_drugs(search_term))
+
+def public_drug_fields(row):
+    """薬の行から内部用のカラムを除いた dict を返す"""
+    return {column: value for column, value in dict(row).items() if column not in INTERNAL_DRUG_COLUMNS}
 
-@app.route('/drugs/<int:drug_id>')
+@bp.route('/drugs/<int:drug_id>')
+@conditional_on_catalog
 def get_drug_by_id(drug_id):
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
-    
-    query_placeholder = '%s' if DATABASE_URL else '?'
-    cursor.execute(f"SELECT * FROM drugs WHERE id = {query_placeholder}", (drug_id,))
-    
-    drug = cursor.fetchone()
-    conn.close()
+    drug = catalog_cache.get_by_id(drug_id)
 
     if drug:
-        drug_dict = dict(drug)
+        drug_dict = public_drug_fields(drug)
         if drug_dict['dose_age_specific']:
             try:
                 drug_dict['dose_age_specific'] = json.loads(drug_dict['dose_age_specific'])
@@ -382,16 +487,29 @@ def get_drug_by_id(drug_id):
         return jsonify(drug_dict)
     return jsonify({"error": "Drug not found"}), 404
 
-@app.route('/drugs', methods=['POST'])
+@bp.route('/drugs/changes')
+@conditional_on_catalog
+def drug_changes_api():
+    """カタログのバージョン since 以降に変更・削除された薬を返す (デスクトップ版の差分同期用)。
+
+    レスポンス: {"version": 現在のバージョン, "reset": 全件かどうか, "drugs": [行, ...], "deleted": [id, ...]}
+    次回は since に version を指定する。since が 0 (省略) の場合は全件を返す。
+    """
+    try:
+        since = int(request.args.get('since', '0'))
+    except ValueError:
+        return jsonify({"error": "since はカタログのバージョン (整数) で指定してください。"}), 400
+    with database.connection() as conn:
+        changes = drug_cache.read_changes(database.cursor(conn), since)
+    changes['drugs'] = [public_drug_fields(row) for row in changes['drugs']]
+    return jsonify(changes)
+
+@bp.route('/drugs', methods=['POST'])
 def add_drug():
     data = request.get_json()
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
 
     drug_name = data.get('drug_name')
     if not drug_name:
-        conn.close()
         return jsonify({"error": "薬の品名は必須です。"}), 400
 
     try:
@@ -403,61 +521,60 @@ def add_drug():
             'daily_frequency', 'notes', 'usage_type', 'timing_options', 'formulation_type',
             'calculated_dose_unit',
             # 'max_daily_dose_per_kg', -- ★★★ この行を削除またはコメントアウト ★★★
-            'max_daily_fixed_dose' 
+            'max_daily_fixed_dose',
+            'drug_name_key', 'aliases_key'
         ]
         insert_placeholders = ', '.join(['%s'] * len(insert_columns)) if DATABASE_URL else ', '.join(['?'] * len(insert_columns))
         
         insert_query = f"INSERT INTO drugs ({', '.join(insert_columns)}) VALUES ({insert_placeholders})"
 
-        cursor.execute(insert_query, (
-            drug_name,
-            data.get('aliases'),
-            data.get('type'),
-            data.get('dosage_unit'),
-            data.get('dose_per_kg'), 
-            data.get('min_age_months'),
-            data.get('max_age_months'),
-            json.dumps(data.get('dose_age_specific')) if data.get('dose_age_specific') else None, 
-            data.get('fixed_dose'), 
-            data.get('daily_dose_per_kg'), 
-            data.get('daily_fixed_dose'), 
-            json.dumps(data.get('daily_dose_age_specific')) if data.get('daily_dose_age_specific') else None, 
-            data.get('daily_frequency'),
-            data.get('notes'),
-            data.get('usage_type', '内服'),
-            data.get('timing_options'),
-            data.get('formulation_type'),
-            data.get('calculated_dose_unit'),
-            # data.get('max_daily_dose_per_kg'), -- ★★★ この行を削除またはコメントアウト ★★★
-            data.get('max_daily_fixed_dose') 
-        ))
-        conn.commit()
-        conn.close()
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            cursor.execute(insert_query, (
+                drug_name,
+                data.get('aliases'),
+                data.get('type'),
+                data.get('dosage_unit'),
+                data.get('dose_per_kg'), 
+                data.get('min_age_months'),
+                data.get('max_age_months'),
+                json.dumps(data.get('dose_age_specific')) if data.get('dose_age_specific') else None, 
+                data.get('fixed_dose'), 
+                data.get('daily_dose_per_kg'), 
+                data.get('daily_fixed_dose'), 
+                json.dumps(data.get('daily_dose_age_specific')) if data.get('daily_dose_age_specific') else None, 
+                data.get('daily_frequency'),
+                data.get('notes'),
+                data.get('usage_type', '内服'),
+                data.get('timing_options'),
+                data.get('formulation_type'),
+                data.get('calculated_dose_unit'),
+                # data.get('max_daily_dose_per_kg'), -- ★★★ この行を削除またはコメントアウト ★★★
+                data.get('max_daily_fixed_dose') 
+            ) + drug_search.search_key_values(drug_name, data.get('aliases')))
+            new_version = drug_cache.bump_version(cursor)
+            conn.commit()
+            catalog_cache.refresh(conn, new_version, drug_name=drug_name)
         return jsonify({"message": f"'{drug_name}' を追加しました。", "id": cursor.lastrowid}), 201
-    except (sqlite3.IntegrityError, psycopg2.IntegrityError) as e: 
-        conn.close()
+    except database.IntegrityError as e: 
         if "duplicate key value violates unique constraint" in str(e):
              return jsonify({"error": f"'{drug_name}' は既に存在します。"}), 409
         else:
              return jsonify({"error": f"データベースエラーが発生しました: {str(e)}"}), 500
     except Exception as e:
-        conn.close()
         return jsonify({"error": f"薬の追加中にエラーが発生しました: {str(e)}"}), 500
 
 # ★★★ 修正後の update_drug 関数 ★★★
-@app.route('/drugs/<int:drug_id>', methods=['PUT'])
+@bp.route('/drugs/<int:drug_id>', methods=['PUT'])
 def update_drug(drug_id):
     data = request.get_json()
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
 
     drug_name = data.get('drug_name')
     if not drug_name:
-        conn.close()
         return jsonify({"error": "薬の品名は必須です。"}), 400
 
     try:
+        # 管理画面で編集した薬は row_hash を消して、差分同期 (--sync) で上書き・削除されないようにする
         update_set_clause = '''
             drug_name = %s, aliases = %s, type = %s, dosage_unit = %s,
             single_dose_per_kg = %s, single_fixed_dose = %s, single_dose_age_specific = %s, 
@@ -465,7 +582,9 @@ def update_drug(drug_id):
             min_age_months = %s, max_age_months = %s,
             daily_frequency = %s, notes = %s,
             usage_type = %s, timing_options = %s, formulation_type = %s, calculated_dose_unit = %s,
-            max_daily_fixed_dose = %s, max_daily_times = %s 
+            max_daily_fixed_dose = %s, max_daily_times = %s,
+            drug_name_key = %s, aliases_key = %s,
+            row_hash = NULL
         '''
         if not DATABASE_URL: # SQLiteの場合
             update_set_clause = update_set_clause.replace('%s', '?')
@@ -491,52 +610,196 @@ def update_drug(drug_id):
             data.get('calculated_dose_unit'),
             data.get('max_daily_fixed_dose'),
             data.get('max_daily_times') 
-        )
+        ) + drug_search.search_key_values(drug_name, data.get('aliases'))
         
-        where_placeholder = '%s' if DATABASE_URL else '?'
-
-        cursor.execute(f'''
-            UPDATE drugs SET
-                {update_set_clause}
-            WHERE id = {where_placeholder}
-        ''', values + (drug_id,)) 
-
-        conn.commit()
+        where_placeholder = database.PARAM
+
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            cursor.execute(f'''
+                UPDATE drugs SET
+                    {update_set_clause}
+                WHERE id = {where_placeholder}
+            ''', values + (drug_id,)) 
+            updated_count = cursor.rowcount
+
+            if updated_count > 0:
+                new_version = drug_cache.bump_version(cursor)
+                conn.commit()
+                catalog_cache.refresh(conn, new_version, drug_id=drug_id)
         
-        if cursor.rowcount == 0:
-            conn.close()
+        if updated_count == 0:
             return jsonify({"error": "更新する薬が見つかりませんでした。"}), 404
         
-        conn.close()
         return jsonify({"message": f"'{drug_name}' を更新しました。"}), 200
-    except (sqlite3.IntegrityError, psycopg2.IntegrityError) as e: 
-        conn.close()
+    except database.IntegrityError as e: 
         if "duplicate key value violates unique constraint" in str(e):
              return jsonify({"error": f"'{drug_name}' という薬名が既に存在します。"}), 409
         else:
              return jsonify({"error": f"データベースエラーが発生しました: {str(e)}"}), 500
     except Exception as e:
-        conn.close()
         return jsonify({"error": f"薬の更新中にエラーが発生しました: {str(e)}"}), 500
 
-@app.route('/drugs/<int:drug_id>', methods=['DELETE'])
+@bp.route('/drugs/<int:drug_id>', methods=['DELETE'])
 def delete_drug(drug_id):
-    conn_obj, cursor_factory_class = get_db_connection()
-    conn = conn_obj
-    cursor = conn.cursor(cursor_factory=cursor_factory_class) if DATABASE_URL else conn.cursor()
     try:
-        query_placeholder = '%s' if DATABASE_URL else '?'
-        cursor.execute(f"DELETE FROM drugs WHERE id = {query_placeholder}", (drug_id,))
-        conn.commit()
-        if cursor.rowcount == 0:
-            conn.close()
+        query_placeholder = database.PARAM
+        with database.connection() as conn:
+            cursor = database.cursor(conn)
+            cursor.execute(f"DELETE FROM drugs WHERE id = {query_placeholder}", (drug_id,))
+            deleted_count = cursor.rowcount
+            if deleted_count > 0:
+                new_version = drug_cache.bump_version(cursor)
+                conn.commit()
+                catalog_cache.refresh(conn, new_version, drug_id=drug_id)
+        if deleted_count == 0:
             return jsonify({"error": "削除する薬が見つかりませんでした。"}), 404
-        conn.close()
         return jsonify({"message": "薬を削除しました。"}), 200
     except Exception as e:
-        conn.close()
         return jsonify({"error": f"薬の削除中にエラーが発生しました: {str(e)}"}), 500
 
+@bp.route('/admin/db_pool')
+@admin_only
+def db_pool_stats_api():
+    # プールサイズ調整用の統計 (接続数・待ち時間など)
+    return jsonify(database.pool_stats())
+
+@bp.route('/admin/catalog_cache')
+@admin_only
+def catalog_cache_stats_api():
+    return jsonify(catalog_cache.stats())
+
+@bp.route('/admin/query_stats')
+@admin_only
+def query_stats_api():
+    # SQL の形ごとの実行回数・時間 (合計の長い順) と、直近の遅いクエリと実行計画 (このワーカーの分)
+    try:
+        limit = int(request.args.get('limit', '50'))
+    except ValueError:
+        return jsonify({"error": "limit には整数を指定してください。"}), 400
+    return jsonify(query_stats.query_stats.snapshot(limit))
+
+@bp.route('/admin/query_stats', methods=['DELETE'])
+@admin_only
+def reset_query_stats_api():
+    query_stats.query_stats.reset()
+    return jsonify({"message": "SQL の集計をリセットしました。"})
+
+@bp.route('/admin/profiles')
+def profiles_api():
+    # プロファイルが無効な場合と、トークンが正しくない場合はエンドポイントがないものとして扱う
+    if not profiler.PROFILING_ENABLED or not profiler.authorized(request):
+        abort(404)
+    return jsonify(profiler.list_profiles())
+
+@bp.route('/admin/profiles/<name>')
+def profile_download_api(name):
+    if not profiler.PROFILING_ENABLED or not profiler.authorized(request):
+        abort(404)
+    path = profiler.profile_path(name)
+    if path is None:
+        abort(404)
+    # ?format=text で pstats の結果を累積時間の順に表示する
+    if request.args.get('format') == 'text' and name.endswith('.prof'):
+        return Response(profiler.summary_text(path), mimetype='text/plain')
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
+@bp.route('/metrics')
+def metrics_api():
+    # Prometheus 用。gunicorn の全ワーカーの計測値を合算して返す
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# --- /metrics に出力する、キャッシュと接続プールの状態 ---
+CATALOG_CACHE_LOOKUPS = metrics.Counter('drug_app_catalog_cache_lookups_total',
+                                        "薬カタログのキャッシュの参照数", ('result',))
+CATALOG_CACHE_ENTRIES = metrics.Gauge('drug_app_catalog_cache_entries',
+                                      "薬カタログのキャッシュに保持している薬の数", aggregate='max')
+CATALOG_VERSION = metrics.Gauge('drug_app_catalog_version', "ワーカーが読み込んだカタログのバージョン", aggregate='max')
+DB_POOL_CONNECTIONS = metrics.Gauge('drug_app_db_pool_connections', "接続プールの接続数", ('state',))
+DB_POOL_EVENTS = metrics.Counter('drug_app_db_pool_events_total', "接続プールのイベント数", ('event',))
+DB_POOL_WAIT_SECONDS = metrics.Counter('drug_app_db_pool_wait_seconds_total', "接続の取得を待った時間の合計 (秒)")
+
+DB_POOL_EVENT_KEYS = ('created', 'closed', 'recycled', 'healthcheck_failures', 'acquired', 'waits', 'timeouts')
+
+
+def collect_catalog_cache_metrics():
+    stats = catalog_cache.stats()
+    yield CATALOG_CACHE_LOOKUPS, ('hit',), stats['hits']
+    yield CATALOG_CACHE_LOOKUPS, ('miss',), stats['misses']
+    yield CATALOG_CACHE_ENTRIES, (), stats['entries']
+    if stats['version'] is not None:
+        yield CATALOG_VERSION, (), stats['version']
+
+
+def collect_db_pool_metrics():
+    stats = database.pool_stats()
+    for state in ('in_use', 'idle'):
+        if state in stats:  # SQLite のプールはスレッドごとの接続なので、貸出中・待機中の区別がない
+            yield DB_POOL_CONNECTIONS, (state,), stats[state]
+    for event in DB_POOL_EVENT_KEYS:
+        yield DB_POOL_EVENTS, (event,), stats[event]
+    yield DB_POOL_WAIT_SECONDS, (), stats['total_wait_ms'] / 1000
+
+
+metrics.register_collector(collect_catalog_cache_metrics)
+metrics.register_collector(collect_db_pool_metrics)
+
+def create_app():
+    """アプリケーションを作成する。
+
+    スキーマのバージョン確認 (マイグレーションは通常デプロイ時に migrations.py で適用済みで、
+    ここでは1回の SELECT で済む) と、テンプレート・カタログのウォームアップを行い、
+    コールドスタートの遅れを追えるように起動時間の内訳を表示する。
+    gunicorn を preload で起動した場合はマスタープロセスで1回だけ実行され、
+    読み込んだカタログはワーカーに fork で引き継がれる (DB 接続は gunicorn.conf.py で fork 前に閉じる)。
+    """
+    timings = [('モジュール読み込み', time.perf_counter() - _import_started_at)]
+
+    started_at = time.perf_counter()
+    app = Flask(__name__)
+    # PROFILING=1 の場合だけ、指定したリクエストをプロファイルする (最初に登録して処理全体を計測する)
+    profiler.init_app(app)
+    # リクエストの計測は圧縮の時間も含めるため、compression より先に登録する
+    metrics.init_app(app)
+    # 全ての SQL の実行時間を集計し、遅い SQL は実行計画と一緒に記録する
+    query_stats.init_app(app)
+    # JSON の変換を高速な実装に差し替え、大きなレスポンスは圧縮して送る
+    app.json = json_provider.FastJSONProvider(app)
+    compression.init_app(app)
+    app.register_blueprint(bp)
+    timings.append(('アプリ作成', time.perf_counter() - started_at))
+
+    started_at = time.perf_counter()
+    try:
+        applied = migrations.ensure_schema()
+        if applied:
+            print(f"マイグレーションを適用しました: {', '.join(map(str, applied))}")
+    except Exception as e:
+        print(f"データベースの初期化中にエラーが発生しました: {e}")
+    timings.append(('スキーマ確認', time.perf_counter() - started_at))
+
+    if STARTUP_WARMUP:
+        started_at = time.perf_counter()
+        for template_name in ('index.html', 'manage_drugs.html'):
+            app.jinja_env.get_template(template_name)
+        timings.append(('テンプレート', time.perf_counter() - started_at))
+
+        started_at = time.perf_counter()
+        try:
+            catalog_cache.all_rows()
+            drug_search.warm_up()
+        except Exception as e:
+            print(f"警告: カタログのウォームアップに失敗しました。最初のリクエストで読み込みます: {e}")
+        timings.append(('カタログ', time.perf_counter() - started_at))
+
+    total = sum(seconds for _, seconds in timings)
+    breakdown = ' / '.join(f"{label} {seconds * 1000:.1f} ms" for label, seconds in timings)
+    print(f"起動時間: {breakdown} (合計 {total * 1000:.1f} ms)")
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     is_production = os.environ.get('FLASK_ENV') == 'production' or 'RENDER' in os.environ 
     app.run(debug=not is_production)
\ No newline at end of file